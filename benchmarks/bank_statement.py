@@ -0,0 +1,67 @@
+"""Time the import of a synthetic bank statement
+
+Run from the repository root:
+
+    python benchmarks/bank_statement.py [number of transactions] [number of contracts]
+
+Works on a fresh test database, the configured one is not touched.
+"""
+import os
+import random
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dkverwaltung.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from dkapp.models import Contact, Contract  # noqa: E402
+from dkapp.operations.bank_statement import import_statement  # noqa: E402
+
+
+def make_contracts(count):
+    Contact.objects.bulk_create(
+        Contact(id=contact_id, last_name=f'Muster{contact_id}', iban=f'DE{contact_id:020d}')
+        for contact_id in range(1, count + 1)
+    )
+    Contract.objects.bulk_create(
+        Contract(id=contract_id, number=1000 + contract_id, contact_id=contract_id)
+        for contract_id in range(1, count + 1)
+    )
+
+
+def make_statement(transactions, contracts):
+    rng = random.Random(1)
+    lines = ['Buchungstag;Name Zahlungsbeteiligter;IBAN Zahlungsbeteiligter;Verwendungszweck;Betrag']
+    for _ in range(transactions):
+        contract_id = rng.randint(1, contracts)
+        day = f'{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.2024'
+        amount = f'{rng.randint(-5000, 50000)},{rng.randint(0, 99):02d}'
+        reference = f'Direktkredit {1000 + contract_id}' if rng.random() < 0.7 else 'Einzahlung'
+        lines.append(f'{day};Muster{contract_id};DE{contract_id:020d};{reference};{amount}')
+    return '\n'.join(lines).encode()
+
+
+def main(transactions, contracts):
+    connection.creation.create_test_db(verbosity=0)
+    make_contracts(contracts)
+    statement = make_statement(transactions, contracts)
+
+    for run in ['first import', 'same statement again']:
+        start = time.perf_counter()
+        result = import_statement(BytesIO(statement), outgoing=True)
+        seconds = time.perf_counter() - start
+        print(f"{run}: {transactions} transactions in {seconds:.2f}s, "
+              f"{result.booked} booked, {result.duplicates} duplicates, {len(result.unmatched)} unmatched")
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+    )
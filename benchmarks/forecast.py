@@ -0,0 +1,76 @@
+"""Time CashFlowForecast for many synthetic contracts
+
+Run from the repository root:
+
+    python benchmarks/forecast.py [number of contracts] [years]
+
+The contracts are not saved, so only the forecast itself is measured.
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dkverwaltung.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from dkapp.models import Contract, ContractVersion, VersionTimeline  # noqa: E402
+from dkapp.operations.forecast import Booking, CashFlowForecast  # noqa: E402
+
+
+def make_contracts(count):
+    rng = random.Random(1)
+    contracts = []
+    bookings = {}
+    for contract_id in range(1, count + 1):
+        contract = Contract(id=contract_id, number=contract_id, category=rng.choice(Contract.Category.values))
+        start = date(2010, 1, 1) + timedelta(days=rng.randint(0, 5000))
+        versions = [ContractVersion(
+            id=2 * contract_id,
+            start=start,
+            duration_years=rng.randint(1, 25),
+            interest_rate=Decimal(rng.randint(0, 200)) / 10000,
+            version=1,
+        )]
+        if rng.random() < 0.3:
+            versions.append(ContractVersion(
+                id=2 * contract_id + 1,
+                start=start + timedelta(days=rng.randint(365, 2000)),
+                duration_years=rng.randint(1, 20),
+                interest_rate=Decimal(rng.randint(0, 200)) / 10000,
+                version=2,
+            ))
+        contract.timeline = VersionTimeline(versions)
+        contracts.append(contract)
+
+        contract_bookings = [Booking(start, Decimal(rng.randint(1000, 50000)))]
+        for _ in range(rng.randint(0, 6)):
+            contract_bookings.append(Booking(
+                start + timedelta(days=rng.randint(1, 5000)),
+                Decimal(rng.randint(-50000, 50000)) / 100,
+            ))
+        bookings[contract_id] = sorted(contract_bookings)
+    return contracts, bookings
+
+
+def main(count, years):
+    contracts, bookings = make_contracts(count)
+    start = time.perf_counter()
+    forecast = CashFlowForecast(contracts, bookings, start=date(2026, 1, 1), years=years)
+    seconds = time.perf_counter() - start
+
+    print(f"{count} contracts, {years} years: {seconds:.3f}s")
+    for year in forecast.years:
+        print(f"{year.month.year}: repayments {year.repayments_sum:>14}, interest {year.interest_sum:>12}")
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
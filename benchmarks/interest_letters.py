@@ -0,0 +1,90 @@
+"""Compare serial and parallel layout of interest letters and the canvas renderer
+
+Run from the repository root:
+
+    python benchmarks/interest_letters.py [workers]
+
+Uses the template files of dkapp/static/custom and unsaved contracts, so no
+database is needed.
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dkverwaltung.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+from pypdf import PdfReader  # noqa: E402
+
+from dkapp.models import Contact, Contract  # noqa: E402
+from dkapp.operations.interest import InterestDataRow  # noqa: E402
+from dkapp.operations.pdf.interest_letters import (  # noqa: E402
+    CanvasInterestLettersGenerator,
+    InterestLettersGenerator,
+)
+from dkapp.operations.reports import InterestPerContract  # noqa: E402
+
+CUSTOM_TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dkapp', 'static', 'custom')
+
+
+def make_report(count):
+    letters = []
+    for number in range(1, count + 1):
+        contact = Contact(first_name='Erika', last_name=f'Muster{number}', address='Musterweg 1, 12345 Musterstadt')
+        contract = Contract(number=number, contact=contact)
+        contract.current_balance = Decimal('1000.00')
+        rows = [
+            InterestDataRow(date(2020, 1, 1), 'Saldo', Decimal('1000'), Decimal('0.01'), 360, Decimal(1), Decimal('10.00')),
+            InterestDataRow(date(2020, 7, 1), 'Einzahlung', Decimal('500'), Decimal('0.01'), 180, Decimal('0.5'), Decimal('2.50')),
+        ]
+        letters.append(InterestPerContract(contract=contract, contact=contact, interest=Decimal('12.50'), interest_rows=rows))
+    return SimpleNamespace(per_contract_data=letters)
+
+
+def main(workers):
+    static_root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(static_root, 'custom'))
+    for name in ['logo.png', 'image.png', 'text_snippets.yml']:
+        shutil.copy(os.path.join(CUSTOM_TEMPLATES, f'{name}_template'), os.path.join(static_root, 'custom', name))
+
+    print(f"{os.cpu_count()} cpus, {workers} workers")
+    with override_settings(STATIC_ROOT=static_root):
+        for count in [100, 500, 1000]:
+            report = make_report(count)
+            start = time.perf_counter()
+            serial = InterestLettersGenerator(report, 2020, '01.01.2021').buffer.read()
+            serial_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parallel = InterestLettersGenerator(report, 2020, '01.01.2021', workers=workers).buffer.read()
+            parallel_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            canvas = CanvasInterestLettersGenerator(report, 2020, '01.01.2021').buffer.read()
+            canvas_seconds = time.perf_counter() - start
+
+            serial_pages = len(PdfReader(io.BytesIO(serial)).pages)
+            parallel_pages = len(PdfReader(io.BytesIO(parallel)).pages)
+            canvas_pages = len(PdfReader(io.BytesIO(canvas)).pages)
+            assert serial_pages == parallel_pages == canvas_pages, (serial_pages, parallel_pages, canvas_pages)
+            print(
+                f"{count:5} letters, {serial_pages} pages: serial {serial_seconds:7.2f}s, "
+                f"parallel {parallel_seconds:7.2f}s ({serial_seconds / parallel_seconds:.1f}x), "
+                f"canvas {canvas_seconds:7.2f}s ({serial_seconds / canvas_seconds:.1f}x), "
+                f"{len(serial) // 1024} kB / {len(parallel) // 1024} kB / {len(canvas) // 1024} kB"
+            )
+    shutil.rmtree(static_root)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1)
@@ -0,0 +1,64 @@
+"""Compare the per-row 30/360 interest loop with dkapp.operations.interest_vec
+
+Run from the repository root:
+
+    python benchmarks/interest_vec.py [number of bookings]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dkverwaltung.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from dkapp.operations import interest_vec  # noqa: E402
+from dkapp.operations.interest import days360_eu  # noqa: E402
+
+
+def per_row(dates, amounts, interest_rates, year):
+    end_date = date(year, 12, 31)
+    result = []
+    for booking_date, amount, interest_rate in zip(dates, amounts, interest_rates):
+        days_left = days360_eu(booking_date, end_date)
+        result.append(round(amount * Decimal(days_left/360) * interest_rate, 2))
+    return result
+
+
+def main(count):
+    rng = random.Random(1)
+    year = 2020
+    dates = [date(year, 1, 1) + timedelta(days=rng.randint(0, 365)) for _ in range(count)]
+    amounts = [Decimal(rng.randint(-10**7, 10**7)) / 100 for _ in range(count)]
+    interest_rates = [Decimal(rng.randint(0, 300)) / 10000 for _ in range(count)]
+
+    start = time.perf_counter()
+    expected = per_row(dates, amounts, interest_rates, year)
+    per_row_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns = (
+        interest_vec.split_dates(dates),
+        interest_vec.to_cents(amounts),
+        interest_vec.to_rate_e4(interest_rates),
+    )
+    conversion_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cents = interest_vec.year_interest_cents(*columns, year)
+    kernel_seconds = time.perf_counter() - start
+
+    assert cents.tolist() == [int(value * 100) for value in expected]
+    print(f"{count} bookings, identical cents")
+    print(f"per-row loop:           {per_row_seconds:8.3f}s")
+    print(f"column conversion:      {conversion_seconds:8.3f}s")
+    print(f"vectorized kernel:      {kernel_seconds:8.3f}s ({per_row_seconds / kernel_seconds:.0f}x)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
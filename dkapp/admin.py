@@ -1,8 +1,38 @@
 from django.contrib import admin
 
-from .models import Contact, Contract, ContractVersion, AccountingEntry
+from .models import Contact, Contract, ContractVersion, AccountingEntry, Job, SyncWatermark
+from .templatetags.my_filters import euro, fraction
+
+
+@admin.register(Contract)
+class ContractAdmin(admin.ModelAdmin):
+    list_display = ('number', 'contact', 'category', 'balance', 'start', 'interest_rate', 'expiring')
+    list_filter = ('category',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_summary()
+
+    @admin.display(description='Kontostand', ordering='current_balance')
+    def balance(self, contract):
+        return euro(contract.current_balance)
+
+    @admin.display(description='Start', ordering='last_version_start')
+    def start(self, contract):
+        return contract.last_version_start
+
+    @admin.display(description='Zinssatz', ordering='last_version_interest_rate')
+    def interest_rate(self, contract):
+        if contract.last_version_interest_rate is None:
+            return None
+        return fraction(contract.last_version_interest_rate)
+
+    @admin.display(description='Ablaufdatum')
+    def expiring(self, contract):
+        return contract.expiring
+
 
 admin.site.register(Contact)
-admin.site.register(Contract)
 admin.site.register(ContractVersion)
 admin.site.register(AccountingEntry)
+admin.site.register(Job)
+admin.site.register(SyncWatermark)
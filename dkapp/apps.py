@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DkappConfig(AppConfig):
     name = 'dkapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -1,5 +1,32 @@
 from django import forms
+from django.urls import reverse
+
 from .models import Contact, Contract, ContractVersion, AccountingEntry
+from .operations import search
+
+
+class AutocompleteWidget(forms.Widget):
+    """Text field searching contacts or contracts while typing, instead of a select with all of them
+
+    The id of the chosen entry is sent in a hidden input, see static/js/autocomplete.js.
+    """
+    template_name = 'widgets/autocomplete.html'
+
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        try:
+            chosen = search.labels(self.kind, [int(value)]) if value not in (None, '') else []
+        except (TypeError, ValueError):
+            chosen = []
+        context['widget'].update({
+            'label': chosen[0][1] if chosen else '',
+            'url': f"{reverse('dkapp:autocomplete')}?kind={self.kind}",
+        })
+        return context
 
 
 class ContactForm(forms.ModelForm):
@@ -48,6 +75,7 @@ class ContractForm(forms.ModelForm):
         exclude = ['updated_at', 'created_at']
         widgets = {
             'number': forms.NumberInput(),
+            'contact': AutocompleteWidget('contact'),
             'comment': forms.Textarea(),
         }
         labels = {
@@ -109,6 +137,7 @@ class ContractVersionForm(forms.ModelForm):
         exclude = ['updated_at', 'created_at', 'interest_rate']
         widgets = {
             'start': forms.DateInput(format='%d.%m.%Y'),
+            'contract': AutocompleteWidget('contract'),
             'duration_months': forms.NumberInput(),
             'duration_years': forms.NumberInput(),
         }
@@ -124,8 +153,9 @@ class ContractVersionForm(forms.ModelForm):
 
         super(ContractVersionForm, self).__init__(*args, **kwargs)
         self.fields['start'].widget.attrs['placeholder'] = "DD.MM.YYYY"
-        self.fields['contract'].initial = contract
-        self.fields['version'].initial = contract.last_version.version + 1
+        if contract:
+            self.fields['contract'].initial = contract
+            self.fields['version'].initial = contract.last_version.version + 1
         if self.instance and self.instance.id:
             self.fields['interest_rate_percent'].initial = self.instance.interest_rate * 100
 
@@ -141,6 +171,7 @@ class AccountingEntryForm(forms.ModelForm):
         model = AccountingEntry
         exclude = ['updated_at', 'created_at']
         widgets = {
+            'contract': AutocompleteWidget('contract'),
             'date': forms.DateInput(format='%d.%m.%Y'),
             'amount': forms.NumberInput(),
         }
@@ -156,3 +187,17 @@ class AccountingEntryForm(forms.ModelForm):
         super(AccountingEntryForm, self).__init__(*args, **kwargs)
         self.fields['date'].widget.attrs['placeholder'] = "DD.MM.YYYY"
         self.fields['contract'].initial = contract
+
+
+class BankStatementForm(forms.Form):
+    statement = forms.FileField(label='Kontoauszug (CSV oder CAMT.053)')
+    format = forms.ChoiceField(
+        label='Format',
+        choices=[('', 'automatisch erkennen'), ('csv', 'CSV'), ('camt', 'CAMT.053')],
+        required=False,
+    )
+    outgoing = forms.BooleanField(
+        label='Auszahlungen als Rückzahlungen buchen',
+        help_text='Sonst bleiben ausgehende Überweisungen, z.B. ausgezahlte Zinsen, unzugeordnet.',
+        required=False,
+    )
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dkapp.operations.bank_statement import FORMATS, BankStatementError, import_statement
+
+
+class Command(BaseCommand):
+    help = 'Book the transactions of a bank statement (CSV or CAMT.053) that match a contract'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='path to the bank statement')
+        parser.add_argument('--format', choices=FORMATS, help='format of the file (default: detected)')
+        parser.add_argument('--encoding', default='utf-8-sig', help='encoding of CSV files (default: utf-8-sig)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='number of transactions matched and inserted at once (default: 1000)',
+        )
+        parser.add_argument(
+            '--outgoing',
+            action='store_true',
+            help='also book outgoing payments as withdrawals (default: leave them unmatched)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as statement:
+                result = import_statement(
+                    statement,
+                    format=options['format'],
+                    encoding=options['encoding'],
+                    batch_size=options['batch_size'],
+                    outgoing=options['outgoing'],
+                )
+        except (BankStatementError, UnicodeDecodeError, LookupError) as error:
+            raise CommandError(f'Nothing imported: {error}')
+
+        for transaction in result.unmatched:
+            self.stdout.write(
+                f'unmatched: {transaction.date} {transaction.amount} {transaction.iban} '
+                f'{transaction.name} {transaction.reference}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Booked {result.booked} of {result.total} transactions, '
+            f'{result.duplicates} already imported, {len(result.unmatched)} unmatched'
+        ))
@@ -1,11 +1,21 @@
 import sqlite3
-import pytz
 
-from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime, parse_date
-from django.core.management.base import BaseCommand, CommandError
-from dkapp.models import Contact, Contract, ContractVersion, AccountingEntry
+from dkapp.models import (
+    Contact,
+    Contract,
+    ContractVersion,
+    AccountingEntry,
+    BalanceCheckpoint,
+    DataGeneration,
+    InterestResult,
+    SyncWatermark,
+)
+from dkapp.operations import search
 
 
 def dict_factory(cursor, row):
@@ -16,85 +26,244 @@ def dict_factory(cursor, row):
 
 
 class Command(BaseCommand):
+    """Import contacts, contracts, versions and bookings of the Rails app
+
+    Everything happens in one transaction. Without --incremental the old
+    data is deleted with plain DELETE statements first, then the rows are
+    read in batches and inserted with bulk_create, which keeps the ids of the
+    Rails app. With --incremental only rows changed since the last import
+    (see SyncWatermark) are read and upserted by `rails_id`, so it needs a
+    full import first; new rows get ids of their own, as the ids of the Rails
+    app may be taken by rows created here meanwhile. Imported rows that no
+    longer exist in the Rails app are deleted, rows created here are kept. Foreign keys are looked up by the
+    ids of the Rails app. Bulk inserts don't send signals, so the balance
+    checkpoints of the touched contracts and the search index are rebuilt at
+    the end.
+    """
     help = 'Import sqlite3 file'
 
-    def import_contacts(self):
-        for row in self.c.execute('SELECT * FROM contacts'):
-            contact = Contact(
-                id=row['id'],
-                first_name=row['prename'],
-                last_name=row['name'],
-                address=row['address'],
-                iban=row['account_number'],
-                bic=row['bank_number'],
-                created_at=pytz.timezone(settings.TIME_ZONE).localize(parse_datetime(row['created_at'])),
-                updated_at=pytz.timezone(settings.TIME_ZONE).localize(parse_datetime(row['updated_at'])),
-                email=row['email'],
-                phone=row['phone'],
-                remark=row['remark'],
-                bank_name=row['bank_name'],
-            )
-            contact.save()
-
-    def import_contracts(self):
-        for row in self.c.execute('SELECT * FROM contracts'):
-            contact = Contract(
-                id=row['id'],
-                number=row['number'],
-                comment=row['comment'],
-                category=row['category'],
-                contact=Contact.objects.get(pk=row['contact_id']),
-                created_at=pytz.timezone(settings.TIME_ZONE).localize(parse_datetime(row['created_at'])),
-                updated_at=pytz.timezone(settings.TIME_ZONE).localize(parse_datetime(row['updated_at'])),
-            )
-            contact.save()
-
-
-    def import_contract_versions(self):
-        for row in self.c.execute('SELECT * FROM contract_versions'):
-            contact = ContractVersion(
-                id=row['id'],
-                start=parse_date(row['start']),
-                duration_months=row['duration_months'],
-                duration_years=row['duration_years'],
-                interest_rate=row['interest_rate'],
-                version=row['version'],
-                contract=Contract.objects.get(pk=row['contract_id']),
-                created_at=pytz.timezone(settings.TIME_ZONE).localize(parse_datetime(row['created_at'])),
-                updated_at=pytz.timezone(settings.TIME_ZONE).localize(parse_datetime(row['updated_at'])),
-            )
-            contact.save()
-
-    def import_accounting_entries(self):
-        for row in self.c.execute('SELECT * FROM accounting_entries'):
-            contact = AccountingEntry(
-                id=row['id'],
-                date=parse_date(row['date']),
-                amount=row['amount'],
-                contract=Contract.objects.get(pk=row['contract_id']),
-                created_at=pytz.timezone(settings.TIME_ZONE).localize(parse_datetime(row['created_at'])),
-                updated_at=pytz.timezone(settings.TIME_ZONE).localize(parse_datetime(row['updated_at'])),
-            )
-            contact.save()
+    def contact(self, row):
+        return Contact(
+            **self.ids(row),
+            first_name=row['prename'],
+            last_name=row['name'],
+            address=row['address'],
+            iban=row['account_number'],
+            bic=row['bank_number'],
+            created_at=self.datetime(row['created_at']),
+            updated_at=self.datetime(row['updated_at']),
+            email=row['email'],
+            phone=row['phone'],
+            remark=row['remark'],
+            bank_name=row['bank_name'],
+        )
+
+    def contract(self, row):
+        return Contract(
+            **self.ids(row),
+            number=row['number'],
+            comment=row['comment'],
+            category=row['category'],
+            contact_id=self.reference(Contact, 'contracts', row, 'contact_id'),
+            created_at=self.datetime(row['created_at']),
+            updated_at=self.datetime(row['updated_at']),
+        )
+
+    def contract_version(self, row):
+        return ContractVersion(
+            **self.ids(row),
+            start=parse_date(row['start']),
+            duration_months=row['duration_months'],
+            duration_years=row['duration_years'],
+            interest_rate=row['interest_rate'],
+            version=row['version'],
+            contract_id=self.reference(Contract, 'contract_versions', row, 'contract_id'),
+            created_at=self.datetime(row['created_at']),
+            updated_at=self.datetime(row['updated_at']),
+        )
+
+    def accounting_entry(self, row):
+        return AccountingEntry(
+            **self.ids(row),
+            date=parse_date(row['date']),
+            amount=row['amount'],
+            contract_id=self.reference(Contract, 'accounting_entries', row, 'contract_id'),
+            created_at=self.datetime(row['created_at']),
+            updated_at=self.datetime(row['updated_at']),
+        )
+
+    def ids(self, row):
+        # a full import keeps the ids, then there are no other rows
+        return {'id': None if self.incremental else row['id'], 'rails_id': row['id']}
+
+    def tables(self):
+        """(table of the Rails app, model, function making an instance of a row), parents first"""
+        return [
+            ('contacts', Contact, self.contact),
+            ('contracts', Contract, self.contract),
+            ('contract_versions', ContractVersion, self.contract_version),
+            ('accounting_entries', AccountingEntry, self.accounting_entry),
+        ]
+
+    def import_table(self, table, model, make):
+        watermark = SyncWatermark.objects.filter(table=table).first() if self.incremental else None
+        newest = watermark.updated_at if watermark else None
+        update_fields = [
+            field.name for field in model._meta.concrete_fields if not field.primary_key and field.name != 'rails_id'
+        ]
+        for rows in self.batches(table, since=newest):
+            objects = [make(row) for row in rows]
+            if self.incremental:
+                self.remember_contracts(model, objects)
+                model.objects.bulk_create(
+                    objects,
+                    update_conflicts=True,
+                    unique_fields=['rails_id'],
+                    update_fields=update_fields,
+                )
+            else:
+                model.objects.bulk_create(objects)
+            newest = max([newest or '', *(row['updated_at'] for row in rows)])
+            self.changes[table][0] += len(rows)
+        if newest:
+            SyncWatermark.objects.update_or_create(table=table, defaults={'updated_at': newest})
+
+    def delete_missing(self, table, model):
+        """Delete the imported rows that were deleted in the Rails app"""
+        source_ids = {row['id'] for row in self.db.execute(f'SELECT id FROM {table}')}
+        imported_ids = model.objects.filter(rails_id__isnull=False).values_list('rails_id', flat=True)
+        missing_ids = sorted(set(imported_ids) - source_ids)
+        for start in range(0, len(missing_ids), self.batch_size):
+            missing = model.objects.filter(rails_id__in=missing_ids[start:start + self.batch_size])
+            if model in (ContractVersion, AccountingEntry):
+                self.changed_contract_ids.update(missing.values_list('contract_id', flat=True))
+            missing.delete()
+        self.changes[table][1] += len(missing_ids)
+
+    def remember_contracts(self, model, objects):
+        # the balance of the old and the new contract of a changed booking changes
+        if model not in (ContractVersion, AccountingEntry):
+            return
+        self.changed_contract_ids.update(obj.contract_id for obj in objects)
+        self.changed_contract_ids.update(model.objects.filter(
+            rails_id__in=[obj.rails_id for obj in objects],
+        ).values_list('contract_id', flat=True))
+
+    def batches(self, table, since=None):
+        """Rows of table (changed since) in lists of at most batch_size, reporting the progress
+
+        Rows with the timestamp of the watermark are read again: rows written
+        later in the same second carry the same timestamp, and upserting the
+        others once more changes nothing.
+        """
+        condition, parameters = ('WHERE updated_at >= ?', [since]) if since else ('', [])
+        total = self.db.execute(f'SELECT COUNT(*) AS count FROM {table} {condition}', parameters).fetchone()['count']
+        cursor = self.db.execute(f'SELECT * FROM {table} {condition} ORDER BY id', parameters)
+        done = 0
+        self.show_progress(table, done, total)
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                break
+            yield rows
+            done += len(rows)
+            self.show_progress(table, done, total)
+        if self.verbosity >= 1:
+            self.stdout.write('')
+
+    def show_progress(self, table, done, total):
+        if self.verbosity < 1:
+            return
+        width = 30
+        filled = width * done // total if total else width
+        self.stdout.write(f'\r{table:<20} [{"#" * filled}{"." * (width - filled)}] {done}/{total}', ending='')
+        self.stdout.flush()
+
+    def datetime(self, value):
+        return timezone.make_aware(parse_datetime(value), self.timezone)
+
+    def reference(self, model, table, row, column):
+        """Id of the parent with the id of the Rails app in column"""
+        # parents are imported first, their ids are read once when needed
+        if model not in self.stored_ids:
+            self.stored_ids[model] = dict(model.objects.filter(rails_id__isnull=False).values_list('rails_id', 'id'))
+        if row[column] not in self.stored_ids[model]:
+            raise CommandError(f'{table} {row["id"]}: unknown {column} {row[column]}')
+        return self.stored_ids[model][row[column]]
 
     def import_from_sqlite(self, sqlite3_path):
-        db = sqlite3.connect(sqlite3_path)
-        db.row_factory = dict_factory
-        self.c = db.cursor()
+        self.db = sqlite3.connect(sqlite3_path)
+        self.db.row_factory = dict_factory
+        self.timezone = timezone.get_default_timezone()
+        self.stored_ids = {}
+        self.changed_contract_ids = set()
+        # table -> [upserted rows, deleted rows]
+        self.changes = {table: [0, 0] for table, model, make in self.tables()}
+
+        try:
+            for table, model, make in self.tables():
+                self.import_table(table, model, make)
+            if self.incremental:
+                for table, model, make in reversed(self.tables()):
+                    self.delete_missing(table, model)
+            self.check_counts()
+        finally:
+            self.db.close()
+
+    def check_counts(self):
+        for table, model, make in self.tables():
+            source_count = self.db.execute(f'SELECT COUNT(*) AS count FROM {table}').fetchone()['count']
+            count = model.objects.filter(rails_id__isnull=False).count()
+            if count != source_count:
+                raise CommandError(f'{table}: {source_count} rows in the Rails app, but {count} stored')
 
-        self.import_contacts()
-        self.import_contracts()
-        self.import_contract_versions()
-        self.import_accounting_entries()
-        db.close()
+    def reset_sequences(self):
+        # the ids are taken over, so the next id of new rows has to be moved past them
+        statements = connection.ops.sequence_reset_sql(no_style(), [Contact, Contract, ContractVersion, AccountingEntry])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
 
     def clear_all(self):
-        Contact.objects.all().delete()
+        # plain deletes instead of the cascade collector, dependent tables first
+        with connection.cursor() as cursor:
+            for model in [InterestResult, BalanceCheckpoint, AccountingEntry, ContractVersion, Contract, Contact, SyncWatermark]:
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
 
     def add_arguments(self, parser):
         parser.add_argument('path', type=str, help='path to the sqlite3 file to import')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='number of rows read and inserted at once (default: 1000)',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='only import rows changed since the last import and delete the ones deleted since',
+        )
 
     def handle(self, *args, **options):
-        self.clear_all()
-        self.import_from_sqlite(sqlite3_path=options['path'])
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        self.incremental = options['incremental']
+        if self.incremental and not SyncWatermark.objects.exists():
+            # rows of older imports may lack rails_id and would be imported twice
+            raise CommandError('No previous import found, run a full import without --incremental first')
+        with transaction.atomic():
+            if not self.incremental:
+                self.clear_all()
+            self.import_from_sqlite(sqlite3_path=options['path'])
+            self.reset_sequences()
+            if self.incremental:
+                BalanceCheckpoint.rebuild(self.changed_contract_ids)
+                InterestResult.objects.filter(contract_id__in=self.changed_contract_ids).delete()
+            else:
+                BalanceCheckpoint.rebuild()
+            search.rebuild()
+            DataGeneration.bump()
+        if self.incremental:
+            for table, (upserted, deleted) in self.changes.items():
+                self.stdout.write(f'{table}: {upserted} imported, {deleted} deleted')
         self.stdout.write(self.style.SUCCESS('Successfully imported'))
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from dkapp.operations import pdf_cache
+
+
+class Command(BaseCommand):
+    help = 'Render interest PDFs into the PDF cache and delete the least recently used ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--year',
+            type=int,
+            action='append',
+            help='year to render, can be given several times (default: only prune)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=pdf_cache.FORMATS,
+            action='append',
+            help='format to render, can be given several times (default: all)',
+        )
+        parser.add_argument(
+            '--max-bytes',
+            type=int,
+            help='size limit of the cache (default: settings.PDF_CACHE_MAX_BYTES)',
+        )
+
+    def handle(self, *args, **options):
+        today = datetime.now().strftime('%d.%m.%Y')
+        for year in options['year'] or []:
+            for format in options['format'] or pdf_cache.FORMATS:
+                path = pdf_cache.render_to_cache(format, year, today)
+                self.stdout.write(f'{year} {format}: {path}')
+
+        deleted, size = pdf_cache.prune(options['max_bytes'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} cached PDFs, {size // 1024} kB remain'
+        ))
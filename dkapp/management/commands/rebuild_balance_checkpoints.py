@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dkapp.models import BalanceCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the balance checkpoints from the accounting entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='only compare the checkpoints with the sums of the accounting entries',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_checkpoints()
+            return
+
+        with transaction.atomic():
+            BalanceCheckpoint.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully rebuilt {BalanceCheckpoint.objects.count()} balance checkpoints'
+        ))
+
+    def check_checkpoints(self):
+        inconsistencies = list(BalanceCheckpoint.inconsistencies())
+        for contract_id, date, expected, stored in inconsistencies:
+            self.stdout.write(f'contract {contract_id} on {date}: expected {expected}, stored {stored}')
+        if inconsistencies:
+            raise CommandError(
+                f'{len(inconsistencies)} inconsistent balance checkpoints, run rebuild_balance_checkpoints'
+            )
+        self.stdout.write(self.style.SUCCESS('All balance checkpoints are consistent'))
@@ -0,0 +1,71 @@
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from dkapp.models import Job
+from dkapp.operations.jobs import delete_old_jobs, run_job
+
+# seconds between deleting old jobs
+CLEANUP_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Execute queued jobs (e.g. PDF batches) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='exit when the queue is empty instead of waiting for new jobs',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2,
+            help='seconds to wait before looking for new jobs (default: 2)',
+        )
+        parser.add_argument(
+            '--stale-minutes',
+            type=int,
+            default=30,
+            help='requeue running jobs without heartbeat for this many minutes (default: 30)',
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=7,
+            help='delete finished jobs and their files after this many days (default: 7)',
+        )
+
+    def handle(self, *args, **options):
+        stale_age = timedelta(minutes=options['stale_minutes'])
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        last_cleanup = None
+        while True:
+            if last_cleanup is None or time.monotonic() - last_cleanup >= CLEANUP_INTERVAL:
+                last_cleanup = time.monotonic()
+                deleted_jobs, deleted_files = delete_old_jobs(timedelta(days=options['keep_days']))
+                if deleted_jobs or deleted_files:
+                    self.stdout.write(f'deleted {deleted_jobs} old jobs and {deleted_files} files')
+
+            requeued = Job.requeue_stale(stale_age)
+            if requeued:
+                self.stdout.write(f'requeued {requeued} stale jobs')
+
+            job = Job.claim(worker)
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            self.stdout.write(f'running {job}')
+            if not run_job(job):
+                self.stdout.write(self.style.WARNING(f'dropped {job}, it was requeued while running'))
+            elif job.status == Job.Status.DONE:
+                self.stdout.write(self.style.SUCCESS(f'finished {job}: {job.file_path}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'failed {job}:\n{job.error}'))
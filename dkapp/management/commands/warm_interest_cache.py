@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from dkapp.models import Contract
+from dkapp.operations import interest_cache
+
+
+class Command(BaseCommand):
+    help = 'Compute and store the yearly interest of all contracts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--year',
+            type=int,
+            action='append',
+            help='year to compute, can be given several times (default: current year)',
+        )
+
+    def handle(self, *args, **options):
+        years = options['year'] or [datetime.now().year]
+        contracts = Contract.objects.order_by('number')
+        for year in years:
+            results = interest_cache.year_interest(contracts, year)
+            self.stdout.write(f'{year}: {results.hits} stored, {results.misses} computed')
+        self.stdout.write(self.style.SUCCESS('Successfully warmed the interest cache'))
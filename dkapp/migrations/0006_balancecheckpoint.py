@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:58
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_checkpoints(apps, schema_editor):
+    AccountingEntry = apps.get_model('dkapp', 'AccountingEntry')
+    BalanceCheckpoint = apps.get_model('dkapp', 'BalanceCheckpoint')
+    daily_sums = AccountingEntry.objects.order_by('contract_id', 'date').values('contract_id', 'date').annotate(
+        models.Sum('amount'),
+    ).values_list('contract_id', 'date', 'amount__sum')
+
+    checkpoints = []
+    contract_id = None
+    balance = Decimal('0')
+    for entry_contract_id, entry_date, amount in daily_sums:
+        if entry_contract_id != contract_id:
+            contract_id = entry_contract_id
+            balance = Decimal('0')
+        balance += amount
+        checkpoints.append(BalanceCheckpoint(contract_id=contract_id, date=entry_date, balance=balance))
+    BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dkapp', '0005_auto_20200823_1215'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('contract', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dkapp.contract')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('contract', 'date'), name='unique_balance_checkpoint')],
+            },
+        ),
+        migrations.RunPython(build_checkpoints, migrations.RunPython.noop),
+    ]
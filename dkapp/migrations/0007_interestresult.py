@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dkapp', '0006_balancecheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InterestResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('interest', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('rows', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('contract', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dkapp.contract')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('contract', 'year'), name='unique_interest_result')],
+            },
+        ),
+    ]
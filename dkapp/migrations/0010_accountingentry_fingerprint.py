@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dkapp', '0009_syncwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountingentry',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dkapp', '0011_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accountingentry',
+            index=models.Index(fields=['date', 'id'], name='accounting_entry_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='contact_name_id'),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['number', 'id'], name='contract_number_id'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import OperationalError, migrations
+
+# kept here instead of imported from dkapp.operations.search, so later changes
+# there don't change what this migration does
+TABLE = 'dkapp_search'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(text, tokenize="unicode61 remove_diacritics 2")'
+        )
+    except OperationalError:
+        # SQLite built without FTS5, the search uses LIKE
+        return
+    # the texts of search.contact_text and search.contract_text
+    schema_editor.execute(f'''
+        INSERT INTO {TABLE} (rowid, text)
+        SELECT id * 2, first_name || ' ' || last_name || ' ' || address || ' ' || email || ' '
+            || iban || ' ' || replace(iban, ' ', '')
+        FROM dkapp_contact
+    ''')
+    schema_editor.execute(f'''
+        INSERT INTO {TABLE} (rowid, text)
+        SELECT contract.id * 2 + 1, contract.number || ' ' || contract.comment || ' '
+            || contact.first_name || ' ' || contact.last_name
+        FROM dkapp_contract contract JOIN dkapp_contact contact ON contact.id = contract.contact_id
+    ''')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dkapp', '0012_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
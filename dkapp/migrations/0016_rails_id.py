@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:55
+
+from django.db import migrations, models
+
+
+def mark_imported_rows(apps, schema_editor):
+    # so far import_from_rails_app kept the ids of the Rails app and counted
+    # every row as imported; rows created here can't be told apart, so all
+    # existing rows are marked. Without an earlier import of this version
+    # (no SyncWatermark) --incremental refuses to run, a full import comes first.
+    for name in ['Contact', 'Contract', 'ContractVersion', 'AccountingEntry']:
+        apps.get_model('dkapp', name).objects.update(rails_id=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dkapp', '0015_data_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountingentry',
+            name='rails_id',
+            field=models.IntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='rails_id',
+            field=models.IntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='contract',
+            name='rails_id',
+            field=models.IntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='contractversion',
+            name='rails_id',
+            field=models.IntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(mark_imported_rows, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,16 @@
 import logging
+import uuid
+from bisect import bisect_left, bisect_right
 from decimal import Decimal
 from typing import Optional
 from datetime import date
 from dateutil.relativedelta import relativedelta
 
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.db import models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -21,9 +26,16 @@ class Contact(models.Model):
     bic = models.CharField(max_length=200, blank=True)
     bank_name = models.CharField(max_length=200, blank=True)
     remark = models.CharField(max_length=200, blank=True)
+    # id of the row in the Rails app, None for rows created here (see import_from_rails_app)
+    rails_id = models.IntegerField(null=True, blank=True, unique=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_name', 'first_name', 'id'], name='contact_name_id'),
+        ]
+
     def __str__(self):
         return self.full_name
 
@@ -36,6 +48,71 @@ class Contact(models.Model):
         return f"{self.first_name} {self.last_name}"
 
 
+def expiring_date(start, duration_months, duration_years):
+    return start + relativedelta(months=duration_months or 0) + relativedelta(years=duration_years or 0)
+
+
+class VersionTimeline:
+    """Versions of one contract sorted by start, looked up by binary search"""
+
+    def __init__(self, versions):
+        self.versions = sorted(versions, key=lambda version: (version.start, version.id or 0))
+        self.starts = [version.start for version in self.versions]
+
+    @property
+    def first(self):
+        return self.versions[0] if self.versions else None
+
+    @property
+    def last(self):
+        return self.versions[-1] if self.versions else None
+
+    def at(self, reference_date: date):
+        """Version valid at reference_date, the first version before the contract starts"""
+        if not self.versions:
+            return None
+        index = bisect_right(self.starts, reference_date)
+        return self.versions[max(index - 1, 0)]
+
+    def started_by(self, reference_date: date):
+        """Version valid at reference_date, None before the contract starts"""
+        index = bisect_right(self.starts, reference_date)
+        return self.versions[index - 1] if index else None
+
+    def in_year(self, year: int):
+        start = bisect_left(self.starts, date(year, 1, 1))
+        end = bisect_left(self.starts, date(year + 1, 1, 1))
+        return self.versions[start:end]
+
+
+class ContractQuerySet(models.QuerySet):
+    def with_summary(self):
+        """Contracts with contact, current balance and the terms of the last version
+
+        Adds `current_balance` and `last_version_start`, `last_version_duration_months`,
+        `last_version_duration_years` and `last_version_interest_rate` as SQL
+        annotations, so list views need a constant number of queries.
+        """
+        balance = BalanceCheckpoint.objects.filter(
+            contract=OuterRef('pk'),
+            date__lte=timezone.localdate(),
+        ).order_by('-date').values('balance')[:1]
+        last_version = ContractVersion.objects.filter(
+            contract=OuterRef('pk'),
+        ).order_by('-start', '-id')
+        return self.select_related('contact').annotate(
+            current_balance=Coalesce(
+                Subquery(balance),
+                Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+            last_version_start=Subquery(last_version.values('start')[:1]),
+            last_version_duration_months=Subquery(last_version.values('duration_months')[:1]),
+            last_version_duration_years=Subquery(last_version.values('duration_years')[:1]),
+            last_version_interest_rate=Subquery(last_version.values('interest_rate')[:1]),
+        )
+
+
 class Contract(models.Model):
     class Category(models.TextChoices):
         PRIVAT = 'Privat'
@@ -46,49 +123,62 @@ class Contract(models.Model):
     contact = models.ForeignKey(Contact, on_delete=models.CASCADE)
     comment = models.CharField(max_length=200, blank=True)
     category = models.CharField(max_length=200, choices=Category.choices)
+    # id of the row in the Rails app, None for rows created here (see import_from_rails_app)
+    rails_id = models.IntegerField(null=True, blank=True, unique=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ContractQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['number', 'id'], name='contract_number_id'),
+        ]
+
     def __str__(self):
         return f"Direktkreditvertrag {self.number} von {self.contact}"
 
+    @cached_property
+    def timeline(self):
+        # uses the prefetched versions of prefetch_related('contractversion_set')
+        return VersionTimeline(self.contractversion_set.all())
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop('timeline', None)
+
     @property
     def last_version(self):
-        return self.contractversion_set.order_by('start').last()
+        return self.timeline.last
 
     @property
     def first_version(self):
-        return self.contractversion_set.order_by('start').first()
+        return self.timeline.first
 
     @property
     def balance(self):
+        if hasattr(self, 'current_balance'):
+            # annotated by ContractQuerySet.with_summary()
+            return self.current_balance
         return self.balance_on(timezone.now())
 
     def balance_on(self, date):
-        """Account balance for given date"""
-        return self.accountingentry_set.filter(
+        """Account balance for given date, read from the latest balance checkpoint"""
+        balance = self.balancecheckpoint_set.filter(
             date__lte=date
-        ).aggregate(
-            models.Sum('amount')
-        )['amount__sum'] or Decimal('0')
+        ).order_by('-date').values_list('balance', flat=True).first()
+        return balance if balance is not None else Decimal('0')
 
     def versions_in(self, year):
-        return self.contractversion_set.filter(start__year=year).order_by('start')
+        return self.timeline.in_year(year)
 
     def version_at(self, reference_date: date):
-        current_version = self.first_version
-        sorted = self.contractversion_set.order_by('start').order_by('start')
-        for version in sorted:
-            if version.start > reference_date:
-                return current_version
-            current_version = version
-        return current_version
+        return self.timeline.at(reference_date)
 
     def interest_rate_on(self, date=None):
-        versions = self.contractversion_set.order_by('-start')
-        for version in versions:
-            if version.start <= date:
-                return version.interest_rate
+        version = self.timeline.started_by(date)
+        if version:
+            return version.interest_rate
 
         logger.error("date before start date of first contract version. Returning interest_rate = 0")
         return Decimal('0')
@@ -98,6 +188,15 @@ class Contract(models.Model):
 
     @property
     def expiring(self):
+        if hasattr(self, 'last_version_start'):
+            # annotated by ContractQuerySet.with_summary()
+            if self.last_version_start is None:
+                return None
+            return expiring_date(
+                self.last_version_start,
+                self.last_version_duration_months,
+                self.last_version_duration_years,
+            )
         return self.last_version.expiring
 
     def expiring_at(self, reference_date: date):
@@ -110,7 +209,7 @@ class Contract(models.Model):
 
     @classmethod
     def total_sum(cls):
-        contracts = cls.objects.all()
+        contracts = cls.objects.with_summary()
         return sum([contract.balance for contract in contracts])
 
 
@@ -121,6 +220,8 @@ class ContractVersion(models.Model):
     interest_rate = models.DecimalField(max_digits=5, decimal_places=4)
     version = models.IntegerField()
     contract = models.ForeignKey(Contract, on_delete=models.CASCADE)
+    # id of the row in the Rails app, None for rows created here (see import_from_rails_app)
+    rails_id = models.IntegerField(null=True, blank=True, unique=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -129,15 +230,24 @@ class ContractVersion(models.Model):
 
     @property
     def expiring(self):
-        return self.start + relativedelta(months=self.duration_months or 0) + relativedelta(years=self.duration_years or 0)
+        return expiring_date(self.start, self.duration_months, self.duration_years)
 
 class AccountingEntry(models.Model):
     date = models.DateField()
     amount = models.DecimalField(max_digits=14, decimal_places=2)
     contract = models.ForeignKey(Contract, on_delete=models.CASCADE)
+    # identifies the bank transaction of imported bookings, see dkapp.operations.bank_statement
+    fingerprint = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False)
+    # id of the row in the Rails app, None for rows created here (see import_from_rails_app)
+    rails_id = models.IntegerField(null=True, blank=True, unique=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='accounting_entry_date_id'),
+        ]
+
     def __str__(self):
         return f"Buchung {self.id} vom {self.date.strftime('%d.%m.%Y')} in {self.contract}"
 
@@ -148,3 +258,283 @@ class AccountingEntry(models.Model):
     @classmethod
     def total_sum(cls):
         return cls.objects.aggregate(models.Sum('amount'))['amount__sum'] or 0
+
+
+class BalanceCheckpoint(models.Model):
+    """Balance of a contract after all its accounting entries up to and including `date`
+
+    There is one checkpoint per contract and booking date. The signals in
+    dkapp.signals keep them up to date, the rebuild_balance_checkpoints
+    command rebuilds and checks them.
+    """
+    contract = models.ForeignKey(Contract, on_delete=models.CASCADE)
+    date = models.DateField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['contract', 'date'], name='unique_balance_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"Kontostand {self.balance} am {self.date.strftime('%d.%m.%Y')} in {self.contract}"
+
+    @classmethod
+    def add(cls, contract_id, date, amount):
+        """Book amount on date into the checkpoints of the contract"""
+        if not cls.objects.filter(contract_id=contract_id, date=date).exists():
+            previous_balance = cls.objects.filter(
+                contract_id=contract_id,
+                date__lt=date,
+            ).order_by('-date').values_list('balance', flat=True).first()
+            cls.objects.create(contract_id=contract_id, date=date, balance=previous_balance or Decimal('0'))
+        cls.objects.filter(contract_id=contract_id, date__gte=date).update(balance=models.F('balance') + amount)
+
+    @classmethod
+    def remove(cls, contract_id, date, amount):
+        """Take amount booked on date out of the checkpoints of the contract"""
+        cls.objects.filter(contract_id=contract_id, date__gte=date).update(balance=models.F('balance') - amount)
+        if not AccountingEntry.objects.filter(contract_id=contract_id, date=date).exists():
+            cls.objects.filter(contract_id=contract_id, date=date).delete()
+
+    @classmethod
+    def expected(cls, contract_ids=None):
+        """Checkpoints as computed from the raw accounting entries"""
+        entries = AccountingEntry.objects.all()
+        if contract_ids is not None:
+            entries = entries.filter(contract_id__in=contract_ids)
+        daily_sums = entries.order_by('contract_id', 'date').values('contract_id', 'date').annotate(
+            Sum('amount'),
+        ).values_list('contract_id', 'date', 'amount__sum')
+
+        contract_id = None
+        balance = Decimal('0')
+        for entry_contract_id, entry_date, amount in daily_sums:
+            if entry_contract_id != contract_id:
+                contract_id = entry_contract_id
+                balance = Decimal('0')
+            balance += amount
+            yield cls(contract_id=contract_id, date=entry_date, balance=balance)
+
+    @classmethod
+    def rebuild(cls, contract_ids=None):
+        checkpoints = cls.objects.all()
+        if contract_ids is not None:
+            checkpoints = checkpoints.filter(contract_id__in=contract_ids)
+        checkpoints.delete()
+        cls.objects.bulk_create(cls.expected(contract_ids), batch_size=500)
+
+    @classmethod
+    def inconsistencies(cls, contract_ids=None):
+        """(contract_id, date, expected balance, stored balance) for every wrong checkpoint"""
+        checkpoints = cls.objects.all()
+        if contract_ids is not None:
+            checkpoints = checkpoints.filter(contract_id__in=contract_ids)
+        stored = {
+            (contract_id, checkpoint_date): balance
+            for contract_id, checkpoint_date, balance in checkpoints.values_list('contract_id', 'date', 'balance')
+        }
+        for checkpoint in cls.expected(contract_ids):
+            stored_balance = stored.pop((checkpoint.contract_id, checkpoint.date), None)
+            if stored_balance != checkpoint.balance:
+                yield checkpoint.contract_id, checkpoint.date, checkpoint.balance, stored_balance
+        for (contract_id, checkpoint_date), balance in stored.items():
+            yield contract_id, checkpoint_date, None, balance
+
+
+class InterestResult(models.Model):
+    """Stored interest calculation of a contract for one year
+
+    Read first by dkapp.operations.interest_cache. The signals in dkapp.signals
+    delete it when a booking or contract version on or before the end of the
+    year changes.
+    """
+    contract = models.ForeignKey(Contract, on_delete=models.CASCADE)
+    year = models.IntegerField()
+    interest = models.DecimalField(max_digits=14, decimal_places=2)
+    rows = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['contract', 'year'], name='unique_interest_result'),
+        ]
+
+    def __str__(self):
+        return f"Zinsen {self.year} für {self.contract}"
+
+    @classmethod
+    def invalidate(cls, contract_id, date):
+        """Forget the results a change on date influences"""
+        cls.objects.filter(contract_id=contract_id, year__gte=date.year).delete()
+
+
+class DataGeneration(models.Model):
+    """Token replaced by every change of contacts, contracts, versions and bookings
+
+    Results computed from all of the data, like the PDFs in
+    dkapp.operations.pdf_cache, are stored under it. The signals in
+    dkapp.signals call bump(); code writing with bulk_create, bulk_update,
+    QuerySet.update() or raw SQL, which sends no signals, has to call it too.
+    A random token instead of a counter never repeats, not even after the
+    database was emptied.
+    """
+    token = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"Datenstand {self.token}"
+
+    @classmethod
+    def bump(cls):
+        token = uuid.uuid4().hex
+        if not cls.objects.filter(id=1).update(token=token):
+            cls.objects.update_or_create(id=1, defaults={'token': token})
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(id=1).values_list('token', flat=True).first() or ''
+
+
+class Job(models.Model):
+    """Long running task (e.g. a PDF batch) executed by the run_worker command
+
+    Requests only enqueue jobs; the worker claims them in order of creation,
+    stores the result file under settings.JOB_OUTPUT_DIR and reports progress
+    between 0 and 1. `updated_at` serves as heartbeat of a running job. A run
+    is identified by `worker` and `started_at`: once a job is requeued, the
+    old run can no longer change it.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Wartend'
+        RUNNING = 'running', 'Läuft'
+        DONE = 'done', 'Fertig'
+        FAILED = 'failed', 'Fehlgeschlagen'
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    progress = models.FloatField(default=0)
+    file_path = models.CharField(max_length=500, blank=True)
+    filename = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_at'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.kind}, {self.get_status_display()})"
+
+    @classmethod
+    def enqueue(cls, kind, **params):
+        """New job, or the queued or running one with the same kind and params
+
+        Reloads and double clicks so wait for the same job instead of
+        queueing the same work again.
+        """
+        pending = cls.objects.filter(
+            kind=kind,
+            params=params,
+            status__in=[cls.Status.QUEUED, cls.Status.RUNNING],
+        ).order_by('created_at', 'id').first()
+        return pending or cls.objects.create(kind=kind, params=params)
+
+    @classmethod
+    def claim(cls, worker=''):
+        """Mark the oldest queued job as running by worker and return it, None if there is none
+
+        The conditional update makes sure concurrent workers never claim the
+        same job.
+        """
+        while True:
+            job_id = cls.objects.filter(status=cls.Status.QUEUED).order_by(
+                'created_at', 'id',
+            ).values_list('id', flat=True).first()
+            if job_id is None:
+                return None
+            now = timezone.now()
+            claimed = cls.objects.filter(id=job_id, status=cls.Status.QUEUED).update(
+                status=cls.Status.RUNNING,
+                worker=worker,
+                started_at=now,
+                updated_at=now,
+            )
+            if claimed:
+                return cls.objects.get(id=job_id)
+
+    @classmethod
+    def requeue_stale(cls, max_age):
+        """Put running jobs without heartbeat for max_age (a timedelta) back into the queue"""
+        return cls.objects.filter(
+            status=cls.Status.RUNNING,
+            updated_at__lt=timezone.now() - max_age,
+        ).update(status=cls.Status.QUEUED, progress=0, worker='', started_at=None, updated_at=timezone.now())
+
+    def this_run(self):
+        """The job as queryset, empty once the run of this instance was requeued"""
+        return Job.objects.filter(
+            id=self.id,
+            status=self.Status.RUNNING,
+            worker=self.worker,
+            started_at=self.started_at,
+        )
+
+    def heartbeat(self):
+        """Mark the run as alive, False if it was requeued"""
+        return bool(self.this_run().update(updated_at=timezone.now()))
+
+    def set_progress(self, progress):
+        self.progress = progress
+        self.this_run().update(progress=progress, updated_at=timezone.now())
+
+    def finish(self):
+        """Save status, file and error of the run, False (and nothing saved) if it was requeued"""
+        self.finished_at = timezone.now()
+        return bool(self.this_run().update(
+            status=self.status,
+            progress=self.progress,
+            file_path=self.file_path,
+            filename=self.filename,
+            error=self.error,
+            finished_at=self.finished_at,
+            updated_at=self.finished_at,
+        ))
+
+
+class SyncWatermark(models.Model):
+    """Newest `updated_at` of a table of the Rails app that has been imported
+
+    Written by import_from_rails_app; `--incremental` only reads rows changed
+    since. The value is kept as the text stored in the Rails database, so it
+    compares like the rows there.
+    """
+    table = models.CharField(max_length=100, unique=True)
+    updated_at = models.CharField(max_length=50)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.table} bis {self.updated_at}"
+
+
+class IdempotencyKey(models.Model):
+    """Response of a successful API request sent with an `Idempotency-Key` header
+
+    A retry with the same key gets the stored response instead of being
+    executed again. It is saved in the transaction of the request, so the
+    unique key also stops two concurrent requests with the same key.
+    """
+    key = models.CharField(max_length=200, unique=True)
+    # sha256 of method, path and body, a key may not be reused for another request
+    request_hash = models.CharField(max_length=64)
+    status_code = models.IntegerField()
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Idempotency-Key {self.key}"
@@ -0,0 +1,303 @@
+"""Bookings from bank statements (CSV exports and CAMT.053 XML)
+
+The statement is read as a stream of BankTransactions. Each transaction is
+matched to a contract with indexes built once (see ContractMatcher), and the
+matched ones are stored with bulk_create in batches. Every booking carries a
+fingerprint of its transaction, so importing a statement again, or one that
+overlaps with an earlier one, books nothing twice.
+"""
+import codecs
+import csv
+import hashlib
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import List, Optional
+from xml.etree.ElementTree import ParseError, iterparse
+
+from django.conf import settings
+from django.db import transaction
+
+from dkapp.models import AccountingEntry, BalanceCheckpoint, Contract, DataGeneration, InterestResult
+
+FORMATS = ['csv', 'camt']
+
+# column names of the CSV exports of different banks
+CSV_COLUMNS = {
+    'date': ['buchungstag', 'buchungsdatum', 'datum'],
+    'amount': ['betrag', 'betrag (eur)', 'umsatz'],
+    'iban': ['iban', 'iban zahlungsbeteiligter', 'kontonummer/iban', 'iban auftraggeber/empfänger'],
+    'name': ['name zahlungsbeteiligter', 'beguenstigter/zahlungspflichtiger', 'auftraggeber/empfänger', 'name'],
+    'reference': ['verwendungszweck', 'buchungstext'],
+}
+CSV_DATE_FORMATS = ['%d.%m.%Y', '%d.%m.%y', '%Y-%m-%d']
+
+
+class BankStatementError(ValueError):
+    pass
+
+
+@dataclass
+class BankTransaction:
+    date: date
+    amount: Decimal
+    iban: str
+    name: str
+    reference: str
+
+    @property
+    def key(self):
+        return '|'.join([self.date.isoformat(), str(self.amount), self.iban, ' '.join(self.reference.split())])
+
+
+@dataclass
+class StatementImport:
+    booked: int = 0
+    duplicates: int = 0
+    unmatched: List[BankTransaction] = field(default_factory=list)
+
+    @property
+    def total(self):
+        return self.booked + self.duplicates + len(self.unmatched)
+
+
+def normalize_iban(iban):
+    return ''.join((iban or '').split()).upper()
+
+
+class ContractMatcher:
+    """Finds the contract of a transaction by contract number in the reference text and by IBAN
+
+    A number right after one of the prefixes (e.g. "Vertrag 17", "DK-17")
+    counts if a contract has it. Other numbers only count if they stand on
+    their own (not "17.03.", "RE2024", digits of an IBAN) and belong to a
+    contract of the IBAN, so an invoice number or a year never books money
+    onto the contract of someone else. When both point to contracts, the
+    contract has to be in both; otherwise the one that is found has to be
+    unique. Outgoing payments, e.g. interest paid out, stay unmatched unless
+    `outgoing` is set.
+    """
+    NUMBER_PATTERN = re.compile(r'(?<![\w.,/-])\d+(?![\w,/-]|\.\d)')
+
+    def __init__(self, contracts, prefixes=(), outgoing=False):
+        self.by_number = defaultdict(set)
+        self.by_iban = defaultdict(set)
+        for contract_id, number, iban in contracts:
+            self.by_number[number].add(contract_id)
+            if iban:
+                self.by_iban[normalize_iban(iban)].add(contract_id)
+        self.prefix_pattern = re.compile(
+            r'\b(?:' + '|'.join(re.escape(prefix) for prefix in prefixes) + r')'
+            r'[\s.:#-]*(?:nr\.?|nummer)?[\s.:#-]*(\d+)(?![\w,/-]|\.\d)',
+            re.IGNORECASE,
+        ) if prefixes else None
+        self.outgoing = outgoing
+
+    def contracts(self, numbers):
+        contract_ids = set()
+        for number in numbers:
+            contract_ids |= self.by_number.get(int(number), set())
+        return contract_ids
+
+    def match(self, bank_transaction: BankTransaction) -> Optional[int]:
+        if bank_transaction.amount < 0 and not self.outgoing:
+            return None
+        by_iban = self.by_iban.get(bank_transaction.iban, set())
+        by_number = self.contracts(self.NUMBER_PATTERN.findall(bank_transaction.reference)) & by_iban
+        if self.prefix_pattern:
+            by_number |= self.contracts(self.prefix_pattern.findall(bank_transaction.reference))
+        if by_number and by_iban:
+            candidates = by_number & by_iban
+        else:
+            candidates = by_number or by_iban
+        return next(iter(candidates)) if len(candidates) == 1 else None
+
+    @classmethod
+    def create(cls, outgoing=False):
+        return cls(
+            Contract.objects.values_list('id', 'number', 'contact__iban'),
+            prefixes=settings.BANK_STATEMENT_CONTRACT_PREFIXES,
+            outgoing=outgoing,
+        )
+
+
+def detect_format(file):
+    """'camt' for XML, 'csv' otherwise; file has to be seekable"""
+    start = file.read(200)
+    file.seek(0)
+    if isinstance(start, bytes):
+        start = start.decode('utf-8', errors='ignore')
+    return 'camt' if start.lstrip('﻿ \t\r\n').startswith('<') else 'csv'
+
+
+def parse(file, format, encoding='utf-8-sig'):
+    """BankTransactions of a binary file, read as a stream"""
+    if format == 'csv':
+        return parse_csv(codecs.getreader(encoding)(file))
+    if format == 'camt':
+        return parse_camt053(file)
+    raise BankStatementError(f'Unbekanntes Format {format}')
+
+
+def parse_csv(lines):
+    """BankTransactions of the lines of a CSV export with a header row"""
+    lines = iter(lines)
+    header = next(lines, '')
+    delimiter = ';' if header.count(';') >= header.count(',') else ','
+    names = [name.strip().lower() for name in next(csv.reader([header], delimiter=delimiter))]
+    columns = {}
+    for column, aliases in CSV_COLUMNS.items():
+        columns[column] = next((names.index(alias) for alias in aliases if alias in names), None)
+    missing = [column for column in ['date', 'amount'] if columns[column] is None]
+    if missing:
+        raise BankStatementError(f'Spalten für {", ".join(missing)} fehlen in der CSV-Datei')
+
+    for line_number, row in enumerate(csv.reader(lines, delimiter=delimiter), start=2):
+        if not any(row):
+            continue
+        try:
+            yield BankTransaction(
+                date=_parse_date(row[columns['date']]),
+                amount=_parse_amount(row[columns['amount']]),
+                iban=normalize_iban(_cell(row, columns['iban'])),
+                name=_cell(row, columns['name']).strip(),
+                reference=_cell(row, columns['reference']).strip(),
+            )
+        except (IndexError, ValueError, InvalidOperation) as error:
+            raise BankStatementError(f'Zeile {line_number}: {error}')
+
+
+def _cell(row, index):
+    return row[index] if index is not None and index < len(row) else ''
+
+
+def _parse_date(value):
+    for date_format in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f'ungültiges Datum {value!r}')
+
+
+def _parse_amount(value):
+    value = value.strip().replace(' ', '').replace('€', '')
+    if ',' in value:
+        value = value.replace('.', '').replace(',', '.')
+    return Decimal(value)
+
+
+def parse_camt053(file):
+    """BankTransactions of the entries (Ntry) of a CAMT.053 statement
+
+    Entries with several transaction details (batch bookings) give one
+    transaction per detail. Elements are dropped once read.
+    """
+    try:
+        events = iterparse(file, events=('start', 'end'))
+        _, root = next(events)
+        for event, element in events:
+            if event == 'end' and _name(element) == 'Ntry':
+                yield from _camt_entry(element)
+                root.clear()
+    except ParseError as error:
+        raise BankStatementError(f'Ungültige XML-Datei: {error}')
+
+
+def _name(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _child(element, *path):
+    for name in path:
+        if element is None:
+            return None
+        element = next((child for child in element if _name(child) == name), None)
+    return element
+
+
+def _text(element, *path):
+    element = _child(element, *path)
+    return element.text.strip() if element is not None and element.text else ''
+
+
+def _camt_entry(entry):
+    credit = _text(entry, 'CdtDbtInd') == 'CRDT'
+    booking_date = _text(entry, 'BookgDt', 'Dt') or _text(entry, 'BookgDt', 'DtTm')[:10] or _text(entry, 'ValDt', 'Dt')
+    details = [child for child in (_child(entry, 'NtryDtls') or []) if _name(child) == 'TxDtls']
+    for detail in details or [None]:
+        amount = _text(detail, 'AmtDtls', 'TxAmt', 'Amt') or _text(detail, 'Amt') or _text(entry, 'Amt')
+        # the other party is the debtor of incoming and the creditor of outgoing payments
+        party, account = ('Dbtr', 'DbtrAcct') if credit else ('Cdtr', 'CdtrAcct')
+        references = _child(detail, 'RmtInf')
+        try:
+            yield BankTransaction(
+                date=date.fromisoformat(booking_date),
+                amount=Decimal(amount) if credit else -Decimal(amount),
+                iban=normalize_iban(_text(detail, 'RltdPties', account, 'Id', 'IBAN')),
+                name=_text(detail, 'RltdPties', party, 'Nm') or _text(detail, 'RltdPties', party, 'Pty', 'Nm'),
+                reference=' '.join(
+                    child.text.strip() for child in (references if references is not None else [])
+                    if _name(child) == 'Ustrd' and child.text
+                ),
+            )
+        except (ValueError, InvalidOperation) as error:
+            raise BankStatementError(f'Ungültige Buchung vom {booking_date!r}: {error}')
+
+
+def fingerprint(bank_transaction, occurrence):
+    """Identifies the occurrence-th transaction with the same date, amount, IBAN and reference"""
+    return hashlib.sha256(f'{bank_transaction.key}|{occurrence}'.encode()).hexdigest()
+
+
+def import_statement(file, format=None, encoding='utf-8-sig', batch_size=1000, outgoing=False) -> StatementImport:
+    """Book the transactions of a bank statement that match a contract
+
+    Outgoing payments are only booked (as withdrawals) with `outgoing`. All
+    or nothing: on errors in the file nothing is booked.
+    """
+    format = format or detect_format(file)
+    matcher = ContractMatcher.create(outgoing)
+    result = StatementImport()
+    occurrences = Counter()
+    # contract id -> first booking date, to update checkpoints and stored interest
+    changed = {}
+    transactions = parse(file, format, encoding)
+    with transaction.atomic():
+        while True:
+            batch = list(islice(transactions, batch_size))
+            if not batch:
+                break
+            entries = []
+            for bank_transaction in batch:
+                occurrences[bank_transaction.key] += 1
+                contract_id = matcher.match(bank_transaction)
+                if contract_id is None:
+                    result.unmatched.append(bank_transaction)
+                    continue
+                entries.append(AccountingEntry(
+                    contract_id=contract_id,
+                    date=bank_transaction.date,
+                    amount=bank_transaction.amount,
+                    fingerprint=fingerprint(bank_transaction, occurrences[bank_transaction.key]),
+                ))
+            booked = set(AccountingEntry.objects.filter(
+                fingerprint__in=[entry.fingerprint for entry in entries],
+            ).values_list('fingerprint', flat=True))
+            new_entries = [entry for entry in entries if entry.fingerprint not in booked]
+            AccountingEntry.objects.bulk_create(new_entries)
+            result.duplicates += len(entries) - len(new_entries)
+            result.booked += len(new_entries)
+            for entry in new_entries:
+                changed[entry.contract_id] = min(changed.get(entry.contract_id, entry.date), entry.date)
+
+        # bulk_create sends no signals
+        BalanceCheckpoint.rebuild(list(changed))
+        for contract_id, first_date in changed.items():
+            InterestResult.invalidate(contract_id, first_date)
+        if changed:
+            DataGeneration.bump()
+    return result
@@ -0,0 +1,133 @@
+"""Many bookings created or changed at once, e.g. through the JSON API
+
+The whole batch is validated first, against contracts and bookings loaded
+with one query each, and only saved when every row is valid: new bookings
+with bulk_create, changed ones with bulk_update, all in one transaction.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from dkapp.models import AccountingEntry, BalanceCheckpoint, Contract, DataGeneration, InterestResult
+
+
+class BookingBatchError(ValueError):
+    """Some rows are invalid, `results` has the errors of every row"""
+
+    def __init__(self, results):
+        super().__init__('invalid bookings')
+        self.results = results
+
+
+class BookingBatch:
+    def __init__(self, rows):
+        self.rows = rows
+        contracts = Contract.objects.values_list('id', 'number')
+        self.contract_ids = {contract_id for contract_id, number in contracts}
+        self.contract_ids_by_number = defaultdict(list)
+        for contract_id, number in contracts:
+            self.contract_ids_by_number[number].append(contract_id)
+        entry_ids = [row['id'] for row in rows if isinstance(row, dict) and isinstance(row.get('id'), int)]
+        self.existing = AccountingEntry.objects.in_bulk(entry_ids)
+        self.seen_ids = set()
+
+    def contract_id(self, row):
+        if row.get('contract') is not None:
+            if row['contract'] not in self.contract_ids:
+                raise ValidationError(f"Vertrag {row['contract']} existiert nicht")
+            return row['contract']
+        if row.get('contract_number') is not None:
+            contract_ids = self.contract_ids_by_number.get(row['contract_number'], [])
+            if len(contract_ids) != 1:
+                raise ValidationError(
+                    f"Vertragsnummer {row['contract_number']} "
+                    f"{'existiert nicht' if not contract_ids else 'ist nicht eindeutig'}"
+                )
+            return contract_ids[0]
+        raise ValidationError('Vertrag oder Vertragsnummer fehlt')
+
+    @staticmethod
+    def date(row):
+        try:
+            value = parse_date(row['date']) if isinstance(row.get('date'), str) else None
+        except ValueError:
+            value = None
+        if value is None:
+            raise ValidationError('Datum fehlt oder ist ungültig (YYYY-MM-DD)')
+        return value
+
+    @staticmethod
+    def amount(row):
+        if isinstance(row.get('amount'), (bool, float)):
+            # floats lose cents, e.g. 0.1 + 0.2
+            raise ValidationError('Betrag als Zeichenkette oder ganze Zahl angeben')
+        return AccountingEntry._meta.get_field('amount').clean(row.get('amount'), None)
+
+    def entry(self, row):
+        """(booking with the values of row, contract id and date before the change), errors per field"""
+        if not isinstance(row, dict):
+            return None, {'__all__': ['Buchung muss ein Objekt sein']}
+        entry = AccountingEntry()
+        old = None
+        if row.get('id') is not None:
+            entry = self.existing.get(row['id'])
+            if entry is None:
+                return None, {'id': [f"Buchung {row['id']} existiert nicht"]}
+            if entry.id in self.seen_ids:
+                return None, {'id': [f"Buchung {row['id']} kommt mehrfach vor"]}
+            self.seen_ids.add(entry.id)
+            old = (entry.contract_id, entry.date)
+        errors = {}
+        for name, field, clean in [
+            ('contract', 'contract_id', self.contract_id),
+            ('date', 'date', self.date),
+            ('amount', 'amount', self.amount),
+        ]:
+            try:
+                setattr(entry, field, clean(row))
+            except ValidationError as error:
+                errors[name] = error.messages
+        return (entry, old), errors
+
+    def validate(self):
+        """Bookings and old (contract id, date) per row, raises BookingBatchError"""
+        entries = []
+        results = []
+        for index, row in enumerate(self.rows):
+            entry, errors = self.entry(row)
+            entries.append(entry)
+            results.append({'index': index, 'status': 'error', 'errors': errors} if errors else {'index': index})
+        if any('errors' in result for result in results):
+            raise BookingBatchError(results)
+        return entries
+
+    def save(self):
+        """Save all bookings and return a result per row, raises BookingBatchError"""
+        entries = self.validate()
+        new_entries = [entry for entry, old in entries if old is None]
+        changed_entries = [entry for entry, old in entries if old is not None]
+        # contract id -> first date a balance changes on
+        changed = {}
+        for entry, old in entries:
+            for contract_id, date in [(entry.contract_id, entry.date), old or (entry.contract_id, entry.date)]:
+                changed[contract_id] = min(changed.get(contract_id, date), date)
+
+        with transaction.atomic():
+            AccountingEntry.objects.bulk_create(new_entries)
+            now = timezone.now()
+            for entry in changed_entries:
+                entry.updated_at = now
+            AccountingEntry.objects.bulk_update(changed_entries, ['contract', 'date', 'amount', 'updated_at'])
+            # the bulk operations send no signals
+            BalanceCheckpoint.rebuild(list(changed))
+            for contract_id, date in changed.items():
+                InterestResult.invalidate(contract_id, date)
+            DataGeneration.bump()
+
+        return [
+            {'index': index, 'status': 'updated' if old else 'created', 'id': entry.id}
+            for index, (entry, old) in enumerate(entries)
+        ]
@@ -0,0 +1,250 @@
+"""Read-only feeds of contracts, bookings and reports, streamed as NDJSON
+
+A feed reads its queryset with `.iterator(chunk_size=CHUNK_SIZE)` and turns
+every object into one JSON line, so memory stays the same for any number of
+rows. Reports are computed chunk by chunk.
+
+Paging is by key (seek), not by offset: `limit` rows of the queryset after
+the position in `cursor`. The cursor of the next page is known before the
+first row is sent, it is the key of the last row of the page. For reports
+the limit counts the contracts looked at, so a page can have fewer rows.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Sum
+from django.utils.dateparse import parse_date
+
+from dkapp.models import AccountingEntry, Contract
+from dkapp.operations.interest_cache import year_interest
+from dkapp.operations.keyset import CursorError, after, decode_cursor, encode_cursor
+from dkapp.operations.reports import RemainingContractsReport
+
+CHUNK_SIZE = 500
+MAX_LIMIT = 10000
+
+
+class FeedError(ValueError):
+    pass
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class Feed:
+    # fields the rows are ordered by, unique together
+    key = ('id',)
+    # name -> function of an item returning the value
+    fields = {}
+
+    def __init__(self, params):
+        self.params = params
+
+    def queryset(self):
+        raise NotImplementedError
+
+    def items(self, objects):
+        """What the fields are read from, one item per row"""
+        return objects
+
+    def summary(self):
+        """Values sent as headers, computed in SQL"""
+        return {}
+
+    def selected_fields(self):
+        if not self.params.get('fields'):
+            return list(self.fields)
+        names = [name.strip() for name in self.params['fields'].split(',')]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise FeedError(f'Unbekannte Felder {", ".join(unknown)}, möglich sind {", ".join(self.fields)}')
+        return names
+
+    def limit(self):
+        try:
+            limit = int(self.params['limit']) if self.params.get('limit') else None
+        except ValueError:
+            raise FeedError('limit muss eine Zahl sein')
+        if limit is not None and not 1 <= limit <= MAX_LIMIT:
+            raise FeedError(f'limit muss zwischen 1 und {MAX_LIMIT} liegen')
+        return limit
+
+    def page(self):
+        """(rows as dicts, cursor of the next page or None); checks the parameters right away"""
+        fields = [(name, self.fields[name]) for name in self.selected_fields()]
+        limit = self.limit()
+        queryset = self.queryset().order_by(*self.key)
+        if self.params.get('cursor'):
+            try:
+                values = decode_cursor(self.params['cursor'], self.key)
+            except CursorError as error:
+                raise FeedError(str(error))
+            queryset = queryset.filter(after(self.key, values))
+        next_cursor = None
+        if limit:
+            boundary = list(queryset.values_list(*self.key)[limit - 1:limit + 1])
+            if len(boundary) == 2:
+                next_cursor = encode_cursor(boundary[0])
+                queryset = queryset.exclude(after(self.key, boundary[0]))
+        items = self.items(queryset.iterator(chunk_size=CHUNK_SIZE))
+        rows = ({name: value(item) for name, value in fields} for item in items)
+        return rows, next_cursor
+
+    def date_param(self, name):
+        if not self.params.get(name):
+            return None
+        try:
+            value = parse_date(self.params[name])
+        except ValueError:
+            value = None
+        if value is None:
+            raise FeedError(f'{name} muss ein Datum (YYYY-MM-DD) sein')
+        return value
+
+    def int_param(self, name, default=None):
+        try:
+            return int(self.params[name]) if self.params.get(name) else default
+        except ValueError:
+            raise FeedError(f'{name} muss eine Zahl sein')
+
+
+class ContractFeed(Feed):
+    key = ('number', 'id')
+    fields = {
+        'id': lambda contract: contract.id,
+        'number': lambda contract: contract.number,
+        'category': lambda contract: contract.category,
+        'comment': lambda contract: contract.comment,
+        'contact_id': lambda contract: contract.contact_id,
+        'contact': lambda contract: str(contract.contact),
+        'balance': lambda contract: contract.current_balance,
+        'interest_rate': lambda contract: contract.last_version_interest_rate,
+        'start': lambda contract: contract.last_version_start,
+        'expiring': lambda contract: contract.expiring,
+    }
+
+    def queryset(self):
+        contracts = Contract.objects.with_summary()
+        contact_id = self.int_param('contact_id')
+        if contact_id is not None:
+            contracts = contracts.filter(contact_id=contact_id)
+        return contracts
+
+
+class AccountingEntryFeed(Feed):
+    key = ('date', 'id')
+    fields = {
+        'id': lambda entry: entry['id'],
+        'contract_id': lambda entry: entry['contract_id'],
+        'contract_number': lambda entry: entry['contract__number'],
+        'date': lambda entry: entry['date'],
+        'amount': lambda entry: entry['amount'],
+    }
+
+    def queryset(self):
+        entries = AccountingEntry.objects.all()
+        contract_id = self.int_param('contract_id')
+        if contract_id is not None:
+            entries = entries.filter(contract_id=contract_id)
+        year = self.int_param('year')
+        if year is not None:
+            entries = entries.filter(date__year=year)
+        if self.date_param('from'):
+            entries = entries.filter(date__gte=self.date_param('from'))
+        if self.date_param('to'):
+            entries = entries.filter(date__lte=self.date_param('to'))
+        # plain values, the rows need no model instances
+        return entries.values('id', 'contract_id', 'contract__number', 'date', 'amount')
+
+
+class InterestTransferListFeed(Feed):
+    """Contracts with interest in `year`, like InterestTransferListReport"""
+    key = ('number', 'id')
+    fields = {
+        'contract_id': lambda interest: interest.contract.id,
+        'contract_number': lambda interest: interest.contract.number,
+        'contact': lambda interest: str(interest.contract.contact),
+        'iban': lambda interest: interest.contract.contact.iban,
+        'bic': lambda interest: interest.contract.contact.bic,
+        'bank_name': lambda interest: interest.contract.contact.bank_name,
+        'interest': lambda interest: interest.value,
+    }
+
+    def queryset(self):
+        self.year = self.int_param('year', datetime.now().year)
+        return Contract.objects.with_summary()
+
+    def items(self, objects):
+        for contracts in chunked(objects, CHUNK_SIZE):
+            for interest in year_interest(contracts, self.year):
+                if interest.value > 0:
+                    yield interest
+
+
+class AverageInterestRateFeed(Feed):
+    """Share of every contract with a balance in the average interest rate, like AverageInterestRateReport"""
+    key = ('number', 'id')
+    fields = {
+        'contract_id': lambda data: data[0].id,
+        'contract_number': lambda data: data[0].number,
+        'balance': lambda data: data[0].current_balance,
+        'fraction_credit': lambda data: data[1],
+        'interest_rate': lambda data: data[0].last_version_interest_rate,
+        'relative_interest_rate': lambda data: data[1] * data[0].last_version_interest_rate,
+    }
+
+    def contracts(self):
+        return Contract.objects.with_summary().filter(current_balance__gt=0)
+
+    def queryset(self):
+        self.sum_credit = AccountingEntry.total_sum()
+        return self.contracts()
+
+    def items(self, objects):
+        for contract in objects:
+            yield contract, contract.current_balance / self.sum_credit if self.sum_credit else Decimal('0')
+
+    def summary(self):
+        weighted = self.contracts().aggregate(
+            weighted=Sum(F('current_balance') * F('last_version_interest_rate')),
+        )['weighted']
+        sum_credit = AccountingEntry.total_sum()
+        return {
+            'X-Sum-Credit': sum_credit,
+            'X-Average-Interest-Rate': (weighted or 0) / sum_credit if sum_credit else Decimal('0'),
+        }
+
+
+class RemainingContractsFeed(Feed):
+    """Contracts with a balance at the end of `year` and their remaining years, like RemainingContractsReport"""
+    key = ('number', 'id')
+    fields = {
+        'contract_id': lambda data: data[0].id,
+        'contract_number': lambda data: data[0].number,
+        'contact': lambda data: str(data[0].contact),
+        'category': lambda data: data[1],
+        'balance': lambda data: data[2],
+        'remaining_years': lambda data: data[3],
+    }
+
+    def queryset(self):
+        year = self.int_param('year', datetime.now().year)
+        self.cutoff_date = datetime(year=year, month=12, day=31)
+        return Contract.objects.select_related('contact').prefetch_related('contractversion_set')
+
+    def items(self, objects):
+        for contract in objects:
+            classified = RemainingContractsReport.classify(contract, self.cutoff_date)
+            if classified:
+                yield contract, *classified, contract.remaining_years(self.cutoff_date.date())
@@ -0,0 +1,115 @@
+from collections import defaultdict, namedtuple
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List
+
+from dateutil.relativedelta import relativedelta
+
+from dkapp.models import Contract, AccountingEntry
+from dkapp.operations.interest import ContractLedger
+
+# what ContractLedger needs of an accounting entry
+Booking = namedtuple('Booking', ['date', 'amount'])
+
+
+@dataclass
+class ForecastMonth:
+    month: date
+    repayments: Dict[str, Decimal] = field(default_factory=lambda: defaultdict(Decimal))
+    interest: Dict[str, Decimal] = field(default_factory=lambda: defaultdict(Decimal))
+
+    @property
+    def repayments_sum(self):
+        return sum(self.repayments.values(), Decimal('0'))
+
+    @property
+    def interest_sum(self):
+        return sum(self.interest.values(), Decimal('0'))
+
+    @property
+    def total(self):
+        return self.repayments_sum + self.interest_sum
+
+    @property
+    def per_category(self):
+        """(category, repayments, interest) for every contract category"""
+        return [
+            (category, self.repayments.get(category, Decimal('0')), self.interest.get(category, Decimal('0')))
+            for category in Contract.Category.values
+        ]
+
+
+class CashFlowForecast:
+    """Money leaving the project per month, split by contract category
+
+    Every contract is repaid with its balance on the expiry date of its last
+    version (contracts already expired but not repaid in the first month).
+    Interest for a year is paid in December, or with the repayment in the year
+    the contract ends. Each contract's bookings are walked once by
+    ContractLedger, carrying the closing balance from year to year.
+    """
+
+    def __init__(self, contracts, bookings, start: date, years: int):
+        self.start = start.replace(day=1)
+        self.end = self.start + relativedelta(years=years) - relativedelta(days=1)
+        self.categories = Contract.Category.values
+        self.months: List[ForecastMonth] = []
+        month = self.start
+        while month <= self.end:
+            self.months.append(ForecastMonth(month=month))
+            month += relativedelta(months=1)
+
+        for contract in contracts:
+            self._forecast_contract(contract, bookings.get(contract.id, []))
+
+    @property
+    def years(self):
+        """ForecastMonth like sums per year"""
+        years = {}
+        for month in self.months:
+            year = years.setdefault(month.month.year, ForecastMonth(month=date(month.month.year, 1, 1)))
+            for category, amount in month.repayments.items():
+                year.repayments[category] += amount
+            for category, amount in month.interest.items():
+                year.interest[category] += amount
+        return list(years.values())
+
+    def _month(self, day: date) -> ForecastMonth:
+        return self.months[(day.year - self.start.year) * 12 + day.month - self.start.month]
+
+    def _forecast_contract(self, contract, bookings):
+        last_version = contract.last_version
+        if last_version is None:
+            return
+
+        repayment_date = max(last_version.expiring, self.start)
+        bookings = [booking for booking in bookings if booking.date <= repayment_date]
+        repayment = sum([booking.amount for booking in bookings], Decimal('0'))
+        if repayment > 0 and repayment_date <= self.end:
+            bookings.append(Booking(repayment_date, -repayment))
+            self._month(repayment_date).repayments[contract.category] += repayment
+        else:
+            repayment_date = None
+
+        last_year = repayment_date.year if repayment_date else self.end.year
+        for ledger_year in ContractLedger(contract, bookings).years(self.start.year, last_year):
+            interest = ledger_year.interest
+            if interest <= 0:
+                continue
+            if repayment_date and repayment_date.year == ledger_year.year:
+                payment_date = repayment_date
+            else:
+                payment_date = date(ledger_year.year, 12, 31)
+            if payment_date <= self.end:
+                self._month(payment_date).interest[contract.category] += interest
+
+    @classmethod
+    def create(cls, years: int, start: date = None):
+        contracts = Contract.objects.order_by('number').prefetch_related('contractversion_set')
+        bookings = defaultdict(list)
+        for contract_id, booking_date, amount in AccountingEntry.objects.order_by(
+            'contract_id', 'date', 'id',
+        ).values_list('contract_id', 'date', 'amount'):
+            bookings[contract_id].append(Booking(booking_date, amount))
+        return cls(contracts, bookings, start=start or date.today(), years=years)
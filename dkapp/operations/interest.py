@@ -1,6 +1,12 @@
+from collections import defaultdict
 from datetime import date
 from dataclasses import dataclass
 from decimal import Decimal
+from typing import List
+
+from django.db import models
+
+from dkapp.models import AccountingEntry
 
 
 @dataclass
@@ -14,6 +20,24 @@ class InterestDataRow:
     interest: float
 
 
+# Fraction of a 30/360 year for 0 to 360 days left: the Decimal of the float
+# days/360 that interest has always been calculated with. Looking them up keeps
+# results cent-identical to earlier calculations without converting a float
+# per booking. Integer cents for many bookings at once: see interest_vec.
+YEAR_FRACTIONS_360 = [Decimal(days/360) for days in range(361)]
+
+
+def year_fraction_360(days_left):
+    if 0 <= days_left <= 360:
+        return YEAR_FRACTIONS_360[days_left]
+    return Decimal(days_left/360)
+
+
+def interest_for(amount, interest_rate, days_left=360):
+    """Interest on amount for days_left of a 30/360 year, rounded half-even to cents"""
+    return round(amount * year_fraction_360(days_left) * interest_rate, 2)
+
+
 class InterestProcessor:
     def __init__(self, contract, year):
         self.year = year
@@ -28,17 +52,18 @@ class InterestProcessor:
 
     def calculate_rows(self):
         interest_rows = [self._saldo_row()]
-        accounting_entries = self.contract.accounting_entries_in(self.year)
+        accounting_entries = self._accounting_entries()
         for entry in accounting_entries:
             interest_rows.append(self._accounting_row(entry))
 
-        contract_changes = self.contract.versions_in(self.year)
+        contract_changes = self._versions_in_year()
         if not contract_changes:
             return interest_rows
 
         old_interest_rate = interest_rows[0].interest_rate
+        first_version = self._first_version()
         for contract_change in contract_changes:
-            if contract_change.id == self.contract.first_version.id:
+            if contract_change.id == first_version.id:
                 continue
             if contract_change.start == self.start_date:
                 continue
@@ -51,9 +76,9 @@ class InterestProcessor:
         return interest_rows
 
     def _saldo_row(self):
-        start_balance = self.contract.balance_on(self.start_date)
-        interest_rate = self.contract.interest_rate_on(self.start_date)
-        interest_for_year = round(start_balance * interest_rate, 2)
+        start_balance = self._balance_on(self.start_date)
+        interest_rate = self._interest_rate_on(self.start_date)
+        interest_for_year = interest_for(start_balance, interest_rate)
 
         return InterestDataRow(
             date=self.start_date,
@@ -67,8 +92,8 @@ class InterestProcessor:
 
     def _accounting_row(self, accounting_entry):
         days_left, fraction_year = self._days_fraction_360(accounting_entry.date)
-        interest_rate = self.contract.interest_rate_on(accounting_entry.date)
-        interest = round(accounting_entry.amount * fraction_year * interest_rate, 2)
+        interest_rate = self._interest_rate_on(accounting_entry.date)
+        interest = interest_for(accounting_entry.amount, interest_rate, days_left)
         return InterestDataRow(
             date=accounting_entry.date,
             label="Einzahlung" if accounting_entry.amount > 0 else "Auszahlung",
@@ -80,10 +105,10 @@ class InterestProcessor:
         )
 
     def _contract_change_rows(self, contract_version, old_interest_rate):
-        change_balance = self.contract.balance_on(contract_version.start)
+        change_balance = self._balance_on(contract_version.start)
         days_left, fraction_year = self._days_fraction_360(contract_version.start)
-        interest_before = round(-change_balance * fraction_year * old_interest_rate, 2)
-        interest_after = round(change_balance * fraction_year * contract_version.interest_rate, 2)
+        interest_before = interest_for(-change_balance, old_interest_rate, days_left)
+        interest_after = interest_for(change_balance, contract_version.interest_rate, days_left)
         return [
             InterestDataRow(
                 date=contract_version.start,
@@ -107,8 +132,154 @@ class InterestProcessor:
 
     def _days_fraction_360(self, date):
         days_left = days360_eu(date, self.end_date)
-        fraction = Decimal(days_left/360)
-        return days_left, fraction
+        return days_left, year_fraction_360(days_left)
+
+    # data access, overridden by PrefetchedInterestProcessor
+
+    def _balance_on(self, date):
+        return self.contract.balance_on(date)
+
+    def _interest_rate_on(self, date):
+        return self.contract.interest_rate_on(date)
+
+    def _accounting_entries(self):
+        return self.contract.accounting_entries_in(self.year)
+
+    def _versions_in_year(self):
+        return self.contract.versions_in(self.year)
+
+    def _first_version(self):
+        return self.contract.first_version
+
+
+class PrefetchedInterestProcessor(InterestProcessor):
+    """InterestProcessor working on balances and entries loaded up front
+
+    `start_balance` is the balance on January 1st and `accounting_entries` are
+    the contract's entries in `year` ordered by date. Versions come from the
+    contract's timeline, so prefetch `contractversion_set` to avoid queries.
+    """
+
+    def __init__(self, contract, year, start_balance, accounting_entries):
+        self.start_balance = start_balance
+        self.accounting_entries = accounting_entries
+        super().__init__(contract, year)
+
+    def _balance_on(self, date):
+        return self.start_balance + sum(
+            [entry.amount for entry in self.accounting_entries if self.start_date < entry.date <= date]
+        )
+
+    def _accounting_entries(self):
+        return self.accounting_entries
+
+
+class YearInterestBatch:
+    """Interest of many contracts for one year from a constant number of queries
+
+    Start balances come from one grouped aggregate, accounting entries of the
+    year and contract versions (prefetched into the contracts' timelines) from
+    one query each. The rows are identical to the ones of InterestProcessor.
+    """
+
+    def __init__(self, contracts, year):
+        self.year = year
+        self.contracts = list(contracts)
+        # a queryset is used as subquery, a list by its ids
+        contract_filter = contracts if isinstance(contracts, models.QuerySet) else [
+            contract.id for contract in self.contracts
+        ]
+
+        start_balances = dict(AccountingEntry.objects.filter(
+            contract__in=contract_filter,
+            date__lte=date(year, 1, 1),
+        ).order_by().values('contract').annotate(
+            models.Sum('amount'),
+        ).values_list('contract', 'amount__sum'))
+
+        accounting_entries = defaultdict(list)
+        for entry in AccountingEntry.objects.filter(
+            contract__in=contract_filter,
+            date__year=year,
+        ).order_by('date', 'id'):
+            accounting_entries[entry.contract_id].append(entry)
+
+        models.prefetch_related_objects(self.contracts, 'contractversion_set')
+
+        self.processors = [
+            PrefetchedInterestProcessor(
+                contract,
+                year,
+                start_balance=start_balances.get(contract.id) or Decimal('0'),
+                accounting_entries=accounting_entries[contract.id],
+            ) for contract in self.contracts
+        ]
+
+
+@dataclass
+class LedgerYear:
+    year: int
+    start_balance: Decimal
+    calculation_rows: List[InterestDataRow]
+    closing_balance: Decimal
+
+    @property
+    def interest(self):
+        return sum([row.interest for row in self.calculation_rows])
+
+
+class ContractLedger:
+    """Interest of one contract for year after year from a single pass over its bookings
+
+    `bookings` are the contract's accounting entries (or anything with `date`
+    and `amount`) ordered by date. Versions come from the contract's timeline.
+    The balance is carried from one year to the next, so every year's rows are
+    the ones of InterestProcessor without querying balances again. Years
+    without balance and bookings have no rows.
+    """
+
+    def __init__(self, contract, bookings):
+        self.contract = contract
+        self.bookings = list(bookings)
+
+    def years(self, first_year=None, last_year=None):
+        """LedgerYear for each year, by default from the contract start to this year"""
+        if first_year is None:
+            first_version = self.contract.first_version
+            if first_version is None:
+                return
+            first_year = first_version.start.year
+        if last_year is None:
+            last_year = date.today().year
+
+        bookings = self.bookings
+        index = 0
+        closing_balance = Decimal('0')
+        for year in range(first_year, last_year + 1):
+            start_date = date(year, 1, 1)
+            while index < len(bookings) and bookings[index].date < start_date:
+                closing_balance += bookings[index].amount
+                index += 1
+            year_end = index
+            while year_end < len(bookings) and bookings[year_end].date.year == year:
+                year_end += 1
+            year_bookings = bookings[index:year_end]
+            index = year_end
+
+            start_balance = closing_balance
+            for booking in year_bookings:
+                if booking.date == start_date:
+                    start_balance += booking.amount
+                closing_balance += booking.amount
+            if start_balance or year_bookings:
+                rows = PrefetchedInterestProcessor(self.contract, year, start_balance, year_bookings).calculation_rows
+            else:
+                rows = []
+            yield LedgerYear(year, start_balance, rows, closing_balance)
+
+    @classmethod
+    def create(cls, contract):
+        return cls(contract, contract.accountingentry_set.order_by('date', 'id'))
 
 
 def days360_eu(start_date, end_date):
@@ -0,0 +1,95 @@
+import logging
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import List
+
+from dkapp.models import Contract, InterestResult
+from dkapp.operations.interest import InterestDataRow, YearInterestBatch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class YearInterest:
+    contract: Contract
+    value: Decimal
+    calculation_rows: List[InterestDataRow]
+
+
+class YearInterestList(list):
+    """YearInterests of a call of year_interest, with the number of stored (hits) and computed (misses) ones"""
+    hits = 0
+    misses = 0
+
+
+def serialize_rows(rows: List[InterestDataRow]):
+    return [
+        {
+            'date': row.date.isoformat(),
+            'label': row.label,
+            'amount': str(row.amount),
+            'interest_rate': str(row.interest_rate),
+            'days_left_in_year': row.days_left_in_year,
+            'fraction_of_year': str(row.fraction_of_year),
+            'interest': str(row.interest),
+        } for row in rows
+    ]
+
+
+def deserialize_rows(data) -> List[InterestDataRow]:
+    return [
+        InterestDataRow(
+            date=date.fromisoformat(row['date']),
+            label=row['label'],
+            amount=Decimal(row['amount']),
+            interest_rate=Decimal(row['interest_rate']),
+            days_left_in_year=row['days_left_in_year'],
+            fraction_of_year=Decimal(row['fraction_of_year']),
+            interest=Decimal(row['interest']),
+        ) for row in data
+    ]
+
+
+def year_interest(contracts, year) -> YearInterestList:
+    """Interest of the contracts for year, from stored results where possible
+
+    Missing results are computed with YearInterestBatch and stored.
+    """
+    contracts = list(contracts)
+    stored = {
+        result.contract_id: result
+        for result in InterestResult.objects.filter(
+            year=year,
+            contract_id__in=[contract.id for contract in contracts],
+        )
+    }
+    missing = [contract for contract in contracts if contract.id not in stored]
+    logger.debug('interest %s: %d stored, %d computed', year, len(contracts) - len(missing), len(missing))
+
+    computed = {}
+    if missing:
+        computed = {
+            processor.contract.id: processor
+            for processor in YearInterestBatch(missing, year).processors
+        }
+        InterestResult.objects.bulk_create([
+            InterestResult(
+                contract_id=contract_id,
+                year=year,
+                interest=processor.value,
+                rows=serialize_rows(processor.calculation_rows),
+            ) for contract_id, processor in computed.items()
+        ], batch_size=500, ignore_conflicts=True)
+
+    results = YearInterestList()
+    results.hits = len(contracts) - len(missing)
+    results.misses = len(missing)
+    for contract in contracts:
+        if contract.id in computed:
+            processor = computed[contract.id]
+            results.append(YearInterest(contract, processor.value, processor.calculation_rows))
+        else:
+            result = stored[contract.id]
+            results.append(YearInterest(contract, result.interest, deserialize_rows(result.rows)))
+    return results
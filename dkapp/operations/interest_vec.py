@@ -0,0 +1,132 @@
+"""Vectorized EU 30/360 interest for many bookings at once
+
+Works on numpy columns instead of one booking at a time:
+
+- dates as int arrays of years, months and days (see `split_dates` and
+  `split_ordinals`)
+- amounts in integer cents (see `to_cents`)
+- interest rates in integer units of 0.0001, i.e. the four decimal places of
+  ContractVersion.interest_rate (see `to_rate_e4`)
+
+The interest is computed exactly in integer arithmetic and rounded half-even
+to cents like InterestProcessor does.
+"""
+from datetime import date
+from decimal import Decimal
+from fractions import Fraction
+
+import numpy as np
+
+# cents = amount_cents * rate_e4 * days / (360 * 10000)
+_DENOMINATOR = 360 * 10000
+
+# InterestProcessor multiplies with Decimal(days/360), the binary float next to
+# days/360. When the exact result is a half cent, that float decides the
+# rounding direction: +1 rounds away from zero, -1 towards zero, 0 (exact
+# fractions) half-even.
+_TIE_DIRECTION = np.array([
+    (Fraction(days / 360) > Fraction(days, 360)) - (Fraction(days / 360) < Fraction(days, 360))
+    for days in range(361)
+], dtype=np.int64)
+
+# Below this |amount_cents * rate_e4| the float error of the per-row engine is
+# too small to move a result across a rounding boundary (one billion euros at
+# 2%), so the results are identical.
+MAX_AMOUNT_RATE_PRODUCT = 2 * 10**13
+_MAX_AMOUNT_CENTS = 10**12
+
+# day 0 of datetime64[D]
+_ORDINAL_1970 = date(1970, 1, 1).toordinal()
+
+
+def split_dates(dates):
+    """Years, months and days of an iterable of dates as int arrays"""
+    triples = np.array([(d.year, d.month, d.day) for d in dates], dtype=np.int64).reshape(-1, 3)
+    return triples[:, 0], triples[:, 1], triples[:, 2]
+
+
+def split_ordinals(ordinals):
+    """Years, months and days of proleptic Gregorian ordinals (date.toordinal())"""
+    days = np.asarray(ordinals, dtype=np.int64) - _ORDINAL_1970
+    datetimes = days.astype('datetime64[D]')
+    years = datetimes.astype('datetime64[Y]')
+    months = datetimes.astype('datetime64[M]')
+    return (
+        years.astype(np.int64) + 1970,
+        (months - years).astype(np.int64) + 1,
+        (datetimes - months).astype(np.int64) + 1,
+    )
+
+
+def to_cents(amounts):
+    """Decimal amounts in euros as int64 cents, raising ValueError for fractions of cents"""
+    return _to_units(amounts, 2)
+
+
+def to_rate_e4(interest_rates):
+    """Decimal interest rates as int64 multiples of 0.0001"""
+    return _to_units(interest_rates, 4)
+
+
+def _to_units(values, places):
+    units = []
+    for value in values:
+        scaled = Decimal(value).scaleb(places)
+        if scaled != scaled.to_integral_value():
+            raise ValueError(f"{value} has more than {places} decimal places")
+        units.append(int(scaled))
+    return np.array(units, dtype=np.int64)
+
+
+def days360_eu(start, end):
+    """Days between start and end (triples of arrays) after the European 30/360 method"""
+    start_year, start_month, start_day = (np.asarray(part, dtype=np.int64) for part in start)
+    end_year, end_month, end_day = (np.asarray(part, dtype=np.int64) for part in end)
+    start_day = np.minimum(start_day, 30)
+    end_day = np.minimum(end_day, 30)
+    return (end_year - start_year) * 360 + (end_month - start_month) * 30 + (end_day - start_day)
+
+
+def days_left_in_year(dates, year):
+    """30/360 days from dates (triple of arrays) to December 31st of year"""
+    return days360_eu(dates, (year, 12, 31))
+
+
+def interest_cents(amount_cents, rate_e4, days_left):
+    """Interest in cents for amounts held for days_left of a 360 day year
+
+    Rounded half-even to cents, exactly as InterestProcessor rounds
+    amount * Decimal(days_left/360) * interest_rate.
+    """
+    amount_cents = np.asarray(amount_cents, dtype=np.int64)
+    rate_e4 = np.asarray(rate_e4, dtype=np.int64)
+    days_left = np.asarray(days_left, dtype=np.int64)
+    if np.any((days_left < 0) | (days_left > 360)):
+        raise ValueError("days_left must be between 0 and 360")
+    if np.any(np.abs(amount_cents) >= _MAX_AMOUNT_CENTS):
+        raise ValueError("amount too large for exact interest calculation")
+    if np.any(np.abs(amount_cents * rate_e4) >= MAX_AMOUNT_RATE_PRODUCT):
+        raise ValueError("amount and interest rate too large for exact interest calculation")
+
+    numerator = amount_cents * rate_e4 * days_left
+    quotient, remainder = np.divmod(np.abs(numerator), _DENOMINATOR)
+    twice_remainder = 2 * remainder
+    tie_direction = _TIE_DIRECTION[days_left]
+    round_up = (twice_remainder > _DENOMINATOR) | (
+        (twice_remainder == _DENOMINATOR) & (
+            (tie_direction > 0) | ((tie_direction == 0) & (quotient % 2 == 1))
+        )
+    )
+    return np.sign(numerator) * (quotient + round_up)
+
+
+def year_interest_cents(dates, amount_cents, rate_e4, year):
+    """Interest in cents of bookings on dates until the end of year"""
+    return interest_cents(amount_cents, rate_e4, days_left_in_year(dates, year))
+
+
+def sum_per_group(values, groups, group_count):
+    """Exact int64 sums of values per group index, e.g. interest per contract"""
+    sums = np.zeros(group_count, dtype=np.int64)
+    np.add.at(sums, np.asarray(groups, dtype=np.int64), np.asarray(values, dtype=np.int64))
+    return sums
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from dkapp.models import Job
+from dkapp.operations import pdf_cache
+
+
+class ProgressReporter:
+    """ReportLab progress callback writing the fraction of built flowables to a job
+
+    Saves at most every `interval` seconds, so big documents don't turn into
+    thousands of updates.
+    """
+
+    def __init__(self, job, interval=1.0):
+        self.job = job
+        self.interval = interval
+        self.total = 0
+        self.last_save = 0
+
+    def __call__(self, typ, value):
+        if typ == 'SIZE_EST':
+            self.total = value
+        elif typ == 'PROGRESS' and self.total:
+            now = time.monotonic()
+            if now - self.last_save >= self.interval:
+                self.last_save = now
+                self.job.set_progress(min(value / self.total, 1))
+
+
+class Heartbeat:
+    """Thread sending the heartbeat of a job every `interval` seconds while the job runs
+
+    Progress is only reported while ReportLab lays out pages; the heartbeat
+    also covers building the report, merging and storing the PDF, so a long
+    job is not taken for stale.
+    """
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = settings.JOB_HEARTBEAT_SECONDS if interval is None else interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    self.job.heartbeat()
+                except DatabaseError:
+                    # e.g. the database is locked, the next beat tries again
+                    pass
+        finally:
+            # the connections of this thread
+            connections.close_all()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def interest_pdf(job, progress, output):
+    year = job.params['year']
+    today = job.params['today']
+    # the key is taken before rendering, a change in between makes it unreachable
+    cache_key = pdf_cache.key(job.kind, year, today)
+    pdf_cache.render(job.kind, year, today, output, progress)
+    output.flush()
+    pdf_cache.store(cache_key, output.name)
+    pdf_cache.prune()
+
+
+# job kind -> (function(job, progress callback, output file), filename)
+JOB_KINDS = {
+    'overview': (interest_pdf, 'overview.pdf'),
+    'thanks': (interest_pdf, 'thanks.pdf'),
+    'letter': (interest_pdf, 'letter.pdf'),
+}
+
+
+def run_job(job):
+    """Execute a claimed job and store its file, marking it done or failed
+
+    Returns False if the job was requeued meanwhile.
+    Every run writes its own file, so a run that was requeued meanwhile
+    neither overwrites the file nor the status of the newer one.
+    """
+    file_path = None
+    try:
+        function, filename = JOB_KINDS[job.kind]
+        os.makedirs(settings.JOB_OUTPUT_DIR, exist_ok=True)
+        descriptor, file_path = tempfile.mkstemp(
+            dir=settings.JOB_OUTPUT_DIR, prefix=f'{job.id}-', suffix=f'-{filename}',
+        )
+        os.close(descriptor)
+        # the generators write straight into the file, opened by name as they read output.name
+        with Heartbeat(job), open(file_path, 'wb') as output:
+            function(job, ProgressReporter(job), output)
+    except Exception:
+        job.status = Job.Status.FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.status = Job.Status.DONE
+        job.progress = 1
+        job.file_path = file_path
+        job.filename = filename
+    finished = job.finish()
+    if file_path and (not finished or job.status != Job.Status.DONE):
+        os.remove(file_path)
+    if not finished:
+        # requeued meanwhile, the job shows the state of the newer run
+        job.refresh_from_db()
+    return finished
+
+
+def delete_old_jobs(max_age):
+    """Delete jobs finished more than max_age (a timedelta) ago with their files
+
+    Files in JOB_OUTPUT_DIR as old that belong to no job (e.g. of crashed
+    runs) are deleted as well. Returns the number of deleted jobs and files.
+    """
+    cutoff = timezone.now() - max_age
+    old_jobs = Job.objects.filter(status__in=[Job.Status.DONE, Job.Status.FAILED], finished_at__lt=cutoff)
+    deleted_jobs, _ = old_jobs.delete()
+    file_paths = Job.objects.exclude(file_path='').values_list('file_path', flat=True)
+    kept = {os.path.basename(file_path) for file_path in file_paths}
+    deleted_files = 0
+    try:
+        entries = list(os.scandir(settings.JOB_OUTPUT_DIR))
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        if entry.is_file() and entry.name not in kept and entry.stat().st_mtime < cutoff.timestamp():
+            os.remove(entry.path)
+            deleted_files += 1
+    return deleted_jobs, deleted_files
@@ -0,0 +1,86 @@
+"""Paging by key (seek) instead of by offset
+
+A page is read as the rows following the key of the last row of the page
+before, ordered by the fields of the key. With an index on these fields the
+database starts right at the cursor, however far back the page is. The key
+has to be unique, so it ends with `id`; `-field` sorts descending.
+"""
+import base64
+import binascii
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values), cls=DjangoJSONEncoder).encode()).decode()
+
+
+def decode_cursor(cursor, key):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        raise CursorError('Ungültiger Cursor')
+    if not isinstance(values, list) or len(values) != len(key):
+        raise CursorError('Ungültiger Cursor')
+    return values
+
+
+def field_names(key):
+    return [field.lstrip('-') for field in key]
+
+
+def reverse_key(key):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in key]
+
+
+def follows(field, value, strict=True):
+    if field.startswith('-'):
+        return Q(**{f'{field[1:]}__{"lt" if strict else "lte"}': value})
+    return Q(**{f'{field}__{"gt" if strict else "gte"}': value})
+
+
+def after(key, values):
+    """Condition for the rows following the row with values in the order of key"""
+    names = field_names(key)
+    condition = Q()
+    for index in range(len(key)):
+        condition |= Q(follows(key[index], values[index]), **dict(zip(names[:index], values[:index])))
+    # the redundant range on the first field lets the database use the index
+    return follows(key[0], values[0], strict=False) & condition
+
+
+def key_values(obj, key):
+    values = []
+    for name in field_names(key):
+        value = obj
+        for attribute in name.split('__'):
+            value = getattr(value, attribute)
+        values.append(value)
+    return values
+
+
+class KeysetPage:
+    """At most `size` objects of queryset in the order of key, after or before a cursor"""
+
+    def __init__(self, queryset, key, size, after_cursor=None, before_cursor=None):
+        backwards = bool(before_cursor)
+        cursor = before_cursor if backwards else after_cursor
+        order = reverse_key(key) if backwards else list(key)
+        queryset = queryset.order_by(*order)
+        if cursor:
+            queryset = queryset.filter(after(order, decode_cursor(cursor, key)))
+        objects = list(queryset[:size + 1])
+        more = len(objects) > size
+        self.object_list = objects[:size]
+        if backwards:
+            self.object_list.reverse()
+        self.has_next = bool(self.object_list) and (more if not backwards else True)
+        self.has_previous = bool(self.object_list) and (bool(cursor) if not backwards else more)
+        self.next_cursor = encode_cursor(key_values(self.object_list[-1], key)) if self.has_next else None
+        self.previous_cursor = encode_cursor(key_values(self.object_list[0], key)) if self.has_previous else None
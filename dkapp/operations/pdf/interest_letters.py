@@ -1,8 +1,15 @@
-import copy
 import io
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
 
+import django
+from pypdf import PdfReader, PdfWriter
+
+from reportlab.pdfgen.canvas import Canvas
 from reportlab.platypus import (
+    Flowable,
     Frame,
+    LayoutError,
     SimpleDocTemplate,
     Paragraph,
     HRFlowable,
@@ -12,7 +19,7 @@ from reportlab.platypus import (
     TableStyle,
 )
 from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.units import cm
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.enums import TA_RIGHT
@@ -22,101 +29,173 @@ from dkapp.operations.reports import InterestTransferListReport
 from django.contrib.staticfiles.storage import staticfiles_storage
 
 from dkapp.templatetags.my_filters import euro, fraction
-from .util import get_image, interest_year_table, get_custom_texts
+from .util import (
+    FormFlowable,
+    TextLine,
+    TextSlot,
+    get_image,
+    interest_year_table,
+    get_custom_texts,
+    rewind,
+    spooled_output,
+)
+
+
+LIGHTGREY = colors.Color(0.8, 0.8, 0.8)
+GREY = colors.Color(0.5, 0.5, 0.5)
+DARKGREY = colors.Color(0.2, 0.2, 0.2)
+
+# Shared by all generators, don't modify
+_SAMPLE_STYLES = getSampleStyleSheet()
+STYLE_H2 = ParagraphStyle('LetterHeading2', parent=_SAMPLE_STYLES['Heading2'])
+STYLE_N = ParagraphStyle('LetterNormal', parent=_SAMPLE_STYLES['Normal'], fontName='Helvetica', fontSize=12, leading=14)
+STYLE_NR = ParagraphStyle('LetterNormalRight', parent=STYLE_N, alignment=TA_RIGHT)
+STYLE_L = ParagraphStyle('LetterSmall', parent=STYLE_N, fontSize=8, leading=10)
+STYLE_G = ParagraphStyle('LetterGrey', parent=STYLE_L, textColor=GREY)
+STYLE_SS = ParagraphStyle('LetterSmallest', parent=STYLE_L, fontSize=6, leading=8, textColor=DARKGREY)
+BASE_TABLE_STYLE = [
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+    ('TOPPADDING', (0, 0), (-1, -1), 0),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+]
 
 
 class InterestLettersGenerator:
+    """One interest letter per contract, each ending with a page break
+
+    With `workers` > 1 the letters are split into chunks that are laid out in
+    separate processes and merged afterwards. The letters are independent and
+    every page has the same footer, so the result has the same pages in the
+    same order as the serial build.
+    """
     LOGO_WIDTH=6.5*cm
+    CHUNKS_PER_WORKER=4
+    PAGE_SIZE=A4
+    LEFT_MARGIN=1.5*cm
+    RIGHT_MARGIN=1.5*cm
+    TOP_MARGIN=1.0*cm
+    BOTTOM_MARGIN=1.5*cm
 
-    def __init__(self, report: InterestTransferListReport, year: int, today: str):
+    def __init__(self, report: InterestTransferListReport, year: int, today: str, progress=None, workers=1, output=None):
         self.snippets = get_custom_texts()
-        self.buffer = io.BytesIO()
+        self.buffer = output if output is not None else spooled_output()
         self.today = today
-        story = []
+        self.year = year
 
         self._setup_styles()
 
-        doc = SimpleDocTemplate(self.buffer, pagesize=A4)
-        doc.leftMargin = 1.5*cm
-        doc.rightMargin = 1.5*cm
-        doc.topMargin = 1.0*cm
-        doc.bottomMargin = 1.5*cm
-
-        for data in report.per_contract_data:
-            story.extend(self._header(data))
-
-            story.append(Spacer(1, 1.0*cm))
-            story.append(Paragraph(f"Kontostand Direktkreditvertrag Nr. {data.contract.number}", self.styleH2))
-
-            story.append(Spacer(1, 1.0*cm))
-            story.append(Paragraph(f"Guten Tag {data.contract.contact.name}, ", self.styleN))
-
-            story.append(Spacer(1, 0.3*cm))
-            story.append(Paragraph((
-                f"der Kontostand des Direktkreditvertrags Nr. {data.contract.number} beträgt heute, "
-                f" am {today} {euro(data.contract.balance)}. "
-                ), self.styleN))
-            story.append(Paragraph(f"Die Zinsen für das Jahr {year} berechnen sich wie folgt:", self.styleN))
-            story.append(Spacer(1, 0.3*cm))
-            story.append(interest_year_table(data.interest_rows, narrow=True))
-            story.append(Spacer(1, 0.3*cm))
-            story.append(Paragraph(f"<b>Zinsen {year}:</b> {euro(data.interest)}", self.styleN))
-            story.append(Spacer(1, 0.5*cm))
-            story.append(Paragraph((
-                "Wir werden die Zinsen in den nächsten Tagen auf das im Vertrag angegebene Konto "
-                "überweisen. Bitte beachten Sie, dass Sie sich selbst um die Abführung von "
-                "Kapitalertragssteuer und Solidaritätszuschlag kümmern sollten, da wir das nicht "
-                "übernehmen können. "
-                ), self.styleN))
-            story.append(Spacer(1, 0.5*cm))
-            story.append(Paragraph("Vielen Dank!", self.styleN))
-            story.append(Spacer(1, 1.5*cm))
-            story.append(Paragraph("Mit freundlichen Grüßen", self.styleN))
-            story.append(Spacer(1, 1.0*cm))
-            story.append(Paragraph(self.snippets['your_name'], self.styleN))
-            story.append(Paragraph(f"für die {self.snippets['gmbh_name']}", self.styleN))
-            story.append(Spacer(1, 0.3*cm))
-
-            story.append(PageBreak())
+        letters = report.per_contract_data
+        if workers > 1 and len(letters) > 1:
+            self._build_parallel(letters, workers, progress)
+        else:
+            self._build(letters, progress)
+        rewind(self.buffer)
+
+    def _build(self, letters, progress=None):
+        doc = SimpleDocTemplate(self.buffer, pagesize=self.PAGE_SIZE)
+        if progress:
+            doc.setProgressCallBack(progress)
+        doc.leftMargin = self.LEFT_MARGIN
+        doc.rightMargin = self.RIGHT_MARGIN
+        doc.topMargin = self.TOP_MARGIN
+        doc.bottomMargin = self.BOTTOM_MARGIN
 
+        story = []
+        for data in letters:
+            story.extend(self._letter(data))
 
         doc.build(story, onFirstPage=self._draw_footer, onLaterPages=self._draw_footer)
-        self.buffer.seek(0)
 
-    def _setup_styles(self):
-        self.lightgrey = colors.Color(0.8, 0.8, 0.8)
-        self.grey = colors.Color(0.5, 0.5, 0.5)
-        self.darkgrey = colors.Color(0.2, 0.2, 0.2)
+    def _build_parallel(self, letters, workers, progress=None):
+        chunk_count = min(len(letters), workers * self.CHUNKS_PER_WORKER)
+        chunk_size = -(-len(letters) // chunk_count)
+        chunks = [letters[start:start + chunk_size] for start in range(0, len(letters), chunk_size)]
+        if progress:
+            progress('SIZE_EST', len(chunks))
 
-        styles = getSampleStyleSheet()
+        writer = PdfWriter()
+        # the processes only lay out the letters, all data is passed along, so
+        # spawned processes just need the settings
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            rendered_chunks = executor.map(
+                render_letters,
+                chunks,
+                [self.year] * len(chunks),
+                [self.today] * len(chunks),
+                [type(self)] * len(chunks),
+            )
+            for number, pdf in enumerate(rendered_chunks, start=1):
+                writer.append(PdfReader(io.BytesIO(pdf)))
+                if progress:
+                    progress('PROGRESS', number)
+        writer.write(self.buffer)
 
-        self.styleH2 = copy.deepcopy(styles['Heading2'])
+    def _letter(self, data):
+        year = self.year
+        today = self.today
+        story = []
+        story.extend(self._header(data))
 
-        self.styleN = copy.deepcopy(styles['Normal'])
-        self.styleN.fontName = 'Helvetica'
-        self.styleN.fontSize = 12
-        self.styleN.leading = 14
+        story.append(Spacer(1, 1.0*cm))
+        story.append(self._paragraph(f"Kontostand Direktkreditvertrag Nr. {data.contract.number}", self.styleH2))
 
-        self.styleNR = copy.deepcopy(self.styleN)
-        self.styleNR.alignment = TA_RIGHT
+        story.append(Spacer(1, 1.0*cm))
+        story.append(self._paragraph(f"Guten Tag {data.contract.contact.name}, ", self.styleN))
 
-        self.styleL = copy.deepcopy(self.styleN)
-        self.styleL.fontSize = 8
-        self.styleL.leading = 10
+        story.append(Spacer(1, 0.3*cm))
+        story.append(self._paragraph((
+            f"der Kontostand des Direktkreditvertrags Nr. {data.contract.number} beträgt heute, "
+            f" am {today} {euro(data.contract.balance)}. "
+            ), self.styleN))
+        story.append(self._static_paragraph(f"Die Zinsen für das Jahr {year} berechnen sich wie folgt:", self.styleN))
+        story.append(Spacer(1, 0.3*cm))
+        story.append(interest_year_table(data.interest_rows, narrow=True))
+        story.append(Spacer(1, 0.3*cm))
+        story.append(self._paragraph(f"<b>Zinsen {year}:</b> {euro(data.interest)}", self.styleN))
+        story.append(Spacer(1, 0.5*cm))
+        story.append(self._static_paragraph((
+            "Wir werden die Zinsen in den nächsten Tagen auf das im Vertrag angegebene Konto "
+            "überweisen. Bitte beachten Sie, dass Sie sich selbst um die Abführung von "
+            "Kapitalertragssteuer und Solidaritätszuschlag kümmern sollten, da wir das nicht "
+            "übernehmen können. "
+            ), self.styleN))
+        story.append(Spacer(1, 0.5*cm))
+        story.append(self._static_paragraph("Vielen Dank!", self.styleN))
+        story.append(Spacer(1, 1.5*cm))
+        story.append(self._static_paragraph("Mit freundlichen Grüßen", self.styleN))
+        story.append(Spacer(1, 1.0*cm))
+        story.append(self._static_paragraph(self.snippets['your_name'], self.styleN))
+        story.append(self._static_paragraph(f"für die {self.snippets['gmbh_name']}", self.styleN))
+        story.append(Spacer(1, 0.3*cm))
 
-        self.styleG = copy.deepcopy(self.styleL)
-        self.styleG.textColor = self.grey
+        story.append(PageBreak())
+        return story
 
-        self.styleSS = copy.deepcopy(self.styleL)
-        self.styleSS.fontSize = 6
-        self.styleSS.leading = 8
-        self.styleSS.textColor = self.darkgrey
-        self.base_table_style = [
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-            ('TOPPADDING', (0, 0), (-1, -1), 0),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ]
+    def _paragraph(self, text, style):
+        """Paragraph of text that differs from letter to letter"""
+        return Paragraph(text, style)
+
+    def _static_paragraph(self, text, style):
+        """Paragraph of text that is the same in every letter"""
+        return Paragraph(text, style)
+
+    def _address_lines(self, data):
+        """Name, street and town of the recipient"""
+        address_lines = data.contract.contact.address.split(',')
+        return [data.contract.contact.name, address_lines[0], address_lines[1]]
+
+    def _setup_styles(self):
+        self.lightgrey = LIGHTGREY
+        self.grey = GREY
+        self.darkgrey = DARKGREY
+        self.styleH2 = STYLE_H2
+        self.styleN = STYLE_N
+        self.styleNR = STYLE_NR
+        self.styleL = STYLE_L
+        self.styleG = STYLE_G
+        self.styleSS = STYLE_SS
+        self.base_table_style = BASE_TABLE_STYLE
 
     def _header(self, data):
         header = []
@@ -144,15 +223,15 @@ class InterestLettersGenerator:
         right_table_style = TableStyle([
             *self.base_table_style,
         ])
-        address_lines = data.contract.contact.address.split(',')
+        name, street, town = self._address_lines(data)
         left_column = Table([
             [Spacer(1, 1.7*cm)],
             [Paragraph(f"{self.snippets['gmbh_name']} - {self.snippets['street_no']} - {self.snippets['zipcode']} {self.snippets['city']}", self.styleSS)],
             [Spacer(1, 0.5*cm)],
-            [Paragraph(data.contract.contact.name, self.styleN)],
-            [Paragraph(address_lines[0], self.styleN)],
+            [self._paragraph(name, self.styleN)],
+            [self._paragraph(street, self.styleN)],
             [Spacer(1, 0.3*cm)],
-            [Paragraph(address_lines[1], self.styleN)],
+            [self._paragraph(town, self.styleN)],
             ], style=left_table_style, colWidths='*')
         right_column = Table([
             [Paragraph("<i>Projekt im Mietshäuser Syndikat</i>", self.styleL)],
@@ -204,3 +283,154 @@ class InterestLettersGenerator:
             ]
         ], style=table_style, colWidths='*'))
         Frame(1.5*cm, 0.5*cm, 18*cm, 2*cm).addFromList(footer, canvas)
+
+
+class CanvasInterestLettersGenerator(InterestLettersGenerator):
+    """The letters of InterestLettersGenerator, drawn with less work per letter
+
+    The footer, the letterhead and the text that is the same in every letter
+    are drawn once into form XObjects, which every page just references.
+    Name and address are filled into the letterhead and the other single
+    line texts are drawn straight onto the canvas. The letters still flow
+    through frames of the same size as in the document template, so the
+    interest table and the closing text break across pages exactly like they
+    do there.
+
+    Letters with an address that doesn't fit on one line per field get the
+    regular header.
+    """
+    FOOTER_FORM = 'InterestLetterFooter'
+    LETTERHEAD_FORM = 'InterestLetterHead'
+
+    def _build(self, letters, progress=None):
+        if not letters:
+            return super()._build(letters, progress)
+
+        canvas = Canvas(self.buffer, pagesize=self.PAGE_SIZE)
+        self._static_forms = {}
+        canvas.beginForm(self.FOOTER_FORM)
+        super()._draw_footer(canvas, None)
+        canvas.endForm()
+        self._letterhead = self._make_letterhead(canvas, letters[0])
+
+        if progress:
+            progress('SIZE_EST', len(letters))
+        frame = None
+        for number, data in enumerate(letters, start=1):
+            frame = self._draw_story(canvas, frame, self._letter(data))
+            if progress:
+                progress('PROGRESS', number)
+        canvas.save()
+
+    def _frame(self):
+        width, height = self.PAGE_SIZE
+        return Frame(
+            self.LEFT_MARGIN,
+            self.BOTTOM_MARGIN,
+            width - self.LEFT_MARGIN - self.RIGHT_MARGIN,
+            height - self.TOP_MARGIN - self.BOTTOM_MARGIN,
+        )
+
+    def _draw_story(self, canvas, frame, story):
+        """Add the flowables to frame like the document template does, returns the last frame
+
+        A new page with a new frame is started when the next flowable doesn't
+        fit and on page breaks.
+        """
+        while story:
+            flowable = story.pop(0)
+            if isinstance(flowable, PageBreak):
+                if frame is not None:
+                    canvas.showPage()
+                    frame = None
+                continue
+            if frame is None:
+                self._draw_footer(canvas, None)
+                frame = self._frame()
+            if frame.add(flowable, canvas, trySplit=1):
+                continue
+            parts = frame.split(flowable, canvas)
+            if parts:
+                if not frame.add(parts[0], canvas):
+                    raise LayoutError(f"Splitting error of {flowable.identity(60)}")
+                story[0:0] = parts[1:]
+            elif frame._atTop:
+                raise LayoutError(f"Flowable {flowable.identity(60)} too large for a page")
+            else:
+                story.insert(0, flowable)
+                canvas.showPage()
+                frame = None
+        return frame
+
+    def _make_letterhead(self, canvas, data):
+        # the header of a letter with slots instead of name and address,
+        # always drawn at the top of the first page
+        self._slots = []
+        header = super()._header(data)
+        slots, self._slots = self._slots, None
+
+        frame = self._frame()
+        top = frame._y
+        canvas.beginForm(self.LETTERHEAD_FORM)
+        frame.addFromList(header, canvas)
+        canvas.endForm()
+        return _Letterhead(self.LETTERHEAD_FORM, frame._x, frame._y, top - frame._y, slots)
+
+    def _header(self, data):
+        lines = self._address_lines(data)
+        if all(TextLine.fits(text, slot.style, slot.width) for text, slot in zip(lines, self._letterhead.slots)):
+            return [self._letterhead.fill(lines)]
+        return super()._header(data)
+
+    def _paragraph(self, text, style):
+        if getattr(self, '_slots', None) is not None:
+            slot = TextSlot(style)
+            self._slots.append(slot)
+            return slot
+        return TextLine(text, style)
+
+    def _static_paragraph(self, text, style):
+        key = (text, style.name)
+        if key not in self._static_forms:
+            name = f'InterestLetterText{len(self._static_forms)}'
+            self._static_forms[key] = FormFlowable(name, Paragraph(text, style))
+        return self._static_forms[key]
+
+    def _draw_footer(self, canvas, doc):
+        canvas.doForm(self.FOOTER_FORM)
+
+
+class _Letterhead(Flowable):
+    """The letterhead form with name and address drawn into its slots"""
+
+    def __init__(self, form, x, y, height, slots, lines=None):
+        self.form = form
+        # position of the letterhead on the page
+        self.x = x
+        self.y = y
+        self.height = height
+        self.slots = slots
+        self.lines = lines
+
+    def fill(self, lines):
+        return _Letterhead(self.form, self.x, self.y, self.height, self.slots, lines)
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        return self.width, self.height
+
+    def draw(self):
+        canvas = self.canv
+        canvas.saveState()
+        # the form and the slots are in page coordinates
+        canvas.translate(-self.x, -self.y)
+        canvas.doForm(self.form)
+        for text, slot in zip(self.lines, self.slots):
+            TextLine.draw_line(canvas, *slot.position, text, slot.style)
+        canvas.restoreState()
+
+
+def render_letters(letters, year, today, generator_class=InterestLettersGenerator):
+    """PDF of some letters as bytes, runs in the processes of the parallel build"""
+    report = SimpleNamespace(per_contract_data=letters)
+    return generator_class(report=report, year=year, today=today, output=io.BytesIO()).buffer.getvalue()
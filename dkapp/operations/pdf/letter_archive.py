@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+from django.utils.text import get_valid_filename
+
+from dkapp.operations.reports import InterestTransferListReport
+
+from .interest_letters import CanvasInterestLettersGenerator
+from .thanks_letters import ThanksLettersGenerator
+
+
+def _per_contact(report: InterestTransferListReport):
+    """(contact, letters of the contact's contracts) in the order of the report"""
+    contacts = {}
+    for data in report.per_contract_data:
+        contacts.setdefault(data.contact.id, (data.contact, []))[1].append(data)
+    return contacts.values()
+
+
+def _filename(prefix, contact):
+    return get_valid_filename(f"{prefix}_{contact.last_name}_{contact.first_name}_{contact.id}") + '.pdf'
+
+
+def interest_letter_files(report: InterestTransferListReport, year: int, today: str):
+    """(filename, PDF file) with the interest letters of one contact at a time"""
+    for contact, letters in _per_contact(report):
+        generator = CanvasInterestLettersGenerator(SimpleNamespace(per_contract_data=letters), year=year, today=today)
+        yield _filename('zinsbrief', contact), generator.buffer
+
+
+def thanks_letter_files(report: InterestTransferListReport):
+    """(filename, PDF file) with the thanks letter of one contact at a time"""
+    for contact, _ in _per_contact(report):
+        yield _filename('dankesbrief', contact), ThanksLettersGenerator(contacts=[contact]).buffer
@@ -1,4 +1,3 @@
-import io
 import copy
 
 from reportlab.platypus import (
@@ -15,13 +14,13 @@ from reportlab.lib.pagesizes import A4
 from dkapp.operations.reports import InterestTransferListReport
 from dkapp.templatetags.my_filters import euro, fraction
 
-from .util import interest_year_table
+from .util import interest_year_table, rewind, spooled_output
 
 
 class OverviewGenerator:
 
-    def __init__(self, report: InterestTransferListReport, year: int, today: str):
-        self.buffer = io.BytesIO()
+    def __init__(self, report: InterestTransferListReport, year: int, today: str, progress=None, output=None):
+        self.buffer = output if output is not None else spooled_output()
         story = []
 
         styles = getSampleStyleSheet()
@@ -32,6 +31,8 @@ class OverviewGenerator:
         styleB.fontName = 'Helvetica-Bold'
 
         doc = SimpleDocTemplate(self.buffer, pagesize=A4)
+        if progress:
+            doc.setProgressCallBack(progress)
         doc.leftMargin = 1*cm
         doc.rightMargin = 1*cm
         doc.topMargin = 1*cm
@@ -50,4 +51,4 @@ class OverviewGenerator:
         story.append(Paragraph(f"SUMME ZINSEN {year}: {euro(report.sum_interest)}", styleB))
 
         doc.build(story)
-        self.buffer.seek(0)
+        rewind(self.buffer)
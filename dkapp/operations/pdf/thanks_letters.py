@@ -1,5 +1,3 @@
-import io
-
 from typing import List
 
 from reportlab.platypus import (
@@ -19,17 +17,17 @@ from reportlab.lib.pagesizes import A4, landscape
 from django.contrib.staticfiles.storage import staticfiles_storage
 
 from dkapp.operations.reports import InterestPerContract
-from .util import get_image, get_custom_texts
+from .util import get_image, get_custom_texts, rewind, spooled_output
 
 
 class ThanksLettersGenerator:
     LOGO_WIDTH=5.4*cm
     IMG_WIDTH=5.0*cm
 
-    def __init__(self, contacts: List[InterestPerContract]):
+    def __init__(self, contacts: List[InterestPerContract], progress=None, output=None):
         snippets = get_custom_texts()
 
-        self.buffer = io.BytesIO()
+        self.buffer = output if output is not None else spooled_output()
 
         story = []
         styles = getSampleStyleSheet()
@@ -43,6 +41,8 @@ class ThanksLettersGenerator:
         styleN.fontSize = 12
 
         doc = BaseDocTemplate(self.buffer, pagesize=landscape(A4))
+        if progress:
+            doc.setProgressCallBack(progress)
         doc.leftMargin = 1*cm
         doc.rightMargin = 1*cm
         doc.topMargin = 1*cm
@@ -96,4 +96,4 @@ class ThanksLettersGenerator:
             story.append(KeepTogether(frame_floatables))
 
         doc.build(story)
-        self.buffer.seek(0)
+        rewind(self.buffer)
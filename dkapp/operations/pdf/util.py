@@ -1,13 +1,19 @@
-import copy
+import io
+import os
+import tempfile
+import zipfile
 import yaml
 from typing import List
 
 from reportlab.lib import colors, utils
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.enums import TA_LEFT
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
-from reportlab.platypus import Image, TableStyle, Table, Paragraph
+from reportlab.platypus import Flowable, Image, TableStyle, Table, Paragraph
 
+from django.conf import settings
 from django.contrib.staticfiles.storage import staticfiles_storage
 
 from dkapp.operations.reports import InterestDataRow
@@ -23,20 +29,76 @@ INTEREST_TABLE_HEADERS = [
     "Zinsen",
 ]
 
+INTEREST_TABLE_WIDTHS = [2*cm, 2*cm, 2.7*cm, 1.6*cm, 4*cm, 4.3*cm, 2*cm]
+INTEREST_TABLE_WIDTHS_NARROW = [2*cm, 2*cm, 2.2*cm, 1.6*cm, 4*cm, 4.3*cm, 1.5*cm]
+
+# Shared by all tables, don't modify. Styles and table style are built once
+# at import instead of for every table.
+_SAMPLE_STYLES = getSampleStyleSheet()
+TABLE_STYLE_NORMAL = ParagraphStyle('InterestTableNormal', parent=_SAMPLE_STYLES['Normal'], fontSize=8)
+TABLE_STYLE_BOLD = ParagraphStyle(
+    'InterestTableBold',
+    parent=_SAMPLE_STYLES['Normal'],
+    fontName='Helvetica-Bold',
+    fontSize=8,
+)
+
+# Dates and numbers are plain strings drawn with the font of the paragraphs,
+# only the label may need to wrap.
 INTERST_TABLE_STYLE = TableStyle([
     ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.Color(1,1,1), colors.Color(0.95,0.95,0.95)]),
     ('GRID', (0,0), (-1,-1), 0.05, colors.grey),
+    ('FONT', (0, 1), (-1, -1), TABLE_STYLE_NORMAL.fontName, TABLE_STYLE_NORMAL.fontSize, TABLE_STYLE_NORMAL.leading),
 ])
 
-INTEREST_TABLE_WIDTHS = [2*cm, 2*cm, 2.7*cm, 1.6*cm, 4*cm, 4.3*cm, 2*cm]
-INTEREST_TABLE_WIDTHS_NARROW = [2*cm, 2*cm, 2.2*cm, 1.6*cm, 4*cm, 4.3*cm, 1.5*cm]
+
+class AssetRegistry:
+    """Custom images and text snippets of the PDFs, loaded once per process
+
+    Every entry is reloaded when the modification time of its file changes.
+    Images are handed out as one shared ImageReader per file, so the PNG is
+    decoded once and ReportLab finds the same image data (and embeds it once)
+    however often it is drawn.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def _get(self, kind, path, load):
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._entries.get((kind, path))
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, load(path))
+            self._entries[(kind, path)] = entry
+        return entry[1]
+
+    def image_reader(self, path):
+        return self._get('image', path, utils.ImageReader)
+
+    def image_size(self, path, width):
+        """Height of the image scaled to width, and width"""
+        return self._get(('size', width), path, lambda path: self._scaled_size(path, width))
+
+    def _scaled_size(self, path, width):
+        iw, ih = self.image_reader(path).getSize()
+        return width, width * ih / float(iw)
+
+    def texts(self, path):
+        return self._get('texts', path, _load_texts)
+
+    def clear(self):
+        self._entries = {}
+
+
+assets = AssetRegistry()
 
 
 def get_image(path, width=1*cm):
-    img = utils.ImageReader(path)
-    iw, ih = img.getSize()
-    aspect = ih / float(iw)
-    return Image(path, width=width, height=(width * aspect))
+    width, height = assets.image_size(path, width)
+    image = Image(path, width=width, height=height)
+    # the flowable would otherwise decode its own ImageReader when drawn
+    image._img = assets.image_reader(path)
+    return image
 
 
 def print_fonts():
@@ -45,24 +107,17 @@ def print_fonts():
 
 
 def interest_year_table(rows: List[InterestDataRow], narrow=False):
-    styles = getSampleStyleSheet()
-    styleTableN = copy.deepcopy(styles['Normal'])
-    styleTableN.fontSize = 8
-    styleTableB = copy.deepcopy(styles['Normal'])
-    styleTableB.fontName = 'Helvetica-Bold'
-    styleTableB.fontSize = 8
-    header_row = [Paragraph(text, styleTableB) for text in INTEREST_TABLE_HEADERS]
-
     return Table(
-        [header_row, *[
+        # paragraphs are changed when laid out, so every table gets its own
+        [[Paragraph(text, TABLE_STYLE_BOLD) for text in INTEREST_TABLE_HEADERS], *[
             [
-                Paragraph(row.date.strftime('%d.%m.%Y'), styleTableN),
-                Paragraph(row.label, styleTableN),
-                Paragraph(euro(row.amount), styleTableN),
-                Paragraph(fraction(row.interest_rate), styleTableN),
-                Paragraph(str(row.days_left_in_year), styleTableN),
-                Paragraph(fraction(row.fraction_of_year), styleTableN),
-                Paragraph(euro(row.interest), styleTableN),
+                row.date.strftime('%d.%m.%Y'),
+                Paragraph(row.label, TABLE_STYLE_NORMAL),
+                euro(row.amount),
+                fraction(row.interest_rate),
+                str(row.days_left_in_year),
+                fraction(row.fraction_of_year),
+                euro(row.interest),
             ]
             for row in rows
         ]],
@@ -71,8 +126,144 @@ def interest_year_table(rows: List[InterestDataRow], narrow=False):
     )
 
 
+class TextLine(Flowable):
+    """Looks like Paragraph(text, style), drawn straight onto the canvas if possible
+
+    Plain text that fits on one line of a left aligned style skips the
+    paragraph parser and line breaking. Anything else (markup, entities,
+    wrapping text) is handed to a Paragraph.
+    """
+
+    def __init__(self, text, style):
+        self.text = text
+        self.style = style
+        self._paragraph = None
+
+    @staticmethod
+    def fits(text, style, width):
+        """Whether Paragraph(text, style) would be a single plain line in width"""
+        if '<' in text or '&' in text or not text.split():
+            return False
+        if style.alignment != TA_LEFT or style.leftIndent or style.rightIndent or style.firstLineIndent:
+            return False
+        # leave a margin, Paragraph decides lines at the limit itself
+        return stringWidth(' '.join(text.split()), style.fontName, style.fontSize) < width - 0.01
+
+    @staticmethod
+    def draw_line(canvas, x, y, text, style):
+        """Draw the line of a paragraph with its lower edge at y"""
+        canvas.saveState()
+        canvas.setFillColor(style.textColor)
+        text_object = canvas.beginText(x, y + style.leading - style.fontSize)
+        text_object.setFont(style.fontName, style.fontSize, style.leading)
+        text_object.textOut(' '.join(text.split()))
+        canvas.drawText(text_object)
+        canvas.restoreState()
+
+    def wrap(self, availWidth, availHeight):
+        if self._paragraph is None and self.fits(self.text, self.style, availWidth):
+            self.width = availWidth
+            self.height = self.style.leading
+            return self.width, self.height
+        if self._paragraph is None:
+            self._paragraph = Paragraph(self.text, self.style)
+        self.width, self.height = self._paragraph.wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        if self._paragraph is None:
+            return []
+        return self._paragraph.split(availWidth, availHeight)
+
+    def draw(self):
+        if self._paragraph is None:
+            self.draw_line(self.canv, 0, 0, self.text, self.style)
+        else:
+            self._paragraph.drawOn(self.canv, 0, 0)
+
+    def getSpaceBefore(self):
+        return self.style.spaceBefore
+
+    def getSpaceAfter(self):
+        return self.style.spaceAfter
+
+
+class TextSlot(Flowable):
+    """Place of a TextLine in flowables drawn into a form, see FormFlowable
+
+    Remembers its position on the page and its width when drawn.
+    """
+
+    def __init__(self, style):
+        self.style = style
+        self.position = None
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        self.height = self.style.leading
+        return self.width, self.height
+
+    def draw(self):
+        self.position = self.canv.absolutePosition(0, 0)
+
+    def getSpaceBefore(self):
+        return self.style.spaceBefore
+
+    def getSpaceAfter(self):
+        return self.style.spaceAfter
+
+
+class FormFlowable(Flowable):
+    """A flowable drawn once into a form XObject and placed by reference afterwards
+
+    Takes up the space of the wrapped flowable, laid out at the width of the
+    first frame it is added to. Where it has to be split at the end of a
+    page, the parts of the wrapped flowable are used instead.
+    """
+    MARGIN = 1*cm
+
+    def __init__(self, name, flowable):
+        self.name = name
+        self.flowable = flowable
+        self._size = None
+        self._defined = False
+
+    def wrap(self, availWidth, availHeight):
+        if self._size is None:
+            self._availWidth = availWidth
+            self._size = self.flowable.wrap(availWidth, availHeight)
+        self.width, self.height = self._size
+        return self._size
+
+    def split(self, availWidth, availHeight):
+        return self.flowable.split(availWidth, availHeight)
+
+    def draw(self):
+        if not self._defined:
+            # the form keeps some room around the flowable for descenders
+            self.canv.beginForm(
+                self.name, -self.MARGIN, -self.MARGIN, self.width + self.MARGIN, self.height + self.MARGIN,
+            )
+            # wrapped again, splitting attempts may have reset the flowable
+            self.flowable.wrap(self._availWidth, self.height)
+            self.flowable.drawOn(self.canv, 0, 0)
+            self.canv.endForm()
+            self._defined = True
+        self.canv.doForm(self.name)
+
+    def getSpaceBefore(self):
+        return self.flowable.getSpaceBefore()
+
+    def getSpaceAfter(self):
+        return self.flowable.getSpaceAfter()
+
+
 def get_custom_texts():
-    path = staticfiles_storage.path('custom/text_snippets.yml')
+    """Parsed text snippets, shared by all generators (don't modify them)"""
+    return assets.texts(staticfiles_storage.path('custom/text_snippets.yml'))
+
+
+def _load_texts(path):
     snippets = {}
     with open(path, 'r') as stream:
         try:
@@ -80,3 +271,64 @@ def get_custom_texts():
         except yaml.YAMLError as exc:
             print(exc)
     return snippets
+
+
+class StreamSink(io.RawIOBase):
+    """Unseekable file collecting the bytes written to it until they are taken"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def spooled_output():
+    """Default output of the PDF generators
+
+    Kept in memory up to settings.PDF_SPOOL_MAX_SIZE bytes, moved to a
+    temporary file on disk above.
+    """
+    return tempfile.SpooledTemporaryFile(max_size=settings.PDF_SPOOL_MAX_SIZE)
+
+
+def rewind(output):
+    """Seek to the start of a generator output, so it can be read (if it can seek)"""
+    if output.seekable():
+        output.seek(0)
+
+
+def file_chunks(file, chunk_size=64 * 1024):
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def zip_stream(files, chunk_size=64 * 1024):
+    """ZIP archive of (filename, file object) pairs, yielded in pieces while the files are copied
+
+    The archive is written to an unseekable sink, so zipfile puts the sizes
+    behind each file and only chunk_size bytes are held in memory. PDFs are
+    compressed already and are stored as they are.
+    """
+    sink = StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, file in files:
+            with file, archive.open(filename, 'w') as entry:
+                for chunk in file_chunks(file, chunk_size):
+                    entry.write(chunk)
+                    yield sink.take()
+            yield sink.take()
+    yield sink.take()
@@ -0,0 +1,145 @@
+"""Generated interest PDFs on disk, addressed by everything they are made of
+
+The key of a PDF covers the output format, the year, the day it is printed
+on (only for the formats showing it, while the year is still running), the
+DataGeneration of contacts, contracts, versions and bookings, RENDER_VERSION
+and the hashes of the custom text snippets and images. Any change to these gives a new key, so
+stored files never need to be invalidated; `prune` removes the least
+recently used ones.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+from dkapp.models import DataGeneration
+from dkapp.operations.reports import InterestTransferListReport
+from dkapp.operations.pdf.interest_letters import CanvasInterestLettersGenerator
+from dkapp.operations.pdf.overview import OverviewGenerator
+from dkapp.operations.pdf.thanks_letters import ThanksLettersGenerator
+
+CUSTOM_FILES = ['custom/text_snippets.yml', 'custom/logo.png', 'custom/image.png']
+FORMATS = ['overview', 'thanks', 'letter']
+# formats printing the day they are made on, with the balance of that day.
+# Once the year is over the balance only changes with the data, so a PDF of
+# an earlier day is served and keeps the day it was made on.
+DATED_FORMATS = ['overview', 'letter']
+# raise when the interest calculation or the layout of the PDFs changes
+RENDER_VERSION = 1
+
+
+def render(format, year, today, output, progress=None):
+    """Write the PDF of format (overview, thanks or letter) for year to output"""
+    report = InterestTransferListReport.create(year)
+    if format == 'overview':
+        OverviewGenerator(report=report, year=year, today=today, progress=progress, output=output)
+    elif format == 'thanks':
+        contacts = [data.contact for data in report.per_contract_data]
+        ThanksLettersGenerator(contacts=contacts, progress=progress, output=output)
+    elif format == 'letter':
+        CanvasInterestLettersGenerator(
+            report=report,
+            year=year,
+            today=today,
+            progress=progress,
+            workers=settings.PDF_WORKERS,
+            output=output,
+        )
+    else:
+        raise ValueError(f"unknown PDF format {format}")
+
+
+def custom_files_hash():
+    digest = hashlib.sha256()
+    for name in CUSTOM_FILES:
+        digest.update(name.encode())
+        try:
+            with open(staticfiles_storage.path(name), 'rb') as custom_file:
+                digest.update(hashlib.sha256(custom_file.read()).digest())
+        except FileNotFoundError:
+            digest.update(b'missing')
+    return digest.hexdigest()
+
+
+def key(format, year, today):
+    dated = format in DATED_FORMATS and year >= int(today[-4:])
+    content = json.dumps([
+        format,
+        year,
+        today if dated else None,
+        DataGeneration.current(),
+        RENDER_VERSION,
+        custom_files_hash(),
+    ])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def path(cache_key):
+    return os.path.join(settings.PDF_CACHE_DIR, f'{cache_key}.pdf')
+
+
+def lookup(cache_key):
+    """Path of the stored PDF (marked as just used) or None"""
+    pdf_path = path(cache_key)
+    try:
+        os.utime(pdf_path)
+    except FileNotFoundError:
+        return None
+    return pdf_path
+
+
+def store(cache_key, source_path):
+    """Copy a finished PDF into the cache"""
+    os.makedirs(settings.PDF_CACHE_DIR, exist_ok=True)
+    with open(source_path, 'rb') as source:
+        _store_atomically(cache_key, lambda output: shutil.copyfileobj(source, output))
+
+
+def render_to_cache(format, year, today, progress=None):
+    """Path of the PDF, rendered and stored unless it is in the cache already"""
+    cache_key = key(format, year, today)
+    pdf_path = lookup(cache_key)
+    if pdf_path:
+        return pdf_path
+    os.makedirs(settings.PDF_CACHE_DIR, exist_ok=True)
+    return _store_atomically(cache_key, lambda output: render(format, year, today, output, progress))
+
+
+def _store_atomically(cache_key, write):
+    # readers never see half written files
+    descriptor, temporary_path = tempfile.mkstemp(dir=settings.PDF_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            write(output)
+        os.replace(temporary_path, path(cache_key))
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return path(cache_key)
+
+
+def prune(max_bytes=None):
+    """Delete the least recently used PDFs until the cache is at most max_bytes large
+
+    Returns the number of deleted files and the remaining size.
+    """
+    if max_bytes is None:
+        max_bytes = settings.PDF_CACHE_MAX_BYTES
+    try:
+        entries = [entry for entry in os.scandir(settings.PDF_CACHE_DIR) if entry.name.endswith('.pdf')]
+    except FileNotFoundError:
+        return 0, 0
+    entries = sorted(entries, key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in entries)
+    deleted = 0
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        total -= entry.stat().st_size
+        os.remove(entry.path)
+        deleted += 1
+    return deleted, total
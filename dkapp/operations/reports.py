@@ -1,9 +1,13 @@
+from collections import defaultdict
 from datetime import datetime, date
 from decimal import Decimal
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
 from dkapp.models import Contact, Contract, AccountingEntry
-from dkapp.operations.interest import InterestProcessor, InterestDataRow
+from dkapp.operations.interest import InterestDataRow
+from dkapp.operations.interest_cache import year_interest
 
 
 @dataclass
@@ -31,7 +35,9 @@ class AverageInterestRateReport:
 
     @classmethod
     def create(cls):
-        all_contracts = Contract.objects.order_by('number')
+        all_contracts = Contract.objects.with_summary().order_by('number').prefetch_related(
+            'contractversion_set',
+        )
         assert AccountingEntry.total_sum() == Contract.total_sum()
         sum_credit = AccountingEntry.total_sum()
         return cls(contracts=all_contracts, sum_credit=sum_credit)
@@ -49,18 +55,18 @@ class InterestTransferListReport:
     def __init__(self, year, contracts):
         self.per_contract_data = [
             InterestPerContract(
-                contract=contract,
-                contact=contract.contact,
-                interest=interest_processor.value,
-                interest_rows=interest_processor.calculation_rows,
-            ) for contract in contracts
-            if (interest_processor:=InterestProcessor(contract, year)).value > 0
+                contract=interest.contract,
+                contact=interest.contract.contact,
+                interest=interest.value,
+                interest_rows=interest.calculation_rows,
+            ) for interest in year_interest(contracts, year)
+            if interest.value > 0
         ]
         self.sum_interest = sum([data.interest for data in self.per_contract_data])
 
     @classmethod
     def create(cls, year):
-        all_contracts = Contract.objects.order_by('number').prefetch_related('contact')
+        all_contracts = Contract.objects.with_summary().order_by('number')
         return cls(year, contracts=all_contracts)
 
 
@@ -81,22 +87,94 @@ class RemainingContractsReport:
         self.more_than_five: RemainingCategory = RemainingCategory()
 
         for contract in contracts:
-            if contract.first_version.start > cutoff_date.date():
-                continue
-            balance = contract.balance_on(cutoff_date)
-            if balance == 0:
-                continue
-            remaining_years = contract.remaining_years(cutoff_date.date())
-            if remaining_years <= 1:
-                self.less_than_one.add(contract, balance)
-            elif remaining_years > 5:
-                self.more_than_five.add(contract, balance)
-            else:
-                self.between_one_and_five.add(contract, balance)
-
+            classified = self.classify(contract, cutoff_date)
+            if classified:
+                category, balance = classified
+                getattr(self, category).add(contract, balance)
+
+    @staticmethod
+    def classify(contract: Contract, cutoff_date: datetime) -> Optional[Tuple[str, Decimal]]:
+        """Name of the category of contract and its balance, None if it is not part of the report"""
+        if contract.first_version.start > cutoff_date.date():
+            return None
+        balance = contract.balance_on(cutoff_date)
+        if balance == 0:
+            return None
+        remaining_years = contract.remaining_years(cutoff_date.date())
+        if remaining_years <= 1:
+            return 'less_than_one', balance
+        if remaining_years > 5:
+            return 'more_than_five', balance
+        return 'between_one_and_five', balance
 
     @classmethod
     def create(cls, cutoff_date: datetime):
-        all_contracts = Contract.objects.order_by('number').prefetch_related('contact')
+        all_contracts = Contract.objects.order_by('number').select_related('contact').prefetch_related(
+            'contractversion_set',
+        )
         return cls(cutoff_date, contracts=all_contracts)
 
+
+@dataclass
+class EntryTotals:
+    deposits: Decimal = Decimal(0)
+    withdrawals: Decimal = Decimal(0)
+    count: int = 0
+
+    @property
+    def net(self) -> Decimal:
+        return self.deposits + self.withdrawals
+
+    def add(self, deposits: Decimal, withdrawals: Decimal, count: int) -> None:
+        self.deposits += deposits
+        self.withdrawals += withdrawals
+        self.count += count
+
+    def as_json(self):
+        return {
+            'deposits': f'{self.deposits:.2f}',
+            'withdrawals': f'{self.withdrawals:.2f}',
+            'net': f'{self.net:.2f}',
+            'count': self.count,
+        }
+
+
+class AccountingEntryTotalsReport:
+    """Deposits, withdrawals, net sum and count of bookings, in total, per category and per month
+
+    All numbers come from one query grouped by category and month.
+    """
+    def __init__(self, rows):
+        self.total = EntryTotals()
+        self.per_category: Dict[str, EntryTotals] = defaultdict(EntryTotals)
+        self.per_month: Dict[date, EntryTotals] = defaultdict(EntryTotals)
+        for row in rows:
+            values = (row['deposits'] or Decimal(0), row['withdrawals'] or Decimal(0), row['count'])
+            self.total.add(*values)
+            self.per_category[row['category']].add(*values)
+            self.per_month[row['month']].add(*values)
+        self.per_category = dict(sorted(self.per_category.items()))
+        self.per_month = dict(sorted(self.per_month.items()))
+
+    def as_json(self):
+        return {
+            'total': self.total.as_json(),
+            'per_category': [
+                {'category': category, **totals.as_json()} for category, totals in self.per_category.items()
+            ],
+            'per_month': [
+                {'month': month.strftime('%Y-%m'), **totals.as_json()} for month, totals in self.per_month.items()
+            ],
+        }
+
+    @classmethod
+    def create(cls, entries):
+        rows = entries.order_by().values(
+            category=F('contract__category'),
+            month=TruncMonth('date'),
+        ).annotate(
+            deposits=Sum('amount', filter=Q(amount__gt=0)),
+            withdrawals=Sum('amount', filter=Q(amount__lt=0)),
+            count=Count('id'),
+        )
+        return cls(rows)
@@ -0,0 +1,123 @@
+"""Search over contacts and contracts for the autocomplete fields
+
+On SQLite with FTS5 the texts live in the full text table `dkapp_search`
+(created by migration 0013), which the signals in dkapp.signals keep up to
+date. The rowid encodes the object: id * 2 for contacts, id * 2 + 1 for
+contracts. Without FTS5 the same search runs as LIKE queries on the models.
+Every word of the query has to match the start of a word (FTS5) or a part
+of a field (LIKE).
+"""
+import re
+
+from django.db import connection
+from django.db.models import CharField, Q
+from django.db.models.functions import Cast
+
+from dkapp.models import Contact, Contract
+
+TABLE = 'dkapp_search'
+KINDS = {'contact': (Contact, 0), 'contract': (Contract, 1)}
+LIMIT = 10
+
+# database name -> whether the FTS5 table exists
+_fts_enabled = {}
+
+
+def forget_table():
+    """Look for the FTS5 table again, e.g. after migrations"""
+    _fts_enabled.clear()
+
+
+def fts_enabled():
+    name = connection.settings_dict['NAME']
+    if name not in _fts_enabled:
+        _fts_enabled[name] = connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names()
+    return _fts_enabled[name]
+
+
+def contact_text(contact):
+    return ' '.join([
+        contact.first_name, contact.last_name, contact.address, contact.email,
+        contact.iban, contact.iban.replace(' ', ''),
+    ])
+
+
+def contract_text(contract):
+    return ' '.join([str(contract.number), contract.comment, contract.contact.first_name, contract.contact.last_name])
+
+
+def rowid(kind, object_id):
+    return object_id * 2 + KINDS[kind][1]
+
+
+def index(kind, objects):
+    if not fts_enabled():
+        return
+    text = contact_text if kind == 'contact' else contract_text
+    rows = [(rowid(kind, obj.id), text(obj)) for obj in objects]
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row_id,) for row_id, _ in rows])
+        cursor.executemany(f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)', rows)
+
+
+def remove(kind, object_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [rowid(kind, object_id)])
+
+
+def rebuild():
+    """Index all contacts and contracts again, after changes that sent no signals"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    index('contact', Contact.objects.iterator(chunk_size=1000))
+    index('contract', Contract.objects.select_related('contact').iterator(chunk_size=1000))
+
+
+def words(query):
+    return re.findall(r'\w+', query)[:10]
+
+
+def search(kind, query, limit=LIMIT):
+    """Ids of the contacts or contracts best matching query"""
+    if not words(query):
+        return []
+    if fts_enabled():
+        return _search_fts(kind, query, limit)
+    return _search_like(kind, query, limit)
+
+
+def _search_fts(kind, query, limit):
+    match = ' '.join(f'"{word}"*' for word in words(query))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s AND rowid %% 2 = %s ORDER BY rank LIMIT %s',
+            [match, KINDS[kind][1], limit],
+        )
+        return [row_id // 2 for row_id, in cursor.fetchall()]
+
+
+def _search_like(kind, query, limit):
+    if kind == 'contact':
+        objects = Contact.objects.order_by('last_name', 'first_name', 'id')
+        fields = ['first_name', 'last_name', 'address', 'email', 'iban']
+    else:
+        objects = Contract.objects.annotate(number_text=Cast('number', CharField())).order_by('number', 'id')
+        fields = ['number_text', 'comment', 'contact__first_name', 'contact__last_name']
+    for word in words(query):
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': word})
+        objects = objects.filter(condition)
+    return list(objects.values_list('id', flat=True)[:limit])
+
+
+def labels(kind, ids):
+    """(id, label) of the contacts or contracts in the order of ids"""
+    model = KINDS[kind][0]
+    objects = model.objects.select_related('contact') if model is Contract else model.objects
+    found = objects.in_bulk(ids)
+    return [(object_id, str(found[object_id])) for object_id in ids if object_id in found]
@@ -0,0 +1,177 @@
+from datetime import date
+from decimal import Decimal
+from io import BytesIO
+
+from model_bakery import baker
+from django.test import TestCase
+
+from dkapp.models import AccountingEntry, BalanceCheckpoint, InterestResult
+from dkapp.operations.bank_statement import (
+    BankStatementError,
+    BankTransaction,
+    ContractMatcher,
+    import_statement,
+    parse_camt053,
+    parse_csv,
+)
+
+CSV = '''Buchungstag;Valutadatum;Name Zahlungsbeteiligter;IBAN Zahlungsbeteiligter;Verwendungszweck;Betrag
+02.01.2024;02.01.2024;Erika Mustermann;DE02 1203 0000 0000 2020 51;Direktkredit 17;1.500,00
+15.01.2024;15.01.2024;Max Muster;DE44500105175407324931;Kredit;-250,50
+20.01.2024;20.01.2024;Stadtwerke;DE89370400440532013000;Abschlag 4711;-80,00
+'''
+
+CAMT = '''<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+  <BkToCstmrStmt><Stmt>
+    <Ntry>
+      <Amt Ccy="EUR">1500.00</Amt><CdtDbtInd>CRDT</CdtDbtInd>
+      <BookgDt><Dt>2024-01-02</Dt></BookgDt>
+      <NtryDtls><TxDtls>
+        <RltdPties>
+          <Dbtr><Nm>Erika Mustermann</Nm></Dbtr>
+          <DbtrAcct><Id><IBAN>DE02120300000000202051</IBAN></Id></DbtrAcct>
+        </RltdPties>
+        <RmtInf><Ustrd>Direktkredit</Ustrd><Ustrd>17</Ustrd></RmtInf>
+      </TxDtls></NtryDtls>
+    </Ntry>
+    <Ntry>
+      <Amt Ccy="EUR">250.50</Amt><CdtDbtInd>DBIT</CdtDbtInd>
+      <BookgDt><Dt>2024-01-15</Dt></BookgDt>
+      <NtryDtls><TxDtls>
+        <RltdPties>
+          <Cdtr><Nm>Max Muster</Nm></Cdtr>
+          <CdtrAcct><Id><IBAN>DE44500105175407324931</IBAN></Id></CdtrAcct>
+        </RltdPties>
+        <RmtInf><Ustrd>Kredit</Ustrd></RmtInf>
+      </TxDtls></NtryDtls>
+    </Ntry>
+  </Stmt></BkToCstmrStmt>
+</Document>
+'''
+
+
+class ParseTestCase(TestCase):
+    def test_csv(self):
+        transactions = list(parse_csv(CSV.splitlines(keepends=True)))
+
+        self.assertEqual(transactions[0], BankTransaction(
+            date=date(2024, 1, 2),
+            amount=Decimal('1500.00'),
+            iban='DE02120300000000202051',
+            name='Erika Mustermann',
+            reference='Direktkredit 17',
+        ))
+        self.assertEqual([t.amount for t in transactions], [Decimal('1500.00'), Decimal('-250.50'), Decimal('-80.00')])
+
+    def test_csv_errors(self):
+        with self.assertRaisesMessage(BankStatementError, 'amount'):
+            list(parse_csv(['Buchungstag;Verwendungszweck\n']))
+        with self.assertRaisesMessage(BankStatementError, 'Zeile 2'):
+            list(parse_csv(['Buchungstag;Betrag\n', '31.02.2024;1,00\n']))
+
+    def test_camt053(self):
+        transactions = list(parse_camt053(BytesIO(CAMT.encode())))
+
+        self.assertEqual(transactions, list(parse_csv(CSV.splitlines(keepends=True)))[:2])
+
+    def test_camt053_error(self):
+        with self.assertRaises(BankStatementError):
+            list(parse_camt053(BytesIO(b'<Document><Ntry>')))
+
+
+class ContractMatcherTestCase(TestCase):
+    def setUp(self):
+        self.matcher = ContractMatcher(
+            [(1, 17, 'DE02 1203'), (2, 18, 'DE02 1203'), (3, 19, None), (4, 2024, 'DE99'), (5, 3, 'DE98')],
+            prefixes=['Vertrag', 'DK'],
+        )
+
+    def match(self, reference, iban='', amount='1', matcher=None):
+        return (matcher or self.matcher).match(BankTransaction(date(2024, 1, 1), Decimal(amount), iban, '', reference))
+
+    def test_match(self):
+        self.assertEqual(self.match('Vertrag 19'), 3)
+        self.assertEqual(self.match('Zinsgutschrift DK-19'), 3)
+        self.assertEqual(self.match('Vertrag 17', 'DE021203'), 1)
+        # a number on its own counts for the contracts of the IBAN
+        self.assertEqual(self.match('Einzahlung 18', 'DE021203'), 2)
+        # both contracts of the IBAN are possible
+        self.assertIsNone(self.match('Einzahlung', 'DE021203'))
+        # the number belongs to another contact
+        self.assertIsNone(self.match('Vertrag 19', 'DE021203'))
+
+    def test_numbers_without_prefix_need_the_iban(self):
+        # an invoice number, a date and digits of an IBAN are no contract numbers
+        self.assertIsNone(self.match('Rechnung 2024'))
+        self.assertIsNone(self.match('Spende vom 17.03.'))
+        self.assertIsNone(self.match('RE19 DE44500105175407324931'))
+        self.assertIsNone(self.match('Miete 3', 'DE021203'))
+        self.assertEqual(self.match('Rechnung 2024', 'DE99'), 4)
+
+    def test_outgoing_payments(self):
+        self.assertIsNone(self.match('Zinsen Vertrag 19', amount='-10'))
+        self.assertIsNone(self.match('Zinsen', 'DE98', amount='-10'))
+
+        matcher = ContractMatcher([(5, 3, 'DE98')], outgoing=True)
+        self.assertEqual(self.match('Rückzahlung', 'DE98', amount='-10', matcher=matcher), 5)
+
+
+class ImportStatementTestCase(TestCase):
+    def setUp(self):
+        erika = baker.make('dkapp.Contact', iban='DE02 1203 0000 0000 2020 51')
+        max_ = baker.make('dkapp.Contact', iban='de44500105175407324931')
+        self.contract = baker.make('dkapp.Contract', number=17, contact=erika)
+        self.other_contract = baker.make('dkapp.Contract', number=23, contact=max_)
+
+    def test_import(self):
+        baker.make('dkapp.InterestResult', contract=self.contract, year=2024, interest=Decimal('1'), rows=[])
+        baker.make('dkapp.InterestResult', contract=self.contract, year=2023, interest=Decimal('1'), rows=[])
+
+        result = import_statement(BytesIO(CSV.encode('utf-8-sig')), batch_size=2, outgoing=True)
+
+        self.assertEqual((result.booked, result.duplicates), (2, 0))
+        self.assertEqual([t.name for t in result.unmatched], ['Stadtwerke'])
+        self.assertEqual(
+            sorted(AccountingEntry.objects.values_list('contract_id', 'date', 'amount')),
+            [(self.contract.id, date(2024, 1, 2), Decimal('1500')),
+             (self.other_contract.id, date(2024, 1, 15), Decimal('-250.50'))],
+        )
+        self.assertEqual(
+            BalanceCheckpoint.objects.get(contract=self.contract).balance,
+            Decimal('1500'),
+        )
+        self.assertEqual(list(InterestResult.objects.values_list('year', flat=True)), [2023])
+
+    def test_outgoing_payments_stay_unmatched(self):
+        result = import_statement(BytesIO(CSV.encode()))
+
+        self.assertEqual(result.booked, 1)
+        self.assertEqual([t.name for t in result.unmatched], ['Max Muster', 'Stadtwerke'])
+        self.assertFalse(AccountingEntry.objects.filter(contract=self.other_contract).exists())
+
+    def test_reimport_books_nothing(self):
+        import_statement(BytesIO(CSV.encode()), format='csv', outgoing=True)
+
+        # the same transactions from the CAMT export of the bank
+        result = import_statement(BytesIO(CAMT.encode()), outgoing=True)
+
+        self.assertEqual((result.booked, result.duplicates), (0, 2))
+        self.assertEqual(AccountingEntry.objects.count(), 2)
+
+    def test_identical_transactions(self):
+        line = '03.01.2024;Direktkredit 17;100,00\n'
+        statement = 'Buchungstag;Verwendungszweck;Betrag\n' + line + line
+
+        self.assertEqual(import_statement(BytesIO(statement.encode())).booked, 2)
+        # a later statement containing one more of them
+        self.assertEqual(import_statement(BytesIO((statement + line).encode())).booked, 1)
+        self.assertEqual(AccountingEntry.objects.count(), 3)
+
+    def test_error_books_nothing(self):
+        statement = CSV + '21.01.2024;;;;Direktkredit 17;kein Betrag\n'
+
+        with self.assertRaisesMessage(BankStatementError, 'Zeile 5'):
+            import_statement(BytesIO(statement.encode()), batch_size=1)
+
+        self.assertFalse(AccountingEntry.objects.exists())
@@ -0,0 +1,62 @@
+from datetime import date
+from decimal import Decimal
+
+from model_bakery import baker
+from django.test import TestCase
+
+from dkapp.models import AccountingEntry, BalanceCheckpoint, InterestResult
+from dkapp.operations.booking_batch import BookingBatch, BookingBatchError
+
+
+class BookingBatchTestCase(TestCase):
+    def setUp(self):
+        self.contract = baker.make('dkapp.Contract', number=17)
+        self.other_contract = baker.make('dkapp.Contract', number=18)
+
+    def test_create_and_update(self):
+        entry = AccountingEntry.objects.create(contract=self.contract, date=date(2023, 5, 1), amount=Decimal('100'))
+        baker.make('dkapp.InterestResult', contract=self.contract, year=2023, interest=Decimal('1'), rows=[])
+
+        results = BookingBatch([
+            {'contract': self.contract.id, 'date': '2024-01-02', 'amount': '50.25'},
+            {'contract_number': 18, 'date': '2024-01-03', 'amount': 1000},
+            {'id': entry.id, 'contract': self.other_contract.id, 'date': '2023-06-01', 'amount': '-20'},
+        ]).save()
+
+        self.assertEqual([result['status'] for result in results], ['created', 'created', 'updated'])
+        self.assertEqual(results[2]['id'], entry.id)
+        self.assertEqual(AccountingEntry.objects.get(id=results[1]['id']).contract, self.other_contract)
+        entry.refresh_from_db()
+        self.assertEqual((entry.contract, entry.date, entry.amount), (self.other_contract, date(2023, 6, 1), Decimal('-20')))
+        self.assertEqual(
+            list(BalanceCheckpoint.objects.order_by('contract_id', 'date').values_list('contract_id', 'date', 'balance')),
+            [(self.contract.id, date(2024, 1, 2), Decimal('50.25')),
+             (self.other_contract.id, date(2023, 6, 1), Decimal('-20')),
+             (self.other_contract.id, date(2024, 1, 3), Decimal('980'))],
+        )
+        # the booking moved away from the contract in 2023
+        self.assertFalse(InterestResult.objects.exists())
+
+    def test_invalid_rows_save_nothing(self):
+        entry = AccountingEntry.objects.create(contract=self.contract, date=date(2023, 5, 1), amount=Decimal('100'))
+        baker.make('dkapp.Contract', number=18)
+
+        with self.assertRaises(BookingBatchError) as context:
+            BookingBatch([
+                {'contract': self.contract.id, 'date': '2024-01-02', 'amount': '50'},
+                {'contract_number': 18, 'date': '2024-02-30', 'amount': 0.1},
+                {'contract': 999, 'amount': '1.234'},
+                {'id': entry.id, 'contract': self.contract.id, 'date': '2024-01-02', 'amount': '5'},
+                {'id': entry.id, 'contract': self.contract.id, 'date': '2024-01-02', 'amount': '6'},
+                'Buchung',
+            ]).save()
+
+        results = context.exception.results
+        self.assertEqual(results[0], {'index': 0})
+        self.assertEqual(sorted(results[1]['errors']), ['amount', 'contract', 'date'])
+        self.assertIn('nicht eindeutig', results[1]['errors']['contract'][0])
+        self.assertEqual(sorted(results[2]['errors']), ['amount', 'contract', 'date'])
+        self.assertEqual(results[3], {'index': 3})
+        self.assertIn('mehrfach', results[4]['errors']['id'][0])
+        self.assertEqual(results[5]['status'], 'error')
+        self.assertEqual(AccountingEntry.objects.get().amount, Decimal('100'))
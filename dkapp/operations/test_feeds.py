@@ -0,0 +1,96 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from model_bakery import baker
+from django.http import QueryDict
+from django.test import TestCase
+
+from dkapp.models import ContractVersion, AccountingEntry
+from dkapp.operations.feeds import (
+    AccountingEntryFeed,
+    AverageInterestRateFeed,
+    ContractFeed,
+    FeedError,
+    InterestTransferListFeed,
+    RemainingContractsFeed,
+)
+from dkapp.operations.reports import AverageInterestRateReport, InterestTransferListReport, RemainingContractsReport
+
+
+def page(feed_class, query=''):
+    rows, next_cursor = feed_class(QueryDict(query)).page()
+    return list(rows), next_cursor
+
+
+class FeedTestCase(TestCase):
+    def setUp(self):
+        for number, amount, years in [(3, '1000', 1), (1, '500', 4), (2, '2000', 10)]:
+            contract = baker.make('dkapp.Contract', number=number)
+            ContractVersion.objects.create(
+                start=date(2019, 2, 10),
+                duration_years=years,
+                interest_rate=Decimal('0.01'),
+                version=1,
+                contract=contract,
+            )
+            for day in [1, 2]:
+                AccountingEntry.objects.create(date=date(2019, 5, day), amount=Decimal(amount), contract=contract)
+
+    def test_paging(self):
+        rows, cursor = page(AccountingEntryFeed, 'limit=4')
+        self.assertEqual([(row['date'], row['id']) for row in rows], [
+            (date(2019, 5, 1), 1), (date(2019, 5, 1), 3), (date(2019, 5, 1), 5), (date(2019, 5, 2), 2),
+        ])
+        rows, cursor = page(AccountingEntryFeed, f'limit=4&cursor={cursor}')
+        self.assertEqual([row['id'] for row in rows], [4, 6])
+        self.assertIsNone(cursor)
+
+    def test_paging_without_rest(self):
+        rows, cursor = page(ContractFeed, 'limit=3')
+        self.assertEqual([row['number'] for row in rows], [1, 2, 3])
+        self.assertIsNone(cursor)
+
+    def test_fields_and_filters(self):
+        rows, cursor = page(AccountingEntryFeed, 'fields=contract_number,amount&from=2019-05-02')
+
+        self.assertEqual(rows[0], {'contract_number': 3, 'amount': Decimal('1000')})
+        self.assertEqual(len(rows), 3)
+
+    def test_invalid_parameters(self):
+        for query in ['fields=number,secret', 'limit=0', 'limit=x', 'cursor=x', 'contact_id=x']:
+            with self.subTest(query), self.assertRaises(FeedError):
+                page(ContractFeed, query)
+
+    def test_contracts(self):
+        rows, cursor = page(ContractFeed)
+
+        self.assertEqual(rows[0]['balance'], Decimal('1000'))
+        self.assertEqual(rows[0]['expiring'], date(2023, 2, 10))
+
+    def test_reports_match(self):
+        rows, cursor = page(InterestTransferListFeed, 'year=2019')
+        report = InterestTransferListReport.create(2019)
+        self.assertEqual(
+            [(row['contract_number'], row['interest']) for row in rows],
+            [(data.contract.number, data.interest) for data in report.per_contract_data],
+        )
+
+        rows, cursor = page(AverageInterestRateFeed)
+        report = AverageInterestRateReport.create()
+        self.assertEqual(
+            [(row['contract_number'], row['relative_interest_rate']) for row in rows],
+            [(data.contract.number, data.relative_interest_rate) for data in report.per_contract_data],
+        )
+        self.assertEqual(AverageInterestRateFeed(QueryDict()).summary()['X-Average-Interest-Rate'], report.avg_interest_rate)
+
+        rows, cursor = page(RemainingContractsFeed, 'year=2022&fields=contract_number,category,balance')
+        report = RemainingContractsReport.create(datetime(2022, 12, 31))
+        self.assertEqual(
+            sorted((row['category'], row['contract_number'], row['balance']) for row in rows),
+            sorted(
+                (category, contract.number, balance)
+                for category in ['less_than_one', 'between_one_and_five', 'more_than_five']
+                for contract, balance in getattr(report, category).contracts
+            ),
+        )
+        self.assertEqual([row['category'] for row in rows], ['less_than_one', 'more_than_five', 'less_than_one'])
@@ -0,0 +1,62 @@
+from datetime import date
+from decimal import Decimal
+from model_bakery import baker
+from django.test import TestCase
+from django.urls import reverse
+from dkapp.models import Contract, ContractVersion, AccountingEntry
+from dkapp.operations.forecast import CashFlowForecast
+from dkapp.operations.interest import InterestProcessor
+
+
+class CashFlowForecastTestCase(TestCase):
+    def setUp(self):
+        self.contract = baker.make('dkapp.Contract', category=Contract.Category.PRIVAT)
+        ContractVersion.objects.create(
+            start=date(2019, 2, 10),
+            duration_years=10,
+            interest_rate=Decimal('0.01'),
+            version=1,
+            contract=self.contract,
+        )
+        AccountingEntry.objects.create(date=date(2019, 2, 10), amount=Decimal('100'), contract=self.contract)
+        AccountingEntry.objects.create(date=date(2021, 7, 1), amount=Decimal('50'), contract=self.contract)
+
+    def month(self, forecast, year, month):
+        return forecast.months[(year - forecast.start.year) * 12 + month - forecast.start.month]
+
+    def test_repayment_on_expiry(self):
+        forecast = CashFlowForecast.create(10, start=date(2020, 1, 15))
+
+        self.assertEqual(len(forecast.months), 120)
+        repayment_month = self.month(forecast, 2029, 2)
+        self.assertEqual(repayment_month.repayments, {Contract.Category.PRIVAT: Decimal('150')})
+        self.assertEqual(sum(month.repayments_sum for month in forecast.months), Decimal('150'))
+
+    def test_interest_matches_interest_processor(self):
+        forecast = CashFlowForecast.create(10, start=date(2020, 1, 1))
+        years = {year.month.year: year for year in forecast.years}
+
+        for year in range(2020, 2029):
+            self.assertEqual(self.month(forecast, year, 12).interest_sum, InterestProcessor(self.contract, year).value)
+            self.assertEqual(years[year].interest_sum, InterestProcessor(self.contract, year).value)
+
+        # the final interest is paid with the repayment
+        AccountingEntry.objects.create(date=date(2029, 2, 10), amount=Decimal('-150'), contract=self.contract)
+        self.assertEqual(self.month(forecast, 2029, 2).interest_sum, InterestProcessor(self.contract, 2029).value)
+        self.assertEqual(years[2029].interest_sum, InterestProcessor(self.contract, 2029).value)
+        self.assertEqual(self.month(forecast, 2029, 12).interest_sum, Decimal('0'))
+
+    def test_expired_contract_is_repaid_in_first_month(self):
+        forecast = CashFlowForecast.create(2, start=date(2030, 3, 1))
+
+        self.assertEqual(forecast.months[0].repayments_sum, Decimal('150'))
+        self.assertGreater(forecast.months[0].interest_sum, 0)
+        self.assertEqual(sum(month.total for month in forecast.months[1:]), Decimal('0'))
+
+    def test_csv(self):
+        response = self.client.get(reverse('dkapp:contracts_forecast') + '?years=2&format=csv')
+
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 1 + 24)
+        self.assertTrue(lines[0].startswith('Monat;'))
@@ -1,9 +1,22 @@
+import csv
+import os
 from datetime import date
 from decimal import Decimal
 from model_bakery import baker
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from dkapp.models import ContractVersion, AccountingEntry
-from dkapp.operations.interest import InterestProcessor, days360_eu
+from dkapp.operations import interest_vec
+from dkapp.operations.interest import (
+    InterestProcessor,
+    ContractLedger,
+    YearInterestBatch,
+    days360_eu,
+    interest_for,
+)
+
+# interest of bookings as calculated before the year fractions were tabulated,
+# including exact half cents
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'testdata', 'interest_corpus.csv')
 
 
 class Days360euTestCase(TestCase):
@@ -16,6 +29,28 @@ class Days360euTestCase(TestCase):
         self.assertEqual(days360_eu(date(2019, 2, 28), date(2020,3, 31)), 392)
 
 
+class InterestCorpusTestCase(SimpleTestCase):
+    def setUp(self):
+        with open(CORPUS_PATH, newline='') as corpus:
+            self.rows = [
+                (Decimal(row['amount']), Decimal(row['interest_rate']), int(row['days_left']), Decimal(row['interest']))
+                for row in csv.DictReader(corpus)
+            ]
+
+    def test_interest_for(self):
+        for amount, interest_rate, days_left, interest in self.rows:
+            self.assertEqual(interest_for(amount, interest_rate, days_left), interest)
+
+    def test_vectorized_interest_cents(self):
+        amounts, interest_rates, days_left, interests = zip(*self.rows)
+        cents = interest_vec.interest_cents(
+            interest_vec.to_cents(amounts),
+            interest_vec.to_rate_e4(interest_rates),
+            days_left,
+        )
+        self.assertEqual(cents.tolist(), [int(interest * 100) for interest in interests])
+
+
 class InterestProcessorTestCase(TestCase):
     def setUp(self):
         self.contract = baker.make('dkapp.Contract')
@@ -136,3 +171,89 @@ class InterestProcessorTestCase(TestCase):
         self.assertEqual(self.processor.calculation_rows[1].amount, Decimal('-100'))
         self.assertEqual(self.processor.calculation_rows[2].amount, Decimal('100'))
         self.assertEqual(self.processor.value, Decimal('0.75'))
+
+
+def make_interest_contracts():
+    """Contracts covering the special cases of the interest calculation"""
+    versions = [
+        # contract starting before the year
+        [(date(2018, 3, 1), '0.01')],
+        # contract starting within the year
+        [(date(2020, 4, 15), '0.02')],
+        # interest rate changes within and at the start of the year
+        [(date(2017, 1, 1), '0.01'), (date(2020, 1, 1), '0.015'), (date(2020, 8, 31), '0.005')],
+        # contract version without change of interest rate
+        [(date(2019, 6, 1), '0.01'), (date(2020, 6, 1), '0.01')],
+        # contract starting after the year
+        [(date(2021, 2, 1), '0.01')],
+    ]
+    entries = [
+        [(date(2018, 3, 1), '1000'), (date(2020, 1, 1), '500'), (date(2020, 12, 31), '-200')],
+        [(date(2020, 4, 15), '2500.50'), (date(2020, 10, 31), '-0.50')],
+        [(date(2017, 1, 1), '3000'), (date(2020, 5, 5), '-1000'), (date(2020, 9, 1), '100')],
+        [(date(2019, 6, 1), '700'), (date(2020, 6, 1), '300')],
+        [(date(2021, 2, 1), '100')],
+    ]
+    contracts = []
+    for contract_versions, contract_entries in zip(versions, entries):
+        contract = baker.make('dkapp.Contract')
+        for number, (start, interest_rate) in enumerate(contract_versions):
+            ContractVersion.objects.create(
+                start=start,
+                duration_years=5,
+                interest_rate=Decimal(interest_rate),
+                version=number + 1,
+                contract=contract,
+            )
+        for entry_date, amount in contract_entries:
+            AccountingEntry.objects.create(date=entry_date, amount=Decimal(amount), contract=contract)
+        contracts.append(contract)
+    return contracts
+
+
+class YearInterestBatchTestCase(TestCase):
+    def setUp(self):
+        self.contracts = make_interest_contracts()
+
+    def test_same_rows_as_interest_processor(self):
+        for year in [2019, 2020, 2021]:
+            batch = YearInterestBatch(self.contracts, year)
+            for contract, batch_processor in zip(self.contracts, batch.processors):
+                processor = InterestProcessor(contract, year)
+                self.assertEqual(batch_processor.calculation_rows, processor.calculation_rows)
+                self.assertEqual(batch_processor.value, processor.value)
+
+    def test_constant_number_of_queries(self):
+        with self.assertNumQueries(3):
+            YearInterestBatch(self.contracts, 2020)
+
+
+class ContractLedgerTestCase(TestCase):
+    def setUp(self):
+        self.contracts = make_interest_contracts()
+
+    def test_same_rows_as_interest_processor(self):
+        for contract in self.contracts:
+            ledger_years = list(ContractLedger.create(contract).years(2016, 2022))
+            self.assertEqual([ledger_year.year for ledger_year in ledger_years], list(range(2016, 2023)))
+            for ledger_year in ledger_years:
+                year = ledger_year.year
+                self.assertEqual(ledger_year.closing_balance, contract.balance_on(date(year, 12, 31)))
+                if not ledger_year.calculation_rows:
+                    self.assertEqual(ledger_year.start_balance, 0)
+                    continue
+                processor = InterestProcessor(contract, year)
+                self.assertEqual(ledger_year.calculation_rows, processor.calculation_rows)
+                self.assertEqual(ledger_year.interest, processor.value)
+
+    def test_years_since_contract_start(self):
+        ledger_years = list(ContractLedger.create(self.contracts[0]).years(last_year=2020))
+
+        self.assertEqual([ledger_year.year for ledger_year in ledger_years], [2018, 2019, 2020])
+        self.assertEqual(ledger_years[-1].closing_balance, Decimal('1300'))
+
+    def test_constant_number_of_queries(self):
+        contract = self.contracts[2]
+        contract.refresh_from_db()
+        with self.assertNumQueries(2):
+            list(ContractLedger.create(contract).years(2000, 2030))
@@ -0,0 +1,90 @@
+from datetime import date
+from decimal import Decimal
+
+from model_bakery import baker
+from django.test import TestCase
+
+from dkapp.models import ContractVersion, AccountingEntry, InterestResult
+from dkapp.operations import interest_cache
+from dkapp.operations.interest import InterestProcessor
+
+
+class InterestCacheTestCase(TestCase):
+    def setUp(self):
+        self.contract = baker.make('dkapp.Contract')
+        self.version = ContractVersion.objects.create(
+            start=date(2019, 2, 10),
+            duration_years=10,
+            interest_rate=Decimal('0.01'),
+            version=1,
+            contract=self.contract,
+        )
+        self.entry = AccountingEntry.objects.create(
+            date=date(2019, 5, 5),
+            amount=Decimal('100'),
+            contract=self.contract,
+        )
+        AccountingEntry.objects.create(
+            date=date(2020, 7, 1),
+            amount=Decimal('100'),
+            contract=self.contract,
+        )
+
+    def stored_years(self):
+        return set(InterestResult.objects.values_list('year', flat=True))
+
+    def test_stored_results_are_read(self):
+        computed = interest_cache.year_interest([self.contract], 2020)
+        with self.assertNumQueries(1):
+            stored = interest_cache.year_interest([self.contract], 2020)
+
+        self.assertEqual((computed.hits, computed.misses), (0, 1))
+        self.assertEqual((stored.hits, stored.misses), (1, 0))
+        self.assertEqual(stored[0].value, Decimal('1.5'))
+        self.assertEqual(stored[0].value, computed[0].value)
+        self.assertEqual(stored[0].calculation_rows, InterestProcessor(self.contract, 2020).calculation_rows)
+
+    def test_invalidated_by_booking(self):
+        for year in [2019, 2020, 2021]:
+            interest_cache.year_interest([self.contract], year)
+
+        AccountingEntry.objects.create(date=date(2020, 3, 1), amount=Decimal('10'), contract=self.contract)
+        self.assertEqual(self.stored_years(), {2019})
+
+        self.entry.date = date(2021, 1, 5)
+        self.entry.save()
+        self.assertEqual(self.stored_years(), set())
+
+    def test_invalidated_by_booking_delete(self):
+        for year in [2019, 2020, 2021]:
+            interest_cache.year_interest([self.contract], year)
+
+        self.entry.delete()
+        self.assertEqual(self.stored_years(), set())
+
+    def test_invalidated_by_contract_version(self):
+        for year in [2019, 2020, 2021]:
+            interest_cache.year_interest([self.contract], year)
+
+        ContractVersion.objects.create(
+            start=date(2021, 2, 10),
+            duration_years=10,
+            interest_rate=Decimal('0.02'),
+            version=2,
+            contract=self.contract,
+        )
+        self.assertEqual(self.stored_years(), {2019, 2020})
+
+        self.version.interest_rate = Decimal('0.015')
+        self.version.save()
+        self.assertEqual(self.stored_years(), set())
+
+    def test_other_contracts_kept(self):
+        other_contract = baker.make('dkapp.Contract')
+        interest_cache.year_interest([self.contract, other_contract], 2020)
+
+        AccountingEntry.objects.create(date=date(2020, 3, 1), amount=Decimal('10'), contract=other_contract)
+        self.assertEqual(
+            list(InterestResult.objects.values_list('contract_id', flat=True)),
+            [self.contract.id],
+        )
@@ -0,0 +1,91 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from dkapp.operations import interest_vec
+from dkapp.operations.interest import days360_eu
+
+
+def per_row_interest(amount, interest_rate, days_left):
+    # the calculation of InterestProcessor._accounting_row
+    return round(amount * Decimal(days_left/360) * interest_rate, 2)
+
+
+class Days360euVecTestCase(SimpleTestCase):
+    def test_same_as_days360_eu(self):
+        start = date(2018, 1, 1)
+        dates = [start + timedelta(days=days) for days in range(0, 3 * 366)]
+        end = date(2020, 12, 31)
+
+        result = interest_vec.days360_eu(interest_vec.split_dates(dates), interest_vec.split_dates([end] * len(dates)))
+
+        self.assertEqual(result.tolist(), [days360_eu(d, end) for d in dates])
+
+    def test_split_ordinals(self):
+        dates = [date(1999, 12, 31), date(2020, 2, 29), date(2021, 1, 1)]
+        years, months, days = interest_vec.split_ordinals([d.toordinal() for d in dates])
+
+        self.assertEqual(list(zip(years.tolist(), months.tolist(), days.tolist())), [
+            (1999, 12, 31), (2020, 2, 29), (2021, 1, 1),
+        ])
+
+
+class InterestCentsTestCase(SimpleTestCase):
+    def assertSameAsPerRow(self, amounts, interest_rates, days_left):
+        cents = interest_vec.interest_cents(
+            interest_vec.to_cents(amounts),
+            interest_vec.to_rate_e4(interest_rates),
+            days_left,
+        )
+        expected = [
+            int(per_row_interest(amount, interest_rate, days) * 100)
+            for amount, interest_rate, days in zip(amounts, interest_rates, days_left)
+        ]
+        self.assertEqual(cents.tolist(), expected)
+
+    def test_random_bookings(self):
+        rng = random.Random(42)
+        count = 5000
+        amounts = [Decimal(rng.randint(-10**7, 10**7)) / 100 for _ in range(count)]
+        interest_rates = [Decimal(rng.randint(0, 500)) / 10000 for _ in range(count)]
+        days_left = [rng.randint(0, 360) for _ in range(count)]
+
+        self.assertSameAsPerRow(amounts, interest_rates, days_left)
+
+    def test_half_cents(self):
+        amounts, interest_rates, days_left = [], [], []
+        for days in range(1, 361):
+            for rate_e4 in [50, 100, 125, 150, 200, 250]:
+                for odd in range(1, 12, 2):
+                    # amount_cents * rate_e4 * days == odd half cents
+                    amount_cents, remainder = divmod(1800000 * odd, rate_e4 * days)
+                    if remainder == 0:
+                        for sign in [1, -1]:
+                            amounts.append(Decimal(sign * amount_cents) / 100)
+                            interest_rates.append(Decimal(rate_e4) / 10000)
+                            days_left.append(days)
+
+        self.assertGreater(len(amounts), 1000)
+        self.assertSameAsPerRow(amounts, interest_rates, days_left)
+
+    def test_year_interest_cents(self):
+        dates = interest_vec.split_dates([date(2020, 7, 1), date(2020, 1, 1)])
+        cents = interest_vec.year_interest_cents(dates, [10000, -10000], [100, 100], 2020)
+
+        self.assertEqual(cents.tolist(), [50, -100])
+
+    def test_sum_per_group(self):
+        sums = interest_vec.sum_per_group([1, 2, 3, 4], [0, 2, 0, 2], 3)
+
+        self.assertEqual(sums.tolist(), [4, 0, 6])
+
+    def test_rejects_fractions_of_cents(self):
+        with self.assertRaises(ValueError):
+            interest_vec.to_cents([Decimal('1.005')])
+
+    def test_rejects_amounts_too_large(self):
+        with self.assertRaises(ValueError):
+            interest_vec.interest_cents(np.array([10**11]), np.array([1000]), np.array([360]))
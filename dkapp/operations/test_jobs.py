@@ -0,0 +1,167 @@
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from model_bakery import baker
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from dkapp.models import ContractVersion, AccountingEntry, Job
+from dkapp.operations.jobs import Heartbeat, ProgressReporter, delete_old_jobs, run_job
+
+
+class JobTestCase(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            JOB_OUTPUT_DIR=self.output_dir.name,
+            PDF_CACHE_DIR=os.path.join(self.output_dir.name, 'cache'),
+        )
+        self.settings_override.enable()
+        contract = baker.make('dkapp.Contract')
+        ContractVersion.objects.create(
+            start=date(2019, 2, 10),
+            duration_years=10,
+            interest_rate=Decimal('0.01'),
+            version=1,
+            contract=contract,
+        )
+        AccountingEntry.objects.create(date=date(2019, 5, 5), amount=Decimal('100'), contract=contract)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.output_dir.cleanup()
+
+    def run_worker(self):
+        call_command('run_worker', '--once', stdout=StringIO())
+
+    def test_pdf_request_only_enqueues(self):
+        response = self.client.get(reverse('dkapp:contracts_interest') + '?year=2020&format=overview')
+
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse('dkapp:job', args=(job.id,)))
+        self.assertEqual(job.status, Job.Status.QUEUED)
+        self.assertEqual(job.params['year'], 2020)
+
+    def test_repeated_pdf_request_reuses_job(self):
+        url = reverse('dkapp:contracts_interest') + '?year=2020&format=overview'
+        self.client.get(url)
+        Job.claim()
+        self.client.get(url)
+        self.client.get(reverse('dkapp:contracts_interest') + '?year=2019&format=overview')
+
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_old_jobs_are_deleted(self):
+        old = Job.enqueue('overview', year=2020, today='01.01.2021')
+        recent = Job.enqueue('overview', year=2021, today='01.01.2022')
+        run_job(Job.claim())
+        run_job(Job.claim())
+        Job.objects.filter(id=old.id).update(finished_at=timezone.now() - timedelta(days=8))
+        stray_path = os.path.join(self.output_dir.name, 'stray.pdf')
+        open(stray_path, 'wb').close()
+        week_ago = time.time() - 8 * 24 * 3600
+        for path in [Job.objects.get(id=old.id).file_path, stray_path]:
+            os.utime(path, (week_ago, week_ago))
+
+        self.assertEqual(delete_old_jobs(timedelta(days=7)), (1, 2))
+
+        recent.refresh_from_db()
+        self.assertEqual(list(Job.objects.all()), [recent])
+        self.assertCountEqual(os.listdir(self.output_dir.name), ['cache', os.path.basename(recent.file_path)])
+
+    def test_worker_creates_file(self):
+        job = Job.enqueue('overview', year=2020, today='01.01.2021')
+        status = self.client.get(reverse('dkapp:job_status', args=(job.id,))).json()
+        self.assertEqual(status['status'], 'queued')
+        self.assertIsNone(status['download_url'])
+        self.assertEqual(self.client.get(reverse('dkapp:job_download', args=(job.id,))).status_code, 404)
+
+        self.run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.progress, 1)
+        self.assertTrue(os.path.exists(job.file_path))
+        status = self.client.get(reverse('dkapp:job_status', args=(job.id,))).json()
+        self.assertEqual(status['download_url'], reverse('dkapp:job_download', args=(job.id,)))
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        response.close()
+
+    def test_failed_job_records_error(self):
+        job = Job.enqueue('unknown')
+
+        self.run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertIn('KeyError', job.error)
+
+    def test_jobs_run_in_order_of_creation(self):
+        first = Job.enqueue('overview', year=2020, today='01.01.2021')
+        second = Job.enqueue('overview', year=2021, today='01.01.2022')
+
+        self.assertEqual(Job.claim(), first)
+        self.assertEqual(Job.claim(), second)
+        self.assertIsNone(Job.claim())
+
+    def test_stale_running_job_is_requeued(self):
+        job = Job.enqueue('overview', year=2020, today='01.01.2021')
+        Job.claim()
+        Job.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+
+    def test_requeued_run_changes_nothing(self):
+        Job.enqueue('overview', year=2020, today='01.01.2021')
+        old_run = Job.claim('worker-1')
+        Job.objects.filter(id=old_run.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        Job.requeue_stale(timedelta(minutes=30))
+        new_run = Job.claim('worker-2')
+
+        self.assertFalse(old_run.heartbeat())
+        old_run.set_progress(0.5)
+        self.assertFalse(run_job(old_run))
+
+        self.assertEqual(old_run.status, Job.Status.RUNNING)
+        self.assertEqual(old_run.worker, 'worker-2')
+        self.assertEqual(old_run.progress, 0)
+        self.assertEqual(os.listdir(self.output_dir.name), ['cache'])
+        self.assertTrue(new_run.heartbeat())
+        self.assertTrue(run_job(new_run))
+        new_run.refresh_from_db()
+        self.assertEqual(new_run.status, Job.Status.DONE)
+
+    def test_heartbeat(self):
+        class FakeJob:
+            beats = 0
+
+            def heartbeat(self):
+                self.beats += 1
+
+        job = FakeJob()
+        with Heartbeat(job, interval=0.001):
+            while job.beats < 2:
+                time.sleep(0.001)
+
+        beats = job.beats
+        time.sleep(0.01)
+        self.assertEqual(job.beats, beats)
+
+    def test_progress_reporter(self):
+        Job.enqueue('overview', year=2020, today='01.01.2021')
+        job = Job.claim()
+        reporter = ProgressReporter(job, interval=0)
+        reporter('SIZE_EST', 4)
+        reporter('PROGRESS', 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.progress, 0.25)
@@ -0,0 +1,56 @@
+from datetime import date
+from decimal import Decimal
+
+from model_bakery import baker
+from django.test import TestCase
+
+from dkapp.models import AccountingEntry
+from dkapp.operations.keyset import CursorError, KeysetPage
+
+
+class KeysetPageTestCase(TestCase):
+    def setUp(self):
+        contract = baker.make('dkapp.Contract')
+        # three bookings per day, so pages start within a day; created in the order of date and id
+        self.created_ids = [
+            AccountingEntry.objects.create(date=date(2020, 1, day), amount=Decimal(amount), contract=contract).id
+            for day in range(1, 5)
+            for amount in [30, 10, 20]
+        ]
+        self.entries = AccountingEntry.objects.all()
+
+    def ids(self, page):
+        return [entry.id for entry in page.object_list]
+
+    def test_forward_and_back(self):
+        key = ['date', 'id']
+        first = KeysetPage(self.entries, key, 5)
+        self.assertEqual(self.ids(first), self.created_ids[:5])
+        self.assertEqual((first.has_previous, first.has_next), (False, True))
+
+        second = KeysetPage(self.entries, key, 5, after_cursor=first.next_cursor)
+        self.assertEqual(self.ids(second), self.created_ids[5:10])
+        last = KeysetPage(self.entries, key, 5, after_cursor=second.next_cursor)
+        self.assertEqual(self.ids(last), self.created_ids[10:])
+        self.assertEqual((last.has_previous, last.has_next), (True, False))
+
+        back = KeysetPage(self.entries, key, 5, before_cursor=last.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(second))
+        back = KeysetPage(self.entries, key, 5, before_cursor=back.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertFalse(back.has_previous)
+
+    def test_descending(self):
+        key = ['-amount', '-date', 'id']
+        pages = [KeysetPage(self.entries, key, 3)]
+        while pages[-1].has_next:
+            pages.append(KeysetPage(self.entries, key, 3, after_cursor=pages[-1].next_cursor))
+
+        self.assertEqual(
+            [entry.id for page in pages for entry in page.object_list],
+            list(self.entries.order_by('-amount', '-date', 'id').values_list('id', flat=True)),
+        )
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(CursorError):
+            KeysetPage(self.entries, ['date', 'id'], 5, after_cursor='WzFd')
@@ -0,0 +1,203 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+from django.conf import settings
+from model_bakery import baker
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from pypdf import PdfReader
+from dkapp.models import Contact, Contract, ContractVersion, AccountingEntry
+from dkapp.operations.interest import InterestDataRow
+from dkapp.operations.pdf.interest_letters import CanvasInterestLettersGenerator, InterestLettersGenerator
+from dkapp.operations.pdf.util import AssetRegistry, get_custom_texts, get_image, interest_year_table, zip_stream
+from dkapp.operations.reports import InterestPerContract
+
+
+class CustomFilesMixin:
+    """Serves the template files of dkapp/static/custom as custom files"""
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        custom_templates = os.path.join(settings.BASE_DIR, 'dkapp', 'static', 'custom')
+        os.makedirs(os.path.join(self.static_root, 'custom'))
+        for name in ['logo.png', 'image.png', 'text_snippets.yml']:
+            shutil.copy(
+                os.path.join(custom_templates, f'{name}_template'),
+                os.path.join(self.static_root, 'custom', name),
+            )
+        self.settings_override = override_settings(STATIC_ROOT=self.static_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.static_root)
+
+
+def make_report(count):
+    letters = []
+    for number in range(1, count + 1):
+        contact = Contact(first_name='Erika', last_name=f'Muster{number}', address='Musterweg 1, 12345 Musterstadt')
+        contract = Contract(number=number, contact=contact)
+        contract.current_balance = Decimal('1000.00')
+        rows = [InterestDataRow(date(2020, 1, 1), 'Saldo', Decimal('1000'), Decimal('0.01'), 360, 1, Decimal('10.00'))]
+        letters.append(InterestPerContract(contract=contract, contact=contact, interest=Decimal('10.00'), interest_rows=rows))
+    return SimpleNamespace(per_contract_data=letters)
+
+
+class InterestLettersGeneratorTestCase(CustomFilesMixin, SimpleTestCase):
+    def test_parallel_pages_match_serial_pages(self):
+        report = make_report(5)
+
+        serial = PdfReader(InterestLettersGenerator(report, 2020, '01.01.2021').buffer)
+        parallel = PdfReader(InterestLettersGenerator(report, 2020, '01.01.2021', workers=2).buffer)
+
+        self.assertEqual(len(parallel.pages), len(serial.pages))
+        for serial_page, parallel_page in zip(serial.pages, parallel.pages):
+            self.assertEqual(parallel_page.extract_text(), serial_page.extract_text())
+        self.assertIn('Muster5', parallel.pages[-2].extract_text() + parallel.pages[-1].extract_text())
+
+    def test_spooled_output(self):
+        report = make_report(2)
+
+        with override_settings(PDF_SPOOL_MAX_SIZE=10**8):
+            in_memory = InterestLettersGenerator(report, 2020, '01.01.2021').buffer
+        with override_settings(PDF_SPOOL_MAX_SIZE=1000):
+            on_disk = InterestLettersGenerator(report, 2020, '01.01.2021').buffer
+
+        self.assertFalse(in_memory._rolled)
+        self.assertTrue(on_disk._rolled)
+        self.assertEqual(on_disk.read(5), b'%PDF-')
+        self.assertEqual(len(PdfReader(on_disk).pages), len(PdfReader(in_memory).pages))
+
+    def test_given_output(self):
+        with tempfile.TemporaryFile() as output:
+            generator = InterestLettersGenerator(make_report(1), 2020, '01.01.2021', output=output)
+
+            self.assertIs(generator.buffer, output)
+            self.assertEqual(output.read(5), b'%PDF-')
+
+
+def page_lines(pdf):
+    return [sorted(line.strip() for line in page.extract_text().splitlines()) for page in PdfReader(pdf).pages]
+
+
+class CanvasInterestLettersGeneratorTestCase(CustomFilesMixin, SimpleTestCase):
+    def test_pages_match_platypus_letters(self):
+        report = make_report(3)
+        # header with a name too long for one line, table running over two pages
+        report.per_contract_data[1].contract.contact.last_name = 'Muster' * 20
+        report.per_contract_data[2].interest_rows *= 50
+
+        expected = page_lines(InterestLettersGenerator(report, 2020, '01.01.2021').buffer)
+        pages = page_lines(CanvasInterestLettersGenerator(report, 2020, '01.01.2021').buffer)
+
+        self.assertEqual(pages, expected)
+        self.assertIn('Erika Muster3', pages[-3])
+        self.assertIn('Vielen Dank!', pages[-1])
+
+    def test_progress(self):
+        calls = []
+
+        CanvasInterestLettersGenerator(make_report(2), 2020, '01.01.2021', progress=lambda *call: calls.append(call))
+
+        self.assertEqual(calls, [('SIZE_EST', 2), ('PROGRESS', 1), ('PROGRESS', 2)])
+
+
+class InterestYearTableTestCase(SimpleTestCase):
+    def test_rows(self):
+        rows = make_report(1).per_contract_data[0].interest_rows
+
+        table = interest_year_table(rows, narrow=True)
+        other_table = interest_year_table(rows, narrow=True)
+
+        # laying out a table must not change the header of the other
+        self.assertIsNot(table._cellvalues[0][0], other_table._cellvalues[0][0])
+        self.assertEqual(table._cellvalues[0][0].text, 'Datum')
+        self.assertEqual(table._cellvalues[1][0], '01.01.2020')
+        self.assertEqual(table._cellvalues[1][2], '1.000,00€')
+        self.assertEqual(table._cellvalues[1][1].text, 'Saldo')
+        self.assertEqual(table.wrap(500, 800), interest_year_table(rows, narrow=True).wrap(500, 800))
+
+
+class AssetRegistryTestCase(CustomFilesMixin, SimpleTestCase):
+    def test_images_are_shared(self):
+        logo = os.path.join(self.static_root, 'custom', 'logo.png')
+
+        first = get_image(logo, width=100)
+        second = get_image(logo, width=100)
+
+        self.assertIs(first._img, second._img)
+        self.assertEqual((first.drawWidth, first.drawHeight), (100, 75))
+
+    def test_reload_on_change(self):
+        path = os.path.join(self.static_root, 'custom', 'text_snippets.yml')
+        registry = AssetRegistry()
+        texts = registry.texts(path)
+        self.assertIs(registry.texts(path), texts)
+        self.assertIs(get_custom_texts(), get_custom_texts())
+
+        with open(path, 'w') as snippets:
+            snippets.write('city: Hamburg\n')
+        os.utime(path, ns=(0, 0))
+
+        self.assertEqual(registry.texts(path), {'city': 'Hamburg'})
+
+
+class ZipStreamTestCase(SimpleTestCase):
+    def test_one_piece_per_file(self):
+        files = [('a.pdf', io.BytesIO(b'%PDF a')), ('b.pdf', io.BytesIO(b'%PDF bb' * 10))]
+
+        pieces = list(zip_stream(iter(files), chunk_size=20))
+
+        # one piece per chunk, one after each file and the central directory
+        self.assertEqual(len(pieces), 1 + 1 + 4 + 1 + 1)
+        with zipfile.ZipFile(io.BytesIO(b''.join(pieces))) as archive:
+            self.assertEqual(archive.namelist(), ['a.pdf', 'b.pdf'])
+            self.assertEqual(archive.read('b.pdf'), b'%PDF bb' * 10)
+
+
+class LetterZipTestCase(CustomFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.contacts = [
+            baker.make('dkapp.Contact', first_name='Erika', last_name='Müller', address='Musterweg 1, 12345 Musterstadt'),
+            baker.make('dkapp.Contact', first_name='Max', last_name='Muster', address='Musterweg 2, 12345 Musterstadt'),
+        ]
+        for contact in [self.contacts[0], self.contacts[0], self.contacts[1]]:
+            contract = baker.make('dkapp.Contract', contact=contact)
+            ContractVersion.objects.create(
+                start=date(2019, 2, 10),
+                duration_years=10,
+                interest_rate=Decimal('0.01'),
+                version=1,
+                contract=contract,
+            )
+            AccountingEntry.objects.create(date=date(2019, 5, 5), amount=Decimal('100'), contract=contract)
+
+    def get_archive(self, format):
+        response = self.client.get(reverse('dkapp:contracts_interest') + f'?year=2020&format={format}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_letter_zip(self):
+        with self.get_archive('letter_zip') as archive:
+            names = sorted(archive.namelist())
+            self.assertEqual(names, [
+                f'zinsbrief_Muster_Max_{self.contacts[1].id}.pdf',
+                f'zinsbrief_Müller_Erika_{self.contacts[0].id}.pdf',
+            ])
+            letters = PdfReader(io.BytesIO(archive.read(names[1])))
+            text = ''.join(page.extract_text() for page in letters.pages)
+            self.assertEqual(text.count('Guten Tag Erika Müller'), 2)
+
+    def test_thanks_zip(self):
+        with self.get_archive('thanks_zip') as archive:
+            self.assertIn(f'dankesbrief_Muster_Max_{self.contacts[1].id}.pdf', archive.namelist())
+            self.assertEqual(len(archive.namelist()), 2)
@@ -0,0 +1,100 @@
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from model_bakery import baker
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from dkapp.models import ContractVersion, AccountingEntry, Job
+from dkapp.operations import pdf_cache
+from dkapp.operations.booking_batch import BookingBatch
+
+
+class PdfCacheTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            PDF_CACHE_DIR=os.path.join(self.directory.name, 'cache'),
+            JOB_OUTPUT_DIR=os.path.join(self.directory.name, 'jobs'),
+        )
+        self.settings_override.enable()
+        self.contract = baker.make('dkapp.Contract')
+        ContractVersion.objects.create(
+            start=date(2019, 2, 10),
+            duration_years=10,
+            interest_rate=Decimal('0.01'),
+            version=1,
+            contract=self.contract,
+        )
+        self.entry = AccountingEntry.objects.create(date=date(2019, 5, 5), amount=Decimal('100'), contract=self.contract)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.directory.cleanup()
+
+    def test_key_changes_with_data(self):
+        key = pdf_cache.key('overview', 2020, '01.01.2021')
+        self.assertEqual(pdf_cache.key('overview', 2020, '01.01.2021'), key)
+        self.assertNotEqual(pdf_cache.key('letter', 2020, '01.01.2021'), key)
+        self.assertNotEqual(pdf_cache.key('overview', 2020, '01.02.2020'), pdf_cache.key('overview', 2020, '02.02.2020'))
+
+        entry = AccountingEntry.objects.create(date=date(2020, 5, 5), amount=Decimal('10'), contract=self.contract)
+        changed_key = pdf_cache.key('overview', 2020, '01.01.2021')
+        self.assertNotEqual(changed_key, key)
+
+        entry.delete()
+        self.entry.delete()
+        self.assertNotIn(pdf_cache.key('overview', 2020, '01.01.2021'), [key, changed_key])
+
+    def test_finished_year_is_served_on_the_next_day(self):
+        pdf_path = pdf_cache.render_to_cache('overview', 2020, '01.01.2021')
+
+        # the data didn't change since the day before
+        self.assertEqual(pdf_cache.lookup(pdf_cache.key('overview', 2020, '02.01.2021')), pdf_path)
+        self.assertEqual(pdf_cache.key('letter', 2020, '01.01.2021'), pdf_cache.key('letter', 2020, '05.03.2022'))
+
+    def test_key_ignores_day_of_undated_formats(self):
+        self.assertEqual(pdf_cache.key('thanks', 2020, '01.01.2021'), pdf_cache.key('thanks', 2020, '02.01.2021'))
+
+    def test_key_changes_with_bulk_writes(self):
+        key = pdf_cache.key('overview', 2020, '01.01.2021')
+
+        BookingBatch([{'id': self.entry.id, 'contract': self.contract.id, 'date': '2019-05-05', 'amount': '90'}]).save()
+
+        self.assertNotEqual(pdf_cache.key('overview', 2020, '01.01.2021'), key)
+
+    def test_finished_job_is_served_from_cache(self):
+        url = reverse('dkapp:contracts_interest') + '?year=2020&format=overview'
+        self.client.get(url)
+        call_command('run_worker', '--once', stdout=StringIO())
+        self.assertEqual(Job.objects.get().status, Job.Status.DONE)
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        response.close()
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_command_renders_and_prunes(self):
+        call_command('pdf_cache', '--year', '2020', '--format', 'overview', stdout=StringIO())
+        cached = os.listdir(os.path.join(self.directory.name, 'cache'))
+        self.assertEqual(len(cached), 1)
+
+        call_command('pdf_cache', '--max-bytes', '0', stdout=StringIO())
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'cache')), [])
+
+    def test_prune_least_recently_used(self):
+        os.makedirs(os.path.join(self.directory.name, 'cache'))
+        for number, name in enumerate(['old', 'used', 'new']):
+            with open(pdf_cache.path(name), 'wb') as pdf:
+                pdf.write(b'x' * 100)
+            os.utime(pdf_cache.path(name), (1000 + number, 1000 + number))
+        pdf_cache.lookup('used')
+
+        self.assertEqual(pdf_cache.prune(max_bytes=200), (1, 200))
+        self.assertFalse(os.path.exists(pdf_cache.path('old')))
+        self.assertEqual(pdf_cache.prune(max_bytes=100), (1, 100))
+        self.assertTrue(os.path.exists(pdf_cache.path('used')))
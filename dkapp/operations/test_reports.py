@@ -5,7 +5,9 @@ from django.test import TestCase
 
 from decimal import Decimal
 from dkapp.models import ContractVersion, AccountingEntry
-from dkapp.operations.reports import RemainingContractsReport
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from dkapp.operations.reports import AccountingEntryTotalsReport, RemainingContractsReport
 
 
 class RemainingCategoryReportTestCase(TestCase):
@@ -77,3 +79,31 @@ class RemainingCategoryReportTestCase(TestCase):
             (self.contract_short, 300),
             (self.contract_short2, 50),
         ])
+
+
+class AccountingEntryTotalsReportTestCase(TestCase):
+    def test_report(self) -> None:
+        private = baker.make('dkapp.Contract', category='Privat')
+        third = baker.make('dkapp.Contract', category='Dritte')
+        for contract, day, amount in [
+            (private, date(2020, 1, 5), '100'),
+            (private, date(2020, 1, 20), '-30'),
+            (private, date(2020, 3, 1), '50'),
+            (third, date(2020, 3, 2), '1000'),
+            (third, date(2021, 1, 1), '7'),
+        ]:
+            AccountingEntry.objects.create(contract=contract, date=day, amount=Decimal(amount))
+
+        with CaptureQueriesContext(connection) as queries:
+            report = AccountingEntryTotalsReport.create(AccountingEntry.objects.filter(date__year=2020))
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual((report.total.deposits, report.total.withdrawals, report.total.net, report.total.count),
+                         (Decimal('1150'), Decimal('-30'), Decimal('1120'), 4))
+        self.assertEqual(list(report.per_category), ['Dritte', 'Privat'])
+        self.assertEqual(report.per_category['Privat'].net, Decimal('120'))
+        self.assertEqual(list(report.per_month), [date(2020, 1, 1), date(2020, 3, 1)])
+        self.assertEqual(report.per_month[date(2020, 3, 1)].count, 2)
+        self.assertEqual(report.as_json()['per_month'][0], {
+            'month': '2020-01', 'deposits': '100.00', 'withdrawals': '-30.00', 'net': '70.00', 'count': 2,
+        })
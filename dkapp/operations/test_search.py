@@ -0,0 +1,56 @@
+from model_bakery import baker
+from django.test import TestCase
+
+from dkapp.operations import search
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.erika = baker.make(
+            'dkapp.Contact',
+            first_name='Erika',
+            last_name='Müller',
+            address='Hauptstraße 5, 12345 Musterstadt',
+            email='erika@example.org',
+            iban='DE02 1203 0000 0000 2020 51',
+        )
+        self.max = baker.make('dkapp.Contact', first_name='Max', last_name='Mustermann', iban='')
+        self.contract = baker.make('dkapp.Contract', number=1017, comment='Solarprojekt', contact=self.erika)
+        self.other_contract = baker.make('dkapp.Contract', number=2017, comment='', contact=self.max)
+
+    def test_fts(self):
+        self.assertTrue(search.fts_enabled())
+        self.assertEqual(search.search('contact', 'muel'), [])
+        self.assertEqual(search.search('contact', 'mull hauptstr'), [self.erika.id])
+        self.assertEqual(search.search('contact', 'DE02120300'), [self.erika.id])
+        self.assertEqual(search.search('contact', 'erika@example'), [self.erika.id])
+        self.assertEqual(search.search('contract', '1017'), [self.contract.id])
+        self.assertEqual(search.search('contract', 'solar'), [self.contract.id])
+        self.assertEqual(search.search('contract', 'must'), [self.other_contract.id])
+        self.assertEqual(search.search('contract', '"*('), [])
+
+    def test_like(self):
+        self.assertEqual(search._search_like('contact', 'müll haupt', 10), [self.erika.id])
+        self.assertEqual(search._search_like('contract', '017', 10), [self.contract.id, self.other_contract.id])
+        self.assertEqual(search._search_like('contract', 'solar müller', 10), [self.contract.id])
+
+    def test_signals_keep_index_up_to_date(self):
+        self.erika.last_name = 'Schmidt'
+        self.erika.save()
+        self.assertEqual(search.search('contact', 'müller'), [])
+        self.assertEqual(search.search('contract', 'schmidt'), [self.contract.id])
+
+        self.contract.delete()
+        self.assertEqual(search.search('contract', 'solar'), [])
+        self.max.delete()
+        self.assertEqual(search.search('contact', 'max'), [])
+        self.assertEqual(search.search('contract', '2017'), [])
+
+    def test_rebuild(self):
+        search.rebuild()
+
+        self.assertEqual(search.search('contact', 'erika'), [self.erika.id])
+        self.assertEqual(search.labels('contract', [self.other_contract.id, 999, self.contract.id]), [
+            (self.other_contract.id, str(self.other_contract)),
+            (self.contract.id, str(self.contract)),
+        ])
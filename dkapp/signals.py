@@ -0,0 +1,119 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+from dkapp.models import (
+    AccountingEntry,
+    BalanceCheckpoint,
+    Contact,
+    Contract,
+    ContractVersion,
+    DataGeneration,
+    InterestResult,
+)
+from dkapp.operations import search
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=ContractVersion)
+@receiver(post_save, sender=AccountingEntry)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=ContractVersion)
+@receiver(post_delete, sender=AccountingEntry)
+def bump_data_generation(sender, **kwargs):
+    DataGeneration.bump()
+
+
+@receiver(pre_save, sender=AccountingEntry)
+def remember_booking(sender, instance, **kwargs):
+    # the stored values are needed to take an edited entry out of the checkpoints
+    instance._stored_booking = AccountingEntry.objects.filter(
+        pk=instance.pk,
+    ).values_list('contract_id', 'date', 'amount').first() if instance.pk else None
+
+
+@receiver(post_save, sender=AccountingEntry)
+def book_into_checkpoints(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    with transaction.atomic():
+        stored_booking = getattr(instance, '_stored_booking', None)
+        if stored_booking:
+            BalanceCheckpoint.remove(*stored_booking)
+            InterestResult.invalidate(*stored_booking[:2])
+        BalanceCheckpoint.add(instance.contract_id, instance.date, Decimal(str(instance.amount)))
+        InterestResult.invalidate(instance.contract_id, instance.date)
+
+
+@receiver(post_delete, sender=AccountingEntry)
+def remove_from_checkpoints(sender, instance, **kwargs):
+    with transaction.atomic():
+        BalanceCheckpoint.remove(instance.contract_id, instance.date, instance.amount)
+        InterestResult.invalidate(instance.contract_id, instance.date)
+
+
+@receiver(pre_save, sender=ContractVersion)
+def remember_version_start(sender, instance, **kwargs):
+    instance._stored_start = ContractVersion.objects.filter(
+        pk=instance.pk,
+    ).values_list('contract_id', 'start').first() if instance.pk else None
+
+
+@receiver(post_save, sender=ContractVersion)
+def invalidate_interest_on_version_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored_start = getattr(instance, '_stored_start', None)
+    if stored_start:
+        InterestResult.invalidate(*stored_start)
+    InterestResult.invalidate(instance.contract_id, instance.start)
+
+
+@receiver(post_delete, sender=ContractVersion)
+def invalidate_interest_on_version_delete(sender, instance, **kwargs):
+    InterestResult.invalidate(instance.contract_id, instance.start)
+
+
+@receiver(post_save, sender=ContractVersion)
+@receiver(post_delete, sender=ContractVersion)
+def forget_timeline(sender, instance, **kwargs):
+    # the contract of the version would keep showing the old versions
+    if ContractVersion.contract.is_cached(instance):
+        contract = instance.contract
+        contract.__dict__.pop('timeline', None)
+        getattr(contract, '_prefetched_objects_cache', {}).pop('contractversion_set', None)
+
+
+@receiver(post_save, sender=Contact)
+def index_contact(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index('contact', [instance])
+    # the texts of the contracts contain the name
+    search.index('contract', instance.contract_set.select_related('contact'))
+
+
+@receiver(post_delete, sender=Contact)
+def remove_contact_from_index(sender, instance, **kwargs):
+    search.remove('contact', instance.id)
+
+
+@receiver(post_save, sender=Contract)
+def index_contract(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index('contract', [instance])
+
+
+@receiver(post_delete, sender=Contract)
+def remove_contract_from_index(sender, instance, **kwargs):
+    search.remove('contract', instance.id)
+
+
+@receiver(post_migrate)
+def forget_search_table(sender, **kwargs):
+    search.forget_table()
@@ -0,0 +1,30 @@
+// Fills the datalist of autocomplete fields (forms.AutocompleteWidget) from the
+// search endpoint and writes the id of the chosen entry into the hidden input.
+document.addEventListener('DOMContentLoaded', () => {
+  document.querySelectorAll('input[data-autocomplete]').forEach(input => {
+    const hidden = input.previousElementSibling;
+    const options = input.list;
+    let timeout;
+
+    input.addEventListener('input', () => {
+      const chosen = Array.from(options.options).find(option => option.value === input.value);
+      hidden.value = chosen ? chosen.dataset.id : '';
+      if (chosen) {
+        return;
+      }
+      clearTimeout(timeout);
+      timeout = setTimeout(() => {
+        fetch(input.dataset.autocomplete + '&q=' + encodeURIComponent(input.value))
+          .then(response => response.json())
+          .then(data => {
+            options.replaceChildren(...data.results.map(result => {
+              const option = document.createElement('option');
+              option.value = result.label;
+              option.dataset.id = result.id;
+              return option;
+            }));
+          });
+      }, 200);
+    });
+  });
+});
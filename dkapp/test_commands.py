@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from model_bakery import baker
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from dkapp.models import (
+    Contact,
+    Contract,
+    ContractVersion,
+    AccountingEntry,
+    BalanceCheckpoint,
+    DataGeneration,
+    InterestResult,
+    SyncWatermark,
+)
+
+RAILS_SCHEMA = '''
+    CREATE TABLE contacts (
+        id INTEGER PRIMARY KEY, prename TEXT, name TEXT, address TEXT, account_number TEXT,
+        bank_number TEXT, email TEXT, phone TEXT, remark TEXT, bank_name TEXT,
+        created_at TEXT, updated_at TEXT
+    );
+    CREATE TABLE contracts (
+        id INTEGER PRIMARY KEY, number INTEGER, comment TEXT, category TEXT, contact_id INTEGER,
+        created_at TEXT, updated_at TEXT
+    );
+    CREATE TABLE contract_versions (
+        id INTEGER PRIMARY KEY, start TEXT, duration_months INTEGER, duration_years INTEGER,
+        interest_rate TEXT, version INTEGER, contract_id INTEGER, created_at TEXT, updated_at TEXT
+    );
+    CREATE TABLE accounting_entries (
+        id INTEGER PRIMARY KEY, date TEXT, amount TEXT, contract_id INTEGER,
+        created_at TEXT, updated_at TEXT
+    );
+'''
+TIMESTAMP = '2015-03-01 10:00:00'
+LATER = '2016-02-01 08:00:00'
+
+
+class ImportFromRailsAppTestCase(TestCase):
+    def setUp(self):
+        descriptor, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(descriptor)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(RAILS_SCHEMA)
+        for contact_id in [3, 7]:
+            self.db.execute(
+                'INSERT INTO contacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [contact_id, 'Erika', f'Muster{contact_id}', 'Musterweg 1, 12345 Musterstadt', 'DE12', 'GENO',
+                 '', '', '', 'GLS', TIMESTAMP, TIMESTAMP],
+            )
+        self.db.execute('INSERT INTO contracts VALUES (10, 100, "", "Privat", 3, ?, ?)', [TIMESTAMP, TIMESTAMP])
+        self.db.execute('INSERT INTO contracts VALUES (11, 101, "", "Dritte", 7, ?, ?)', [TIMESTAMP, TIMESTAMP])
+        self.db.execute(
+            'INSERT INTO contract_versions VALUES (20, "2015-03-01", NULL, 5, "0.015", 1, 10, ?, ?)',
+            [TIMESTAMP, TIMESTAMP],
+        )
+        for entry_id, entry_date, amount in [(30, '2015-03-01', '1000'), (31, '2015-03-01', '500'), (32, '2016-01-10', '-200')]:
+            self.db.execute(
+                'INSERT INTO accounting_entries VALUES (?, ?, ?, 10, ?, ?)',
+                [entry_id, entry_date, amount, TIMESTAMP, TIMESTAMP],
+            )
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        os.remove(self.path)
+
+    def test_import(self):
+        baker.make('dkapp.AccountingEntry', amount=Decimal('5'))
+        output = StringIO()
+
+        call_command('import_from_rails_app', self.path, '--batch-size', '2', stdout=output)
+
+        self.assertEqual(sorted(Contact.objects.values_list('id', 'last_name')), [(3, 'Muster3'), (7, 'Muster7')])
+        self.assertEqual(sorted(Contract.objects.values_list('id', 'number', 'contact_id')), [(10, 100, 3), (11, 101, 7)])
+        version = ContractVersion.objects.get()
+        self.assertEqual((version.id, version.start, version.interest_rate), (20, date(2015, 3, 1), Decimal('0.015')))
+        self.assertEqual(AccountingEntry.objects.count(), 3)
+        self.assertEqual(
+            list(BalanceCheckpoint.objects.order_by('date').values_list('contract_id', 'date', 'balance')),
+            [(10, date(2015, 3, 1), Decimal('1500')), (10, date(2016, 1, 10), Decimal('1300'))],
+        )
+        self.assertIn('accounting_entries', output.getvalue())
+        self.assertIn('3/3', output.getvalue())
+
+        # the ids of new rows continue after the imported ones
+        self.assertGreater(baker.make('dkapp.Contact').id, 7)
+
+    def test_unknown_reference_keeps_old_data(self):
+        baker.make('dkapp.AccountingEntry', amount=Decimal('5'))
+        self.db.execute('INSERT INTO accounting_entries VALUES (33, "2016-01-10", "1", 99, ?, ?)', [TIMESTAMP, TIMESTAMP])
+        self.db.commit()
+
+        with self.assertRaisesMessage(CommandError, 'accounting_entries 33: unknown contract_id 99'):
+            call_command('import_from_rails_app', self.path, verbosity=0, stdout=StringIO())
+
+        self.assertEqual(AccountingEntry.objects.get().amount, Decimal('5'))
+        self.assertEqual(BalanceCheckpoint.objects.get().balance, Decimal('5'))
+
+    def test_incremental(self):
+        call_command('import_from_rails_app', self.path, verbosity=0, stdout=StringIO())
+        self.assertEqual(SyncWatermark.objects.get(table='accounting_entries').updated_at, TIMESTAMP)
+        generation = DataGeneration.current()
+        baker.make('dkapp.InterestResult', contract_id=10, year=2016, interest=Decimal('1'), rows=[])
+        baker.make('dkapp.InterestResult', contract_id=11, year=2016, interest=Decimal('1'), rows=[])
+        self.db.execute('UPDATE accounting_entries SET amount = "700", updated_at = ? WHERE id = 31', [LATER])
+        self.db.execute('INSERT INTO accounting_entries VALUES (33, "2016-01-10", "50", 11, ?, ?)', [LATER, LATER])
+        self.db.execute('DELETE FROM accounting_entries WHERE id = 32')
+        self.db.execute('UPDATE contacts SET name = "Neu", updated_at = ? WHERE id = 7', [LATER])
+        self.db.commit()
+        output = StringIO()
+
+        call_command('import_from_rails_app', self.path, '--incremental', verbosity=0, stdout=output)
+
+        # the rows with the timestamp of the watermark are read again
+        self.assertIn('accounting_entries: 3 imported, 1 deleted', output.getvalue())
+        self.assertIn('contract_versions: 1 imported, 0 deleted', output.getvalue())
+        self.assertEqual(Contact.objects.get(id=7).last_name, 'Neu')
+        self.assertEqual(sorted(AccountingEntry.objects.values_list('rails_id', 'amount')), [
+            (30, Decimal('1000')), (31, Decimal('700')), (33, Decimal('50')),
+        ])
+        self.assertEqual(
+            list(BalanceCheckpoint.objects.order_by('contract_id').values_list('contract_id', 'date', 'balance')),
+            [(10, date(2015, 3, 1), Decimal('1700')), (11, date(2016, 1, 10), Decimal('50'))],
+        )
+        self.assertFalse(InterestResult.objects.exists())
+        self.assertEqual(SyncWatermark.objects.get(table='accounting_entries').updated_at, LATER)
+        # the upserted rows keep the timestamps of the Rails app, the PDFs are still made again
+        self.assertNotEqual(DataGeneration.current(), generation)
+
+    def test_incremental_keeps_rows_created_here(self):
+        call_command('import_from_rails_app', self.path, verbosity=0, stdout=StringIO())
+        created_here = AccountingEntry.objects.create(date=date(2016, 2, 1), amount=Decimal('7'), contract_id=11)
+        # the Rails app gives its next booking the same id
+        self.db.execute(
+            'INSERT INTO accounting_entries VALUES (?, "2016-03-01", "9", 11, ?, ?)',
+            [created_here.id, LATER, LATER],
+        )
+        self.db.commit()
+
+        call_command('import_from_rails_app', self.path, '--incremental', verbosity=0, stdout=StringIO())
+
+        created_here.refresh_from_db()
+        self.assertEqual((created_here.amount, created_here.rails_id), (Decimal('7'), None))
+        imported = AccountingEntry.objects.get(rails_id=created_here.id)
+        self.assertNotEqual(imported.id, created_here.id)
+        self.assertEqual(imported.amount, Decimal('9'))
+        self.assertEqual(AccountingEntry.objects.filter(contract_id=11).count(), 2)
+
+    def test_incremental_reads_rows_of_the_watermark_again(self):
+        call_command('import_from_rails_app', self.path, verbosity=0, stdout=StringIO())
+        # written in the same second as the newest imported row
+        self.db.execute('INSERT INTO accounting_entries VALUES (33, "2016-01-10", "50", 11, ?, ?)', [TIMESTAMP, TIMESTAMP])
+        self.db.commit()
+
+        call_command('import_from_rails_app', self.path, '--incremental', verbosity=0, stdout=StringIO())
+
+        self.assertEqual(AccountingEntry.objects.get(rails_id=33).amount, Decimal('50'))
+        self.assertEqual(AccountingEntry.objects.count(), 4)
+
+    def test_incremental_deletes_contacts(self):
+        call_command('import_from_rails_app', self.path, verbosity=0, stdout=StringIO())
+        self.db.execute('DELETE FROM contracts WHERE id = 11')
+        self.db.execute('DELETE FROM contacts WHERE id = 7')
+        self.db.commit()
+
+        call_command('import_from_rails_app', self.path, '--incremental', verbosity=0, stdout=StringIO())
+
+        self.assertEqual(list(Contact.objects.values_list('id', flat=True)), [3])
+        self.assertEqual(list(Contract.objects.values_list('id', flat=True)), [10])
+        self.assertEqual(AccountingEntry.objects.count(), 3)
+
+    def test_incremental_needs_full_import(self):
+        baker.make('dkapp.AccountingEntry', amount=Decimal('5'))
+
+        with self.assertRaisesMessage(CommandError, 'run a full import'):
+            call_command('import_from_rails_app', self.path, '--incremental', verbosity=0, stdout=StringIO())
+
+        self.assertEqual(AccountingEntry.objects.count(), 1)
+
+
+class ImportBankStatementTestCase(TestCase):
+    def test_import(self):
+        contract = baker.make('dkapp.Contract', number=17)
+        descriptor, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(descriptor, 'w', encoding='latin-1') as statement:
+            statement.write('Buchungstag;Verwendungszweck;Betrag\n03.01.2024;Überweisung DK 17;100,00\n04.01.2024;Gebühr;-1,00\n')
+        self.addCleanup(os.remove, path)
+        output = StringIO()
+
+        call_command('import_bank_statement', path, '--encoding', 'latin-1', stdout=output)
+
+        self.assertEqual(AccountingEntry.objects.get().contract, contract)
+        self.assertIn('unmatched: 2024-01-04 -1.00', output.getvalue())
+        self.assertIn('Booked 1 of 2 transactions', output.getvalue())
+        with self.assertRaisesMessage(CommandError, 'Nothing imported'):
+            call_command('import_bank_statement', path, stdout=StringIO())
@@ -0,0 +1,37 @@
+from datetime import date
+from decimal import Decimal
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class RailsIdMigrationTestCase(TransactionTestCase):
+    before = [('dkapp', '0015_data_generation')]
+    after = [('dkapp', '0016_rails_id')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_marks_rows_of_earlier_imports(self):
+        apps = self.migrate(self.before)
+        contact = apps.get_model('dkapp', 'Contact').objects.create(id=3, first_name='Erika', last_name='Muster')
+        contract = apps.get_model('dkapp', 'Contract').objects.create(id=10, number=100, contact=contact)
+        apps.get_model('dkapp', 'ContractVersion').objects.create(
+            id=20, start=date(2015, 3, 1), duration_months=60, interest_rate=Decimal('0.015'), version=1,
+            contract=contract,
+        )
+        apps.get_model('dkapp', 'AccountingEntry').objects.create(
+            id=30, date=date(2015, 3, 1), amount=Decimal('1000'), contract=contract,
+        )
+
+        apps = self.migrate(self.after)
+
+        self.assertFalse(apps.get_model('dkapp', 'SyncWatermark').objects.exists())
+        for name, rails_id in [('Contact', 3), ('Contract', 10), ('ContractVersion', 20), ('AccountingEntry', 30)]:
+            self.assertEqual(apps.get_model('dkapp', name).objects.get().rails_id, rails_id)
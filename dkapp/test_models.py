@@ -2,7 +2,7 @@ from datetime import date
 from decimal import Decimal
 from model_bakery import baker
 from django.test import TestCase
-from dkapp.models import ContractVersion, AccountingEntry
+from dkapp.models import Contract, ContractVersion, AccountingEntry, BalanceCheckpoint
 
 
 
@@ -88,9 +88,163 @@ class ContractTestCase(TestCase):
     def test_expiring_at(self):
         self.assertEqual(self.contract.expiring_at(date(2019,3, 31)), date(2021, 2, 10))
 
+    def test_version_at(self):
+        self.assertEqual(self.contract.version_at(date(2018, 1, 1)), self.contract_version1)
+        self.assertEqual(self.contract.version_at(date(2020, 1, 10)), self.contract_version2)
+        self.assertEqual(self.contract.version_at(date(2020, 3, 30)), self.contract_version2)
+        self.assertEqual(self.contract.version_at(date(2025, 1, 1)), self.contract_version3)
+
+    def test_interest_rate_before_start(self):
+        self.assertEqual(self.contract.interest_rate_on(date(2019, 2, 9)), Decimal('0'))
+
+    def test_timeline_cached(self):
+        contract = Contract.objects.get(pk=self.contract.pk)
+        with self.assertNumQueries(1):
+            contract.last_version
+            contract.first_version
+            contract.version_at(date(2020, 2, 1))
+            contract.interest_rate_on(date(2020, 2, 1))
+            contract.versions_in(2020)
+            contract.expiring_at(date(2020, 2, 1))
+
+    def test_timeline_prefetched(self):
+        contract = Contract.objects.prefetch_related('contractversion_set').get(pk=self.contract.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(contract.last_version, self.contract_version3)
+            self.assertEqual(contract.interest_rate_on(date(2020, 2, 1)), Decimal('0.02'))
+
+    def test_timeline_follows_version_changes(self):
+        contract = Contract.objects.prefetch_related('contractversion_set').get(pk=self.contract.pk)
+        self.assertEqual(contract.last_version, self.contract_version3)
+
+        version = ContractVersion.objects.create(
+            start=date(2023, 1, 1), duration_years=5, interest_rate=Decimal('0.03'), version=4, contract=contract,
+        )
+        self.assertEqual(contract.last_version, version)
+
+        version.delete()
+        self.assertEqual(contract.last_version, self.contract_version3)
+
     def test_remaining_years(self):
         self.assertGreater(self.contract.remaining_years(),  2030 - date.today().year - 1)
         self.assertGreater(self.contract.remaining_years(date(2021, 12, 31)),  8)
         self.assertLess(self.contract.remaining_years(date(2021, 12, 31)),  9)
         self.assertGreater(self.contract.remaining_years(date(2019, 12, 31)),  1)
         self.assertLess(self.contract.remaining_years(date(2019, 12, 31)),  2)
+
+
+class ContractSummaryTestCase(TestCase):
+    def setUp(self):
+        self.contract = baker.make('dkapp.Contract')
+        ContractVersion.objects.create(
+            start=date(2019, 2, 10),
+            duration_years=2,
+            interest_rate=Decimal('0.01'),
+            version=1,
+            contract=self.contract,
+        )
+        ContractVersion.objects.create(
+            start=date(2020, 3, 31),
+            duration_months=18,
+            interest_rate=Decimal('0.015'),
+            version=2,
+            contract=self.contract,
+        )
+        for amount in [Decimal('100'), Decimal('50.5')]:
+            AccountingEntry.objects.create(
+                date=date(2019, 2, 10),
+                amount=amount,
+                contract=self.contract,
+            )
+        self.empty_contract = baker.make('dkapp.Contract')
+
+    def test_with_summary(self):
+        contract = Contract.objects.with_summary().get(pk=self.contract.pk)
+
+        self.assertEqual(contract.current_balance, Decimal('150.5'))
+        self.assertEqual(contract.balance, Decimal('150.5'))
+        self.assertEqual(contract.last_version_start, date(2020, 3, 31))
+        self.assertEqual(contract.last_version_duration_months, 18)
+        self.assertIsNone(contract.last_version_duration_years)
+        self.assertEqual(contract.last_version_interest_rate, Decimal('0.015'))
+        self.assertEqual(contract.expiring, self.contract.expiring)
+
+    def test_with_summary_without_versions_and_entries(self):
+        contract = Contract.objects.with_summary().get(pk=self.empty_contract.pk)
+
+        self.assertEqual(contract.current_balance, Decimal('0'))
+        self.assertIsNone(contract.last_version_start)
+        self.assertIsNone(contract.expiring)
+
+
+class BalanceCheckpointTestCase(TestCase):
+    def setUp(self):
+        self.contract = baker.make('dkapp.Contract')
+        self.other_contract = baker.make('dkapp.Contract')
+        self.entries = [
+            AccountingEntry.objects.create(date=the_date, amount=amount, contract=self.contract)
+            for the_date, amount in [
+                (date(2019, 2, 10), Decimal('100')),
+                (date(2019, 2, 10), Decimal('50.25')),
+                (date(2020, 1, 1), Decimal('-30')),
+                (date(2020, 6, 1), Decimal('200')),
+            ]
+        ]
+
+    def checkpoints(self, contract):
+        return list(BalanceCheckpoint.objects.filter(contract=contract).order_by('date').values_list('date', 'balance'))
+
+    def test_created_with_entries(self):
+        self.assertEqual(self.checkpoints(self.contract), [
+            (date(2019, 2, 10), Decimal('150.25')),
+            (date(2020, 1, 1), Decimal('120.25')),
+            (date(2020, 6, 1), Decimal('320.25')),
+        ])
+        self.assertEqual(list(BalanceCheckpoint.inconsistencies()), [])
+
+    def test_entry_edited(self):
+        entry = self.entries[1]
+        entry.date = date(2020, 3, 1)
+        entry.amount = Decimal('10')
+        entry.save()
+
+        self.assertEqual(self.checkpoints(self.contract), [
+            (date(2019, 2, 10), Decimal('100')),
+            (date(2020, 1, 1), Decimal('70')),
+            (date(2020, 3, 1), Decimal('80')),
+            (date(2020, 6, 1), Decimal('280')),
+        ])
+
+    def test_entry_moved_to_other_contract(self):
+        entry = self.entries[3]
+        entry.contract = self.other_contract
+        entry.save()
+
+        self.assertEqual(self.contract.balance_on(date(2020, 12, 31)), Decimal('120.25'))
+        self.assertEqual(self.other_contract.balance_on(date(2020, 12, 31)), Decimal('200'))
+        self.assertEqual(list(BalanceCheckpoint.inconsistencies()), [])
+
+    def test_entry_deleted(self):
+        self.entries[2].delete()
+
+        self.assertEqual(self.checkpoints(self.contract), [
+            (date(2019, 2, 10), Decimal('150.25')),
+            (date(2020, 6, 1), Decimal('350.25')),
+        ])
+
+    def test_contact_deleted(self):
+        self.contract.contact.delete()
+
+        self.assertFalse(BalanceCheckpoint.objects.exists())
+
+    def test_rebuild(self):
+        BalanceCheckpoint.objects.filter(date=date(2020, 1, 1)).update(balance=Decimal('1'))
+        BalanceCheckpoint.objects.filter(date=date(2020, 6, 1)).delete()
+        self.assertEqual(list(BalanceCheckpoint.inconsistencies()), [
+            (self.contract.id, date(2020, 1, 1), Decimal('120.25'), Decimal('1')),
+            (self.contract.id, date(2020, 6, 1), Decimal('320.25'), None),
+        ])
+
+        BalanceCheckpoint.rebuild()
+
+        self.assertEqual(list(BalanceCheckpoint.inconsistencies()), [])
@@ -0,0 +1,323 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from model_bakery import baker
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from dkapp.models import ContractVersion, AccountingEntry, IdempotencyKey
+
+
+def make_contracts(count, contact=None):
+    for _ in range(count):
+        contract = baker.make('dkapp.Contract', contact=contact) if contact else baker.make('dkapp.Contract')
+        ContractVersion.objects.create(
+            start=date(2019, 2, 10),
+            duration_years=10,
+            interest_rate=Decimal('0.01'),
+            version=1,
+            contract=contract,
+        )
+        AccountingEntry.objects.create(
+            date=date(2019, 5, 5),
+            amount=Decimal('100'),
+            contract=contract,
+        )
+
+
+class ContractListQueryCountTestCase(TestCase):
+    def assertConstantQueries(self, url, add_contracts):
+        add_contracts(2)
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        add_contracts(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(few), len(many))
+
+    def test_contracts(self):
+        self.assertConstantQueries(reverse('dkapp:contracts'), make_contracts)
+
+    def test_contracts_expiring(self):
+        self.assertConstantQueries(reverse('dkapp:contracts_expiring'), make_contracts)
+
+    def test_contracts_interest(self):
+        self.assertConstantQueries(reverse('dkapp:contracts_interest') + '?year=2020', make_contracts)
+
+    def test_contracts_interest_transfer_list(self):
+        self.assertConstantQueries(
+            reverse('dkapp:contracts_interest_transfer_list') + '?year=2020',
+            make_contracts,
+        )
+
+    def test_contracts_forecast(self):
+        self.assertConstantQueries(reverse('dkapp:contracts_forecast') + '?years=20', make_contracts)
+
+    def test_contact(self):
+        contact = baker.make('dkapp.Contact')
+        self.assertConstantQueries(
+            reverse('dkapp:contact', args=(contact.id,)),
+            lambda count: make_contracts(count, contact=contact),
+        )
+
+
+class ContractViewTestCase(TestCase):
+    def test_interest_per_year(self):
+        make_contracts(1)
+        contract = ContractVersion.objects.get().contract
+
+        response = self.client.get(reverse('dkapp:contract', args=(contract.id,)))
+
+        self.assertEqual(response.status_code, 200)
+        years = response.context['interest_years']
+        self.assertEqual(years[0].year, 2019)
+        self.assertEqual(years[1].interest, Decimal('1.00'))
+        self.assertEqual(years[-1].closing_balance, Decimal('100'))
+
+
+class BankStatementImportViewTestCase(TestCase):
+    def test_import(self):
+        contract = baker.make('dkapp.Contract', number=17)
+        statement = 'Buchungstag;Verwendungszweck;Betrag\n03.01.2024;DK 17;100,00\n03.01.2024;Miete;-5,00\n'
+
+        response = self.client.post(reverse('dkapp:accounting_entries_import'), {
+            'statement': SimpleUploadedFile('umsaetze.csv', statement.encode()),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].booked, 1)
+        self.assertContains(response, 'Miete')
+        self.assertEqual(AccountingEntry.objects.get().contract, contract)
+
+    def test_invalid_file(self):
+        response = self.client.post(reverse('dkapp:accounting_entries_import'), {
+            'statement': SimpleUploadedFile('umsaetze.csv', b'Datum;Text\n'),
+        })
+
+        self.assertContains(response, 'es wurde nichts gebucht')
+
+
+class AccountingEntriesApiViewTestCase(TestCase):
+    def setUp(self):
+        self.contract = baker.make('dkapp.Contract', number=17)
+        self.url = reverse('dkapp:api_accounting_entries')
+
+    def post(self, data, **headers):
+        return self.client.post(self.url, data, content_type='application/json', headers=headers)
+
+    def test_create(self):
+        response = self.post({'entries': [
+            {'contract_number': 17, 'date': '2024-01-02', 'amount': '100.00'},
+            {'contract': self.contract.id, 'date': '2024-01-03', 'amount': '-5'},
+        ]})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['created', 'created'])
+        self.assertEqual(AccountingEntry.objects.count(), 2)
+
+    def test_invalid(self):
+        response = self.post([{'contract_number': 17, 'date': '2024-01-02', 'amount': 'hundert'}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('amount', response.json()['results'][0]['errors'])
+        self.assertEqual(self.post('{').status_code, 400)
+        self.assertFalse(AccountingEntry.objects.exists())
+
+    def test_idempotency_key(self):
+        entries = [{'contract_number': 17, 'date': '2024-01-02', 'amount': '100.00'}]
+
+        first = self.post(entries, idempotency_key='jahresabschluss-1')
+        retry = self.post(entries, idempotency_key='jahresabschluss-1')
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(AccountingEntry.objects.count(), 1)
+        other = self.post(entries + entries, idempotency_key='jahresabschluss-1')
+        self.assertEqual(other.status_code, 422)
+        self.assertEqual(AccountingEntry.objects.count(), 1)
+
+    def test_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        entries = [{'contract_number': 17, 'date': '2024-01-02', 'amount': '100.00'}]
+
+        for data, content_type in [
+            (json.dumps(entries), 'text/plain'),
+            (json.dumps(entries), 'application/json'),
+            ('entries=1', 'application/x-www-form-urlencoded'),
+        ]:
+            with self.subTest(content_type):
+                response = client.post(self.url, data, content_type=content_type)
+                self.assertEqual(response.status_code, 403)
+        self.assertFalse(AccountingEntry.objects.exists())
+
+        client.get(reverse('dkapp:accounting_entries'))
+        token = client.cookies['csrftoken'].value
+        response = client.post(self.url, json.dumps(entries), content_type='text/plain', headers={'X-CSRFToken': token})
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(AccountingEntry.objects.exists())
+        response = client.post(self.url, entries, content_type='application/json', headers={'X-CSRFToken': token})
+        self.assertEqual(response.status_code, 201)
+
+    def test_failed_request_stores_no_key(self):
+        self.post([{'contract_number': 99, 'date': '2024-01-02', 'amount': '1'}], idempotency_key='k')
+
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class FeedViewTestCase(TestCase):
+    def lines(self, response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_contracts(self):
+        make_contracts(3)
+
+        response = self.client.get(reverse('dkapp:api_contracts'), {'limit': 2, 'fields': 'number,balance'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual([Decimal(line['balance']) for line in self.lines(response)], [Decimal('100')] * 2)
+        self.assertEqual(response.templates, [])
+        rest = self.client.get(reverse('dkapp:api_contracts'), {'limit': 2, 'cursor': response['X-Next-Cursor']})
+        self.assertEqual(len(self.lines(rest)), 1)
+        self.assertFalse(rest.has_header('X-Next-Cursor'))
+
+    def test_reports(self):
+        make_contracts(2)
+        for name in ['api_interest_transfer_list', 'api_average_interest_rate', 'api_remaining_contracts']:
+            with self.subTest(name):
+                response = self.client.get(reverse(f'dkapp:{name}'), {'year': 2020})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(self.lines(response)), 2)
+        response = self.client.get(reverse('dkapp:api_average_interest_rate'))
+        self.assertEqual(Decimal(response['X-Average-Interest-Rate']), Decimal('0.01'))
+
+    def test_accounting_entries(self):
+        make_contracts(2)
+
+        response = self.client.get(reverse('dkapp:api_accounting_entries'), {'year': 2019})
+
+        self.assertEqual([line['amount'] for line in self.lines(response)], ['100.00', '100.00'])
+
+    def test_invalid_parameter(self):
+        response = self.client.get(reverse('dkapp:api_accounting_entries'), {'fields': 'id,secret'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+
+class KeysetListViewTestCase(TestCase):
+    def test_accounting_entries(self):
+        make_contracts(60)
+        url = reverse('dkapp:accounting_entries')
+
+        first = self.client.get(url, {'sort': '-amount'})
+        self.assertEqual(len(first.context['accounting_entries']), 50)
+        self.assertIsNone(first.context['total_count'])
+        second = self.client.get(url, {'sort': '-amount', 'after': first.context['page'].next_cursor, 'count': 1})
+
+        self.assertEqual(len(second.context['accounting_entries']), 10)
+        self.assertEqual(second.context['total_count'], 60)
+        self.assertContains(second, 'before=')
+        shown = [entry.id for response in [first, second] for entry in response.context['accounting_entries']]
+        self.assertEqual(sorted(shown), sorted(AccountingEntry.objects.values_list('id', flat=True)))
+
+    def test_contracts_sorted_by_balance(self):
+        make_contracts(3)
+        first, second, third = ContractVersion.objects.order_by('contract_id').values_list('contract_id', flat=True)
+        AccountingEntry.objects.create(date=date(2020, 1, 1), amount=Decimal('5'), contract_id=second)
+
+        response = self.client.get(reverse('dkapp:contracts'), {'sort': '-balance'})
+
+        # equal balances in descending order of id
+        self.assertEqual([contract.id for contract in response.context['contracts']], [second, third, first])
+
+    def test_contacts_filter(self):
+        baker.make('dkapp.Contact', last_name='Muster', first_name='Erika')
+        baker.make('dkapp.Contact', last_name='Beispiel', first_name='Max')
+
+        response = self.client.get(reverse('dkapp:contacts'), {'q': 'mus'})
+
+        self.assertEqual([contact.last_name for contact in response.context['contacts']], ['Muster'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('dkapp:contacts'), {'after': 'kaputt'})
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AccountingEntryTotalsViewTestCase(TestCase):
+    def test_totals_follow_filter(self):
+        make_contracts(2)
+        contract = ContractVersion.objects.first().contract
+        AccountingEntry.objects.create(date=date(2020, 1, 1), amount=Decimal('-30'), contract=contract)
+        url = reverse('dkapp:accounting_entries')
+
+        response = self.client.get(url, {'year': 2019})
+        self.assertEqual(response.context['totals'].total.count, 2)
+
+        response = self.client.get(url, {'contract_id': contract.id, 'format': 'json'})
+        self.assertEqual(response.json()['total'], {
+            'deposits': '100.00', 'withdrawals': '-30.00', 'net': '70.00', 'count': 2,
+        })
+        self.assertEqual([month['month'] for month in response.json()['per_month']], ['2019-05', '2020-01'])
+
+
+class AutocompleteTestCase(TestCase):
+    def test_autocomplete(self):
+        contact = baker.make('dkapp.Contact', first_name='Erika', last_name='Muster')
+        contract = baker.make('dkapp.Contract', number=17, contact=contact)
+
+        response = self.client.get(reverse('dkapp:autocomplete'), {'kind': 'contract', 'q': 'erika'})
+
+        self.assertEqual(response.json(), {'results': [{'id': contract.id, 'label': str(contract)}]})
+        self.assertEqual(self.client.get(reverse('dkapp:autocomplete'), {'kind': 'job'}).status_code, 400)
+
+    def test_forms_render_no_options(self):
+        contacts = baker.make('dkapp.Contact', _quantity=20)
+        contract = baker.make('dkapp.Contract', contact=contacts[0])
+
+        response = self.client.get(reverse('dkapp:contract_edit', args=(contract.id,)))
+        self.assertNotContains(response, '<option value="%s"' % contacts[1].id)
+        self.assertContains(response, f'value="{contacts[0].full_name}"')
+
+        response = self.client.get(reverse('dkapp:accounting_entries'), {'contract_id': contract.id})
+        self.assertContains(response, 'data-autocomplete=')
+        self.assertContains(response, f'name="contract_id" value="{contract.id}"')
+
+
+class MissingContractTestCase(TestCase):
+    def test_post_without_contract(self):
+        response = self.client.post(reverse('dkapp:accounting_entries'), {
+            'contract': '', 'date': '05.05.2019', 'amount': '100',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error('contract'))
+        self.assertFalse(AccountingEntry.objects.exists())
+
+        response = self.client.post(reverse('dkapp:contract_versions'), {
+            'contract': 'x', 'start': '10.02.2019', 'duration_years': '10', 'interest_rate_percent': '1', 'version': '1',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error('contract'))
+        self.assertFalse(ContractVersion.objects.exists())
+
+    def test_empty_filter(self):
+        make_contracts(2)
+
+        response = self.client.get(reverse('dkapp:accounting_entries'), {'contract_id': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['object_list']), 2)
+
+        response = self.client.get(reverse('dkapp:contracts'), {'contact_id': ''})
+        self.assertEqual(response.status_code, 200)
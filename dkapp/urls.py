@@ -5,6 +5,7 @@ from . import views
 app_name = 'dkapp'
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
+    path('autocomplete', views.autocomplete, name='autocomplete'),
 
     path('contacts/', views.ContactsView.as_view(), name='contacts'),
     path('contacts/new/', views.ContactsView.new, name='contacts_new'),
@@ -25,6 +26,7 @@ urlpatterns = [
     path('contracts_interest_transfer_list/', views.ContractsInterestTransferListView.as_view(), name='contracts_interest_transfer_list'),
     path('contracts_interest_average/', views.ContractsAverageInterestView.as_view(), name='contracts_interest_average'),
     path('contracts_expiring/', views.ContractsExpiringView.as_view(), name='contracts_expiring'),
+    path('contracts_forecast/', views.ContractsForecastView.as_view(), name='contracts_forecast'),
     path('contracts_remaining/', views.ContractsRemainingView.as_view(), name='contracts_remaining'),
 
     path('contract_versions/', views.ContractVersionsView.as_view(), name='contract_versions'),
@@ -34,7 +36,18 @@ urlpatterns = [
 
     path('accounting_entries/', views.AccountingEntriesView.as_view(), name='accounting_entries'),
     path('accounting_entries/filter', views.AccountingEntriesView.filter, name='accounting_entries_filter'),
+    path('accounting_entries/import', views.BankStatementImportView.as_view(), name='accounting_entries_import'),
     path('accounting_entries/<int:pk>', views.AccountingEntryView.as_view(), name='accounting_entry'),
     path('accounting_entries/<int:pk>/edit', views.AccountingEntryView.edit, name='accounting_entry_edit'),
     path('accounting_entries/<int:pk>/delete', views.AccountingEntryDeleteView.as_view(), name='accounting_entry_delete'),
+
+    path('api/contracts', views.ContractsApiView.as_view(), name='api_contracts'),
+    path('api/accounting_entries', views.AccountingEntriesApiView.as_view(), name='api_accounting_entries'),
+    path('api/interest_transfer_list', views.InterestTransferListApiView.as_view(), name='api_interest_transfer_list'),
+    path('api/average_interest_rate', views.AverageInterestRateApiView.as_view(), name='api_average_interest_rate'),
+    path('api/remaining_contracts', views.RemainingContractsApiView.as_view(), name='api_remaining_contracts'),
+
+    path('jobs/<int:pk>/', views.JobView.as_view(), name='job'),
+    path('jobs/<int:pk>/status', views.JobView.status, name='job_status'),
+    path('jobs/<int:pk>/download', views.JobView.download, name='job_download'),
 ]
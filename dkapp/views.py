@@ -1,35 +1,137 @@
+import csv
+import hashlib
+import json
 import urllib
 from enum import Enum
 from operator import attrgetter
 from datetime import datetime
 
-from django.http import HttpResponseRedirect, FileResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
 from django.views import generic
 
-from dkapp.models import Contact, Contract, ContractVersion, AccountingEntry
-from dkapp.forms import ContactForm, ContractForm, ContractVersionForm, AccountingEntryForm
+from dkapp.models import Contact, Contract, ContractVersion, AccountingEntry, IdempotencyKey, Job
+from dkapp.forms import (
+    AccountingEntryForm,
+    AutocompleteWidget,
+    BankStatementForm,
+    ContactForm,
+    ContractForm,
+    ContractVersionForm,
+)
+from dkapp.operations import pdf_cache, search
+from dkapp.operations.bank_statement import BankStatementError, import_statement
+from dkapp.operations.booking_batch import BookingBatch, BookingBatchError
+from dkapp.operations.feeds import (
+    AccountingEntryFeed,
+    AverageInterestRateFeed,
+    ContractFeed,
+    FeedError,
+    InterestTransferListFeed,
+    RemainingContractsFeed,
+    ndjson,
+)
+from dkapp.operations.forecast import CashFlowForecast
+from dkapp.operations.interest import ContractLedger
+from dkapp.operations.keyset import CursorError, KeysetPage, reverse_key
+from dkapp.operations.pdf.letter_archive import interest_letter_files, thanks_letter_files
+from dkapp.operations.pdf.util import zip_stream
 from dkapp.operations.reports import (
+    AccountingEntryTotalsReport,
     AverageInterestRateReport,
     InterestTransferListReport,
     RemainingContractsReport,
 )
-from dkapp.operations.pdf.thanks_letters import ThanksLettersGenerator
-from dkapp.operations.pdf.interest_letters import InterestLettersGenerator
-from dkapp.operations.pdf.overview import OverviewGenerator
+
+
+def parse_id(value):
+    """Id sent by a form or query string, None if it is empty or no number"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 
 class IndexView(generic.TemplateView):
     template_name = 'index.html'
 
 
-class ContactsView(generic.ListView):
+def autocomplete(request):
+    """Contacts or contracts (`kind`) matching the words of `q`, for AutocompleteWidget"""
+    kind = request.GET.get('kind')
+    if kind not in search.KINDS:
+        return JsonResponse({'error': f'kind muss {" oder ".join(search.KINDS)} sein'}, status=400)
+    ids = search.search(kind, request.GET.get('q', ''))
+    return JsonResponse({'results': [{'id': object_id, 'label': label} for object_id, label in search.labels(kind, ids)]})
+
+
+class KeysetListMixin:
+    """ListView showing one page at a time, paged by key (see dkapp.operations.keyset)
+
+    `sort_keys` maps the sortable columns to their key, `?sort=-column` sorts
+    descending. The total count is only computed with `?count=1`.
+    """
+    page_size = 50
+    sort_keys = {}
+    default_sort = None
+    PAGING_PARAMETERS = ['sort', 'after', 'before', 'count']
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort') or self.default_sort
+        return sort if sort.lstrip('-') in self.sort_keys else self.default_sort
+
+    def get_context_data(self, **kwargs):
+        sort = self.get_sort()
+        key = self.sort_keys[sort.lstrip('-')]
+        try:
+            page = KeysetPage(
+                self.object_list,
+                reverse_key(key) if sort.startswith('-') else key,
+                self.page_size,
+                after_cursor=self.request.GET.get('after'),
+                before_cursor=self.request.GET.get('before'),
+            )
+        except CursorError as error:
+            raise Http404(error)
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
+        filters = self.request.GET.copy()
+        for name in self.PAGING_PARAMETERS:
+            filters.pop(name, None)
+        context.update({
+            'page': page,
+            'sort': sort,
+            'filter_query': filters.urlencode(),
+            'total_count': self.object_list.count() if self.request.GET.get('count') else None,
+        })
+        return context
+
+
+class ContactsView(KeysetListMixin, generic.ListView):
     template_name = 'contacts/index.html'
     context_object_name = 'contacts'
+    sort_keys = {
+        'last_name': ['last_name', 'first_name', 'id'],
+        'first_name': ['first_name', 'last_name', 'id'],
+        'email': ['email', 'id'],
+    }
+    default_sort = 'last_name'
 
     def get_queryset(self):
-        return Contact.objects.order_by('last_name', 'first_name')
+        contacts = Contact.objects.all()
+        search = self.request.GET.get('q')
+        if search:
+            contacts = contacts.filter(Q(last_name__icontains=search) | Q(first_name__icontains=search))
+        return contacts
 
     @staticmethod
     def new(request):
@@ -49,6 +151,13 @@ class ContactView(generic.DetailView):
     model = Contact
     template_name = 'contacts/detail.html'
 
+    def get_context_data(self, **kwargs):
+        context = super(ContactView, self).get_context_data(**kwargs)
+        context['contracts'] = Contract.objects.with_summary().filter(
+            contact=self.object,
+        ).order_by('number')
+        return context
+
     @staticmethod
     def edit(request, *args, **kwargs):
         contact_id = kwargs['pk']
@@ -79,20 +188,32 @@ class ContactDeleteView(generic.edit.DeleteView):
         return reverse('dkapp:contacts')
 
 
-class ContractsView(generic.ListView):
+class ContractsView(KeysetListMixin, generic.ListView):
     template_name = 'contracts/index.html'
     context_object_name = 'contracts'
+    sort_keys = {
+        'number': ['number', 'id'],
+        'contact': ['contact__last_name', 'contact__first_name', 'id'],
+        'balance': ['current_balance', 'id'],
+        'category': ['category', 'number', 'id'],
+    }
+    default_sort = 'number'
 
     def get_queryset(self):
-        contact_id = self.request.GET.get('contact_id')
+        contact_id = parse_id(self.request.GET.get('contact_id'))
+        contracts = Contract.objects.with_summary()
+        category = self.request.GET.get('category')
+        if category:
+            contracts = contracts.filter(category=category)
         if contact_id is None:
-            return Contract.objects.order_by('number')
+            return contracts
         else:
-            return Contract.objects.filter(contact_id=contact_id).order_by('number')
+            return contracts.filter(contact_id=contact_id)
 
     def get_context_data(self, **kwargs):
         context = super(ContractsView, self).get_context_data(**kwargs)
-        contact_id = self.request.GET.get('contact_id')
+        context['categories'] = Contract.Category.values
+        contact_id = parse_id(self.request.GET.get('contact_id'))
         if not contact_id is None:
             contact = get_object_or_404(Contact, pk=contact_id)
             context['contact'] = contact
@@ -122,6 +243,8 @@ class OUTPUT_FORMATS_ENUM(Enum):
     OVERVIEW='overview'
     THANKS='thanks'
     LETTER='letter'
+    LETTER_ZIP='letter_zip'
+    THANKS_ZIP='thanks_zip'
 
 
 class ContractsInterest(generic.TemplateView):
@@ -131,13 +254,14 @@ class ContractsInterest(generic.TemplateView):
         OUTPUT_FORMATS_ENUM.OVERVIEW.value: 'PDF-Übersicht',
         OUTPUT_FORMATS_ENUM.THANKS.value: 'PDF-Dankesbriefe',
         OUTPUT_FORMATS_ENUM.LETTER.value: 'PDF-Zinsbriefe',
+        OUTPUT_FORMATS_ENUM.LETTER_ZIP.value: 'ZIP mit Zinsbriefen pro Kontakt',
+        OUTPUT_FORMATS_ENUM.THANKS_ZIP.value: 'ZIP mit Dankesbriefen pro Kontakt',
     }
 
     def get(self, request):
         this_year = datetime.now().year
         year = int(request.GET.get('year') or this_year)
         format = request.GET.get('format') or OUTPUT_FORMATS_ENUM.HTML.value
-        report = InterestTransferListReport.create(year)
         if format == OUTPUT_FORMATS_ENUM.HTML.value:
             return render(request, self.template_name, {
                 'today': datetime.now().strftime('%d.%m.%Y'),
@@ -145,27 +269,33 @@ class ContractsInterest(generic.TemplateView):
                 'current_format': format,
                 'all_years': list(range(this_year, this_year-10, -1)),
                 'all_formats': self.OUTPUT_FORMATS,
-                'report': report,
+                'report': InterestTransferListReport.create(year),
             })
-        elif format == OUTPUT_FORMATS_ENUM.OVERVIEW.value:
-            pdf_generator = OverviewGenerator(
-                report=report,
-                year=year,
-                today=datetime.now().strftime('%d.%m.%Y'),
-            )
-            return FileResponse(pdf_generator.buffer, filename='overview.pdf')
-        elif format == OUTPUT_FORMATS_ENUM.THANKS.value:
-            pdf_generator = ThanksLettersGenerator(
-                contacts=[data.contact for data in report.per_contract_data]
-            )
-            return FileResponse(pdf_generator.buffer, filename='thanks.pdf')
-        else:
-            pdf_generator = InterestLettersGenerator(
-                report=report,
-                year=year,
-                today=datetime.now().strftime('%d.%m.%Y'),
-            )
-            return FileResponse(pdf_generator.buffer, filename='letter.pdf')
+
+        if format == OUTPUT_FORMATS_ENUM.LETTER_ZIP.value:
+            report = InterestTransferListReport.create(year)
+            files = interest_letter_files(report, year=year, today=datetime.now().strftime('%d.%m.%Y'))
+            return self._zip_response(files, f'zinsbriefe_{year}.zip')
+        if format == OUTPUT_FORMATS_ENUM.THANKS_ZIP.value:
+            report = InterestTransferListReport.create(year)
+            return self._zip_response(thanks_letter_files(report), f'dankesbriefe_{year}.zip')
+
+        today = datetime.now().strftime('%d.%m.%Y')
+        if format in pdf_cache.FORMATS:
+            cached_path = pdf_cache.lookup(pdf_cache.key(format, year, today))
+            if cached_path:
+                return FileResponse(open(cached_path, 'rb'), filename=f'{format}.pdf')
+
+        # PDFs of all contracts take too long for a request, run_worker creates them
+        job = Job.enqueue(format, year=year, today=today)
+        return HttpResponseRedirect(reverse('dkapp:job', args=(job.id,)))
+
+    @staticmethod
+    def _zip_response(files, filename):
+        # each letter is sent as soon as it is rendered
+        response = StreamingHttpResponse(zip_stream(files), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     @staticmethod
     def filter(request):
@@ -209,10 +339,13 @@ class ContractsExpiringView(generic.ListView):
     context_object_name = 'contracts'
 
     def get_queryset(self):
-        contracts = Contract.objects.order_by('created_at')
-        # this could be done in SQL to avoid n+1 queries but I'll go for fast
-        # dev speed here
-        return sorted(filter(lambda c: c.balance > 0, contracts), key=attrgetter('expiring'))
+        contracts = Contract.objects.with_summary().filter(
+            current_balance__gt=0,
+            last_version_start__isnull=False,
+        ).order_by('created_at')
+        # expiring needs relativedelta, so the (already loaded) rows are
+        # sorted in python
+        return sorted(contracts, key=attrgetter('expiring'))
 
 
 class ContractsRemainingView(generic.TemplateView):
@@ -236,10 +369,55 @@ class ContractsRemainingView(generic.TemplateView):
             reverse('dkapp:contracts_remaining') + f"?year={year}"
         )
 
+class ContractsForecastView(generic.TemplateView):
+    template_name = 'contracts/forecast.html'
+
+    def get(self, request):
+        years = min(max(int(request.GET.get('years') or 5), 1), 30)
+        forecast = CashFlowForecast.create(years)
+        if request.GET.get('format') == 'csv':
+            return self._csv_response(forecast)
+        return render(request, self.template_name, {
+            'current_years': years,
+            'all_years': [1, 2, 3, 5, 10, 15, 20, 30],
+            'forecast': forecast,
+        })
+
+    def post(self, request):
+        years = request.POST.get('years')
+        return HttpResponseRedirect(
+            reverse('dkapp:contracts_forecast') + f"?years={years}"
+        )
+
+    @staticmethod
+    def _csv_response(forecast):
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="liquiditaetsvorschau.csv"'
+        writer = csv.writer(response, delimiter=';')
+        header = ['Monat']
+        for category in forecast.categories:
+            header += [f'Rückzahlungen {category}', f'Zinsen {category}']
+        writer.writerow(header + ['Summe'])
+        for month in forecast.months:
+            row = [month.month.strftime('%Y-%m')]
+            for _, repayments, interest in month.per_category:
+                row += [repayments, interest]
+            writer.writerow(row + [month.total])
+        return response
+
+
 class ContractView(generic.DetailView):
     model = Contract
     template_name = 'contracts/detail.html'
 
+    def get_queryset(self):
+        return Contract.objects.with_summary()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['interest_years'] = list(ContractLedger.create(self.object).years())
+        return context
+
     @staticmethod
     def edit(request, *args, **kwargs):
         contract_id = kwargs['pk']
@@ -294,14 +472,14 @@ class ContractVersionsView(generic.ListView):
         return render(request, 'form.html', {'form': form, 'action_url': reverse('dkapp:contract_versions')})
 
     def post(self, request):
-        contract_id = request.POST.get('contract')
-        contract = get_object_or_404(Contract, pk=contract_id)
+        # the form reports a missing or unknown contract
+        contract = Contract.objects.filter(pk=parse_id(request.POST.get('contract'))).first()
         form = ContractVersionForm(request.POST, contract=contract)
         if form.is_valid():
             contract_version = form.save()
             return HttpResponseRedirect(reverse('dkapp:contract_version', args=(contract_version.id,)))
 
-        return HttpResponseRedirect(reverse('dkapp:contacts'))
+        return render(request, 'form.html', {'form': form, 'action_url': reverse('dkapp:contract_versions')})
 
 
 class ContractVersionView(generic.DetailView):
@@ -338,33 +516,43 @@ class ContractVersionDeleteView(generic.edit.DeleteView):
         return reverse('dkapp:contract_versions')
 
 
-class AccountingEntriesView(generic.ListView):
+class AccountingEntriesView(KeysetListMixin, generic.ListView):
     template_name = 'accounting_entries/index.html'
     context_object_name = 'accounting_entries'
+    sort_keys = {
+        'date': ['date', 'id'],
+        'amount': ['amount', 'id'],
+        'contract': ['contract__number', 'date', 'id'],
+    }
+    default_sort = 'date'
 
     def get_queryset(self, *args, **kwargs):
-        contract_id = self.request.GET.get('contract_id')
+        entries = AccountingEntry.objects.select_related('contract__contact')
+        contract_id = parse_id(self.request.GET.get('contract_id'))
         if contract_id is not None:
-            return AccountingEntry.objects.filter(contract_id=contract_id).order_by('date')
+            return entries.filter(contract_id=contract_id)
         year = self.request.GET.get('year')
         if year is not None:
-            return AccountingEntry.objects.filter(date__year=year).order_by('date')
+            return entries.filter(date__year=year)
         from_date = self.request.GET.get('from')
         to_date = self.request.GET.get('to')
         if from_date and to_date is not None:
-            return AccountingEntry.objects.filter(
+            return entries.filter(
                 date__gte=datetime.strptime(from_date, "%d.%m.%Y"),
                 date__lte=datetime.strptime(to_date, "%d.%m.%Y"),
-            ).order_by('date')
-        return AccountingEntry.objects.order_by('date')
+            )
+        return entries
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            return JsonResponse(AccountingEntryTotalsReport.create(self.get_queryset()).as_json())
+        return super().get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super(AccountingEntriesView, self).get_context_data(**kwargs)
-        all_contracts = Contract.objects.order_by('number').all()
-        context['all_contracts'] = all_contracts
+        context['totals'] = AccountingEntryTotalsReport.create(self.object_list)
         contract_id = self.request.GET.get('contract_id')
-        if contract_id:
-            context['contract_id'] = int(contract_id)
+        context['contract_filter'] = AutocompleteWidget('contract').render('contract_id', contract_id)
         year = self.request.GET.get('year')
         if year:
             context['year'] = year
@@ -400,14 +588,140 @@ class AccountingEntriesView(generic.ListView):
         return HttpResponseRedirect("?".join([reverse('dkapp:accounting_entries'), filter_query_string]))
 
     def post(self, request):
-        contract_id = request.POST.get('contract')
-        contract = get_object_or_404(Contract, pk=contract_id)
+        # the form reports a missing or unknown contract
+        contract = Contract.objects.filter(pk=parse_id(request.POST.get('contract'))).first()
         form = AccountingEntryForm(request.POST, contract=contract)
         if form.is_valid():
             accounting_entry = form.save()
             return HttpResponseRedirect(reverse('dkapp:accounting_entry', args=(accounting_entry.id,)))
 
-        return HttpResponseRedirect(reverse('dkapp:accounting_entries'))
+        return render(request, 'form.html', {'form': form, 'action_url': reverse('dkapp:accounting_entries')})
+
+
+class BankStatementImportView(generic.View):
+    template_name = 'accounting_entries/import.html'
+
+    def get(self, request):
+        return render(request, self.template_name, {'form': BankStatementForm()})
+
+    def post(self, request):
+        form = BankStatementForm(request.POST, request.FILES)
+        context = {'form': form}
+        if form.is_valid():
+            try:
+                context['result'] = import_statement(
+                    form.cleaned_data['statement'],
+                    format=form.cleaned_data['format'] or None,
+                    outgoing=form.cleaned_data['outgoing'],
+                )
+            except (BankStatementError, UnicodeDecodeError) as error:
+                context['error'] = error
+        return render(request, self.template_name, context)
+
+
+def idempotent(request, handle):
+    """Response of handle(), or the stored one if the Idempotency-Key header was used before
+
+    handle returns (status code, data) and runs in the transaction that
+    stores the key; only successful responses are stored.
+    """
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        status, data = handle()
+        return JsonResponse(data, status=status)
+    request_hash = hashlib.sha256(b'\n'.join([
+        request.method.encode(), request.path.encode(), request.body,
+    ])).hexdigest()
+    stored = IdempotencyKey.objects.filter(key=key).first()
+    if stored is None:
+        try:
+            with transaction.atomic():
+                status, data = handle()
+                if status < 400:
+                    IdempotencyKey.objects.create(key=key, request_hash=request_hash, status_code=status, response=data)
+            return JsonResponse(data, status=status)
+        except IntegrityError:
+            # a concurrent request with the same key was faster, its changes stay
+            stored = IdempotencyKey.objects.filter(key=key).first()
+            if stored is None:
+                raise
+    if stored.request_hash != request_hash:
+        return JsonResponse({'error': 'Idempotency-Key wurde für eine andere Anfrage verwendet'}, status=422)
+    response = JsonResponse(stored.response, status=stored.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class FeedView(generic.View):
+    """Rows of a feed as NDJSON
+
+    Parameters: `fields` (comma separated), `limit` and `cursor` (from the
+    X-Next-Cursor header of the previous page) plus the filters of the feed.
+    """
+    feed_class = None
+
+    def get(self, request):
+        try:
+            feed = self.feed_class(request.GET)
+            rows, next_cursor = feed.page()
+            summary = feed.summary()
+        except FeedError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        response = StreamingHttpResponse(ndjson(rows), content_type='application/x-ndjson; charset=utf-8')
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        for header, value in summary.items():
+            response[header] = str(value)
+        return response
+
+
+class ContractsApiView(FeedView):
+    feed_class = ContractFeed
+
+
+class InterestTransferListApiView(FeedView):
+    feed_class = InterestTransferListFeed
+
+
+class AverageInterestRateApiView(FeedView):
+    feed_class = AverageInterestRateFeed
+
+
+class RemainingContractsApiView(FeedView):
+    feed_class = RemainingContractsFeed
+
+
+class AccountingEntriesApiView(FeedView):
+    """Bookings as NDJSON, and many bookings created and changed with one JSON request
+
+    The body of a POST is a list of bookings (or {"entries": [...]}) with
+    `contract` (id) or `contract_number`, `date` (YYYY-MM-DD), `amount` (as
+    string) and `id` to change an existing booking. Either all are saved or
+    none, the response has a result per booking. Like every form of the app
+    a POST needs the CSRF token (cookie `csrftoken` and header X-CSRFToken)
+    and has to be sent as application/json.
+    """
+    feed_class = AccountingEntryFeed
+
+    def post(self, request):
+        if request.content_type != 'application/json':
+            return JsonResponse({'error': 'Content-Type application/json erwartet'}, status=415)
+        try:
+            rows = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Ungültiges JSON'}, status=400)
+        if isinstance(rows, dict):
+            rows = rows.get('entries')
+        if not isinstance(rows, list):
+            return JsonResponse({'error': 'Liste von Buchungen erwartet'}, status=400)
+
+        def handle():
+            try:
+                return 201, {'results': BookingBatch(rows).save()}
+            except BookingBatchError as error:
+                return 400, {'error': 'Ungültige Buchungen, es wurde nichts gespeichert', 'results': error.results}
+
+        return idempotent(request, handle)
 
 
 class AccountingEntryView(generic.DetailView):
@@ -446,3 +760,31 @@ class AccountingEntryDeleteView(generic.edit.DeleteView):
 
     def get_success_url(self):
         return reverse('dkapp:accounting_entries')
+
+
+class JobView(generic.DetailView):
+    model = Job
+    template_name = 'jobs/detail.html'
+
+    @staticmethod
+    def status(request, *args, **kwargs):
+        job = get_object_or_404(Job, pk=kwargs['pk'])
+        return JsonResponse({
+            'id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'progress': job.progress,
+            'error': job.error,
+            'download_url': reverse('dkapp:job_download', args=(job.id,)) if job.status == Job.Status.DONE else None,
+        })
+
+    @staticmethod
+    def download(request, *args, **kwargs):
+        job = get_object_or_404(Job, pk=kwargs['pk'])
+        if job.status != Job.Status.DONE:
+            raise Http404("Job is not finished")
+        try:
+            return FileResponse(open(job.file_path, 'rb'), filename=job.filename)
+        except FileNotFoundError:
+            raise Http404("Job file does not exist anymore")
@@ -124,3 +124,24 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'root')
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
+
+# Words a contract number follows in the reference text of bank transfers,
+# e.g. "Vertrag 17" or "DK-17" (see dkapp.operations.bank_statement)
+BANK_STATEMENT_CONTRACT_PREFIXES = ['Vertrag', 'Vertragsnummer', 'Vertragsnr', 'Direktkredit', 'DK']
+
+# Files created by background jobs (see the run_worker command)
+JOB_OUTPUT_DIR = os.path.join(BASE_DIR, 'job_output')
+# Seconds between heartbeats of a running job, has to stay well below
+# the --stale-minutes of run_worker
+JOB_HEARTBEAT_SECONDS = 60
+
+# Processes laying out interest letters in parallel (1 renders them serially)
+PDF_WORKERS = os.cpu_count() or 1
+
+# PDFs larger than this many bytes are spooled to a temporary file
+PDF_SPOOL_MAX_SIZE = 5 * 1024 * 1024
+
+# Generated PDFs kept for repeated downloads, least recently used ones are
+# deleted above PDF_CACHE_MAX_BYTES (see the pdf_cache command)
+PDF_CACHE_DIR = os.path.join(BASE_DIR, 'pdf_cache')
+PDF_CACHE_MAX_BYTES = 500 * 1024 * 1024